@@ -0,0 +1,52 @@
+# alembic/env.py
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.database import models  # noqa: F401  registra le tabelle su Base.metadata
+from app.database.base import Base
+from app.database.session import DATABASE_URL, engine
+
+config = context.config
+
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def _configure(**kwargs):
+    context.configure(
+        target_metadata=target_metadata,
+        render_as_batch=True,  # SQLite: ALTER TABLE limitato, serve il batch mode
+        compare_type=True,
+        **kwargs,
+    )
+
+
+def run_migrations_offline() -> None:
+    _configure(url=DATABASE_URL.render_as_string(hide_password=False), literal_binds=True,
+               dialect_opts={"paramstyle": "named"})
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    # connessione passata da app.database.migrations, altrimenti l'engine dell'app
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _configure(connection=connection)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    with engine.connect() as connection:
+        _configure(connection=connection)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,106 @@
+"""schema iniziale
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 09:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ruolo_enum = sa.Enum("dipendente", "manager", "admin", name="ruoloenum")
+stato_enum = sa.Enum("inviata", "approvata", "rifiutata", "completata", name="statotrasfertaenum")
+mezzo_enum = sa.Enum("aereo", "treno", "auto", "altro", name="tipomezzoenum")
+
+
+def upgrade() -> None:
+    op.create_table(
+        "dipendenti",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("nome", sa.String(), nullable=False),
+        sa.Column("cognome", sa.String(), nullable=False),
+        sa.Column("email", sa.String(), nullable=False, unique=True),
+        sa.Column("telefono", sa.String(), nullable=True),
+        sa.Column("area_lavoro", sa.String(), nullable=True),
+        sa.Column("ruolo", ruolo_enum, nullable=True),
+        sa.Column("password", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_dipendenti_id", "dipendenti", ["id"])
+
+    op.create_table(
+        "trasferte",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("id_dipendente", sa.Integer(), sa.ForeignKey("dipendenti.id"), nullable=True),
+        sa.Column("data_partenza", sa.Date(), nullable=False),
+        sa.Column("data_rientro", sa.Date(), nullable=False),
+        sa.Column("luogo_destinazione", sa.String(), nullable=False),
+        sa.Column("luogo_extra", sa.String(), nullable=True),
+        sa.Column("tipo_commessa", sa.String(), nullable=True),
+        sa.Column("stato", stato_enum, nullable=True),
+        sa.Column("note_dipendente", sa.String(), nullable=True),
+        sa.Column("note_segreteria", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_trasferte_id", "trasferte", ["id"])
+
+    op.create_table(
+        "spese",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("id_trasferta", sa.Integer(), sa.ForeignKey("trasferte.id"), nullable=True),
+        sa.Column("categoria", sa.String(), nullable=False),
+        sa.Column("importo", sa.Float(), nullable=False),
+        sa.Column("valuta", sa.String(), nullable=True),
+        sa.Column("tipo_scontrino", sa.String(), nullable=False),
+        sa.Column("file_scontrino", sa.String(), nullable=True),
+        sa.Column("data_spesa", sa.Date(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_spese_id", "spese", ["id"])
+
+    op.create_table(
+        "spesa_files",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("id_spesa", sa.Integer(), sa.ForeignKey("spese.id"), nullable=False),
+        sa.Column("filename", sa.String(), nullable=False),
+        sa.Column("mimetype", sa.String(), nullable=True),
+        sa.Column("data", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_spesa_files_id", "spesa_files", ["id"])
+
+    op.create_table(
+        "prenotazioni",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("id_trasferta", sa.Integer(), sa.ForeignKey("trasferte.id"), nullable=True),
+        sa.Column("tipo_mezzo", mezzo_enum, nullable=False),
+        sa.Column("fornitore", sa.String(), nullable=True),
+        sa.Column("costo", sa.Float(), nullable=True),
+        sa.Column("dettagli", sa.String(), nullable=True),
+        sa.Column("file_biglietto", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_prenotazioni_id", "prenotazioni", ["id"])
+
+
+def downgrade() -> None:
+    op.drop_table("prenotazioni")
+    op.drop_table("spesa_files")
+    op.drop_table("spese")
+    op.drop_table("trasferte")
+    op.drop_table("dipendenti")
+    for enum in (mezzo_enum, stato_enum, ruolo_enum):
+        enum.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,100 @@
+"""allegati spostati da spesa_files.data all'archivio allegati
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:10:00
+
+"""
+import base64
+import hashlib
+import os
+import tempfile
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 100
+
+# copia congelata dell'archivio locale di app.storage com'era in questa
+# revisione (stesso layout <root>/ab/cd/abcd...): la migrazione non deve
+# cambiare comportamento se cambia il codice dell'app
+ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", "uploads/spese")
+
+
+def _blob_path(digest: str) -> str:
+    return os.path.join(ATTACHMENTS_DIR, digest[:2], digest[2:4], digest)
+
+
+def _put(content: bytes) -> str:
+    digest = hashlib.sha256(content).hexdigest()
+    dest = _blob_path(digest)
+    if not os.path.exists(dest):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=ATTACHMENTS_DIR, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(content)
+        os.replace(tmp_path, dest)
+    return digest
+
+
+def _read(digest: str) -> bytes:
+    with open(_blob_path(digest), "rb") as fh:
+        return fh.read()
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    # sha256/size possono esistere già se la vecchia migrazione all'avvio si era interrotta a metà
+    columns = {c["name"] for c in sa.inspect(conn).get_columns("spesa_files")}
+    with op.batch_alter_table("spesa_files") as batch:
+        if "sha256" not in columns:
+            batch.add_column(sa.Column("sha256", sa.String(64), nullable=True))
+        if "size" not in columns:
+            batch.add_column(sa.Column("size", sa.Integer(), nullable=False, server_default="0"))
+
+    # a lotti, per non caricare in memoria tutti gli allegati insieme
+    while True:
+        rows = conn.execute(
+            sa.text("SELECT id, data FROM spesa_files WHERE sha256 IS NULL LIMIT :n"),
+            {"n": BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            content = base64.b64decode(row.data or "")
+            conn.execute(
+                sa.text("UPDATE spesa_files SET sha256 = :sha256, size = :size WHERE id = :id"),
+                {"sha256": _put(content), "size": len(content), "id": row.id},
+            )
+
+    with op.batch_alter_table("spesa_files") as batch:
+        batch.alter_column("sha256", existing_type=sa.String(64), nullable=False)
+        batch.drop_column("data")
+        batch.create_index("ix_spesa_files_sha256", ["sha256"])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("spesa_files") as batch:
+        batch.add_column(sa.Column("data", sa.String(), nullable=True))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.text("SELECT id, sha256 FROM spesa_files")).all()
+    for row in rows:
+        conn.execute(
+            sa.text("UPDATE spesa_files SET data = :data WHERE id = :id"),
+            {"data": base64.b64encode(_read(row.sha256)).decode("utf-8"), "id": row.id},
+        )
+
+    with op.batch_alter_table("spesa_files") as batch:
+        batch.drop_index("ix_spesa_files_sha256")
+        batch.drop_column("size")
+        batch.drop_column("sha256")
+        batch.alter_column("data", existing_type=sa.String(), nullable=False)
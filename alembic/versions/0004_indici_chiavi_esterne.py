@@ -0,0 +1,40 @@
+"""indici su chiavi esterne, stato e date
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 09:30:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    # "le mie trasferte" (filtro per dipendente, ordinate/filtrate per partenza)
+    ("ix_trasferte_dipendente_partenza", "trasferte", ["id_dipendente", "data_partenza"]),
+    # coda approvazioni: stato + ordine di arrivo
+    ("ix_trasferte_stato_created", "trasferte", ["stato", "created_at"]),
+    # paginazione keyset delle liste complete
+    ("ix_trasferte_created", "trasferte", ["created_at", "id"]),
+    ("ix_spese_trasferta_data", "spese", ["id_trasferta", "data_spesa"]),
+    ("ix_spese_created", "spese", ["created_at", "id"]),
+    ("ix_spesa_files_id_spesa", "spesa_files", ["id_spesa"]),
+    ("ix_prenotazioni_id_trasferta", "prenotazioni", ["id_trasferta"]),
+]
+
+
+def upgrade() -> None:
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
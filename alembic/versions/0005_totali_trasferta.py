@@ -0,0 +1,47 @@
+"""totali di rimborso per trasferta, per valuta e categoria
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 10:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "totali_trasferta",
+        sa.Column("id_trasferta", sa.Integer(), sa.ForeignKey("trasferte.id"), primary_key=True),
+        sa.Column("voce", sa.String(16), primary_key=True),
+        sa.Column("valuta", sa.String(16), primary_key=True),
+        sa.Column("categoria", sa.String(255), primary_key=True),
+        sa.Column("totale", sa.Float(), nullable=False),
+        sa.Column("n_voci", sa.Integer(), nullable=False),
+    )
+    # stesso calcolo di app.database.totals.rebuild, sui dati già presenti
+    op.execute(
+        "INSERT INTO totali_trasferta (id_trasferta, voce, valuta, categoria, totale, n_voci) "
+        "SELECT id_trasferta, 'spesa', COALESCE(valuta, 'EUR'), categoria, SUM(importo), COUNT(*) "
+        "FROM spese WHERE id_trasferta IS NOT NULL "
+        "GROUP BY id_trasferta, COALESCE(valuta, 'EUR'), categoria"
+    )
+    op.execute(
+        "INSERT INTO totali_trasferta (id_trasferta, voce, valuta, categoria, totale, n_voci) "
+        "SELECT id_trasferta, 'prenotazione', 'EUR', tipo_mezzo, SUM(COALESCE(costo, 0)), COUNT(*) "
+        "FROM prenotazioni WHERE id_trasferta IS NOT NULL "
+        "GROUP BY id_trasferta, tipo_mezzo"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("totali_trasferta")
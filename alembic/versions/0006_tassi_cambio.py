@@ -0,0 +1,32 @@
+"""tabella tassi di cambio
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 11:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tassi_cambio",
+        sa.Column("valuta", sa.String(16), primary_key=True),
+        sa.Column("data", sa.Date(), primary_key=True),
+        sa.Column("tasso", sa.Float(), nullable=False),
+        sa.Column("importato_il", sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("tassi_cambio")
@@ -0,0 +1,102 @@
+"""rollup mensile delle spese per le dashboard
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 12:00:00
+
+"""
+import math
+from collections import defaultdict
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# copia congelata di app.database.rollup com'era in questa revisione: la
+# migrazione non deve cambiare comportamento se cambia il codice dell'app
+BUCKET_MIN = 0.01
+BUCKET_RATIO = 2 ** 0.25
+VALUTA_DEFAULT = "EUR"
+INSERT_BATCH = 1000
+
+KEY_COLUMNS = ("mese", "id_dipendente", "categoria", "luogo_destinazione", "valuta")
+
+
+def _key_columns():
+    return [
+        sa.Column("mese", sa.Date(), primary_key=True),
+        sa.Column("id_dipendente", sa.Integer(), sa.ForeignKey("dipendenti.id"), primary_key=True),
+        sa.Column("categoria", sa.String(255), primary_key=True),
+        sa.Column("luogo_destinazione", sa.String(255), primary_key=True),
+        sa.Column("valuta", sa.String(16), primary_key=True),
+    ]
+
+
+def _bucket(importo) -> int:
+    if importo is None or importo <= BUCKET_MIN:
+        return 0
+    return 1 + int(math.log(importo / BUCKET_MIN, BUCKET_RATIO))
+
+
+def _insert(conn, table, rows) -> None:
+    for i in range(0, len(rows), INSERT_BATCH):
+        conn.execute(table.insert(), rows[i:i + INSERT_BATCH])
+
+
+def _backfill(conn, rollup, buckets) -> None:
+    # spese uguali raggruppate nel DB, bucket in Python; un dipendente alla volta
+    # (le chiavi del rollup lo contengono), così in memoria c'è solo il suo
+    rows = conn.execute(sa.text(
+        "SELECT t.id_dipendente, t.luogo_destinazione, s.data_spesa, s.categoria, s.valuta, s.importo, "
+        "COUNT(*) AS n "
+        "FROM spese s JOIN trasferte t ON s.id_trasferta = t.id "
+        "WHERE t.id_dipendente IS NOT NULL AND s.data_spesa IS NOT NULL "
+        "GROUP BY t.id_dipendente, t.luogo_destinazione, s.data_spesa, s.categoria, s.valuta, s.importo "
+        "ORDER BY t.id_dipendente"
+    ).columns(data_spesa=sa.Date()))
+
+    def flush(totals, hist):
+        _insert(conn, rollup, [{**dict(zip(KEY_COLUMNS, k)), "totale": v[0], "n_voci": v[1]}
+                               for k, v in totals.items()])
+        _insert(conn, buckets, [{**dict(zip(KEY_COLUMNS + ("bucket",), k)), "n_voci": n}
+                                for k, n in hist.items()])
+
+    corrente, totals, hist = None, defaultdict(lambda: [0.0, 0]), defaultdict(int)
+    for id_dipendente, luogo, data_spesa, categoria, valuta, importo, n in rows:
+        if id_dipendente != corrente:
+            flush(totals, hist)
+            corrente, totals, hist = id_dipendente, defaultdict(lambda: [0.0, 0]), defaultdict(int)
+        importo = importo or 0.0
+        key = (data_spesa.replace(day=1), id_dipendente, categoria, luogo, valuta or VALUTA_DEFAULT)
+        totals[key][0] += importo * n
+        totals[key][1] += n
+        hist[key + (_bucket(importo),)] += n
+    flush(totals, hist)
+
+
+def upgrade() -> None:
+    rollup = op.create_table(
+        "spese_rollup",
+        *_key_columns(),
+        sa.Column("totale", sa.Float(), nullable=False),
+        sa.Column("n_voci", sa.Integer(), nullable=False),
+    )
+    buckets = op.create_table(
+        "spese_rollup_bucket",
+        *_key_columns(),
+        sa.Column("bucket", sa.Integer(), primary_key=True),
+        sa.Column("n_voci", sa.Integer(), nullable=False),
+    )
+    _backfill(op.get_bind(), rollup, buckets)
+
+
+def downgrade() -> None:
+    op.drop_table("spese_rollup_bucket")
+    op.drop_table("spese_rollup")
@@ -0,0 +1,31 @@
+"""indice (id_dipendente, data_partenza, data_rientro) per le sovrapposizioni
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 15:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # sostituisce ix_trasferte_dipendente_partenza (0004), che ne è un prefisso:
+    # con data_rientro nell'indice il controllo sovrapposizioni non legge la tabella
+    op.create_index("ix_trasferte_dipendente_periodo", "trasferte",
+                    ["id_dipendente", "data_partenza", "data_rientro"], if_not_exists=True)
+    op.drop_index("ix_trasferte_dipendente_partenza", table_name="trasferte", if_exists=True)
+
+
+def downgrade() -> None:
+    op.create_index("ix_trasferte_dipendente_partenza", "trasferte",
+                    ["id_dipendente", "data_partenza"], if_not_exists=True)
+    op.drop_index("ix_trasferte_dipendente_periodo", table_name="trasferte", if_exists=True)
@@ -0,0 +1,28 @@
+"""indice (stato, data_rientro, data_partenza) per l'occupazione per intervallo
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 16:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009"
+down_revision: Union[str, None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # trasferte approvate che toccano [dal, al]: seek su stato, range su data_rientro >= dal,
+    # data_partenza <= al verificata sull'indice senza leggere la tabella
+    op.create_index("ix_trasferte_stato_rientro", "trasferte",
+                    ["stato", "data_rientro", "data_partenza"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_trasferte_stato_rientro", table_name="trasferte", if_exists=True)
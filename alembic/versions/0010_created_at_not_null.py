@@ -0,0 +1,42 @@
+"""created_at NOT NULL sulle tabelle paginate per (created_at, id)
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 18:00:00
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0010"
+down_revision: Union[str, None] = "0009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# il cursore di app.pagination non può rappresentare NULL e il confronto
+# (created_at, id) < cursore li escluderebbe: le righe senza data prendono
+# updated_at o, in mancanza, l'epoca (in fondo all'ordinamento decrescente)
+TABLES = ("dipendenti", "trasferte", "spese", "prenotazioni")
+EPOCH = datetime(1970, 1, 1)
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    for table in TABLES:
+        conn.execute(
+            sa.text(f"UPDATE {table} SET created_at = COALESCE(updated_at, :epoch) WHERE created_at IS NULL"),
+            {"epoch": EPOCH},
+        )
+        with op.batch_alter_table(table) as batch:
+            batch.alter_column("created_at", existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch:
+            batch.alter_column("created_at", existing_type=sa.DateTime(), nullable=True)
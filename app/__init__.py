@@ -0,0 +1,4 @@
+# carica .env prima che i moduli dell'app leggano la configurazione da os.environ
+from dotenv import load_dotenv
+
+load_dotenv()
@@ -1,74 +1,121 @@
+from sqlalchemy import insert, update
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from typing import List, Optional
-from datetime import date
-import base64
+from starlette.concurrency import run_in_threadpool
 
 from app.database import models, schemas
+from app.storage import CHUNK_SIZE, UPLOAD_MAX_FILE_SIZE, UploadTooLarge, get_attachment_store
 
 # ------------------------
-# Spesa + SpesaFile CRUD
+# Spesa + SpesaFile: parti comuni
+# (le query sulle spese sono in crud_async, usate dagli endpoint async def)
 # ------------------------
-def create_spesa(db: Session, spesa_in: schemas.SpesaCreate, creator_id: int, files_data: Optional[List[dict]] = None) -> models.Spesa:
-    """
-    files_data: list of dict { filename, mimetype, data_base64 }
-    """
-    spesa = models.Spesa(
+def new_spesa(spesa_in: schemas.SpesaCreate) -> models.Spesa:
+    """Spesa ancora da aggiungere alla sessione; gli allegati vanno con insert_spesa_files dopo il flush."""
+    return models.Spesa(
         id_trasferta=spesa_in.id_trasferta,
         categoria=spesa_in.categoria,
         importo=spesa_in.importo,
         valuta=spesa_in.valuta,
         tipo_scontrino=spesa_in.tipo_scontrino,
         file_scontrino=None,
-        data_spesa=spesa_in.data_spesa
+        data_spesa=spesa_in.data_spesa,
     )
-    db.add(spesa)
-    db.commit()
-    db.refresh(spesa)
-
-    # create SpesaFile records if present
-    if files_data:
-        for f in files_data:
-            file_rec = models.SpesaFile(
-                id_spesa=spesa.id,
-                filename=f["filename"],
-                mimetype=f.get("mimetype"),
-                data=f["data"]  # already base64 string
-            )
-            db.add(file_rec)
-        db.commit()
-    db.refresh(spesa)
-    return spesa
 
-def get_spesa(db: Session, spesa_id: int) -> Optional[models.Spesa]:
-    return db.query(models.Spesa).filter(models.Spesa.id == spesa_id).first()
-
-def list_spese_by_user(db: Session, user_id: int) -> List[models.Spesa]:
-    # ritorna tutte le spese appartenenti alle trasferte del dipendente
-    return db.query(models.Spesa).join(models.Trasferta).filter(models.Trasferta.id_dipendente == user_id).all()
-
-def list_all_spese(db: Session) -> List[models.Spesa]:
-    return db.query(models.Spesa).all()
+def insert_spesa_files(db: Session, spesa: models.Spesa, files_data: Optional[List[dict]] = None) -> None:
+    """
+    Allegati di una spesa già inserita (flush fatto, id noto), in blocco e
+    nella stessa transazione: un solo INSERT a più righe ... RETURNING
+    (insertmanyvalues). Dove RETURNING non c'è (MySQL) un executemany e una
+    SELECT per id_spesa. Gli oggetti finiscono in spesa.files senza
+    rileggere la relazione.
+    """
+    rows = [
+        {"id_spesa": spesa.id, "filename": f["filename"], "mimetype": f.get("mimetype"),
+         "sha256": f["sha256"], "size": f["size"]}
+        for f in files_data or []
+    ]
+    files = []
+    if rows and db.get_bind().dialect.insert_executemany_returning:
+        files = sorted(db.scalars(insert(models.SpesaFile).returning(models.SpesaFile), rows), key=lambda f: f.id)
+    elif rows:
+        db.execute(insert(models.SpesaFile), rows)
+        files = (db.query(models.SpesaFile).filter(models.SpesaFile.id_spesa == spesa.id)
+                 .order_by(models.SpesaFile.id).all())
+    set_committed_value(spesa, "files", files)
 
-def get_spesa_file(db: Session, file_id: int) -> Optional[models.SpesaFile]:
-    return db.query(models.SpesaFile).filter(models.SpesaFile.id == file_id).first()
+# ------------------------
+# Trasferte: cambio di stato in blocco
+# ------------------------
+def transizione_trasferte(db: Session, ids: List[int], stato: models.StatoTrasfertaEnum,
+                          note_segreteria: Optional[str] = None) -> schemas.TrasfertaStatoBatchReport:
+    """
+    Porta le trasferte ids nello stato richiesto, se la transizione è ammessa
+    (models.TRANSIZIONI_TRASFERTA), con un solo UPDATE in un'unica transazione.
+    Il filtro sullo stato di partenza è nell'UPDATE stesso: una trasferta
+    cambiata nel frattempo da un'altra richiesta non viene toccata.
+    Gli id aggiornati arrivano da UPDATE ... RETURNING dove il dialetto lo
+    supporta (SQLite, PostgreSQL); su MySQL/MariaDB si rileggono id e stato
+    nella stessa transazione.
+    """
+    t = models.Trasferta
+    sorgenti = [da for da, verso in models.TRANSIZIONI_TRASFERTA.items() if stato in verso]
+    prima = dict(db.query(t.id, t.stato).filter(t.id.in_(ids)).all())
 
-def delete_spesa_file(db: Session, file_id: int) -> bool:
-    file_rec = db.query(models.SpesaFile).filter(models.SpesaFile.id == file_id).first()
-    if not file_rec:
-        return False
-    db.delete(file_rec)
+    aggiornate = set()
+    if sorgenti:
+        values = {"stato": stato}
+        if note_segreteria:
+            values["note_segreteria"] = note_segreteria
+        stmt = update(t).where(t.id.in_(ids), t.stato.in_(sorgenti)).values(**values)
+        options = {"synchronize_session": False}
+        if db.get_bind().dialect.update_returning:
+            aggiornate = set(db.execute(stmt.returning(t.id), execution_options=options).scalars())
+        else:
+            db.execute(stmt, execution_options=options)
+            dopo = db.query(t.id, t.stato).filter(t.id.in_(ids)).all()
+            aggiornate = {id_ for id_, stato_ora in dopo if stato_ora == stato and prima.get(id_) in sorgenti}
     db.commit()
-    return True
 
-# Utility helper: convert UploadFile bytes -> base64 dict
-def file_to_base64_dict(uploaded_file) -> dict:
+    risultati = []
+    for id_ in ids:
+        if id_ in aggiornate:
+            risultati.append(schemas.TrasfertaStatoEsito(id=id_, esito="aggiornata", stato=stato))
+        elif id_ not in prima:
+            risultati.append(schemas.TrasfertaStatoEsito(id=id_, esito="non_trovata"))
+        else:
+            esito = "invariata" if prima[id_] == stato else "non_consentita"
+            risultati.append(schemas.TrasfertaStatoEsito(id=id_, esito=esito, stato=prima[id_]))
+    return schemas.TrasfertaStatoBatchReport(aggiornate=len(aggiornate), risultati=risultati)
+
+# Utility helper: UploadFile -> archivio allegati, a blocchi
+async def store_upload(uploaded_file, max_size: int = UPLOAD_MAX_FILE_SIZE, chunk_size: int = CHUNK_SIZE) -> dict:
     """
     uploaded_file is a starlette UploadFile
-    returns dict: { filename, mimetype, data }
+    Legge il file a blocchi di chunk_size byte, calcolando l'hash e scrivendo
+    nell'archivio man mano: la memoria usata non dipende dalla dimensione del file.
+    Solleva UploadTooLarge oltre max_size byte (senza lasciare file parziali).
+    returns dict: { filename, mimetype, sha256, size, created }
     """
-    content = uploaded_file.file.read()
-    if isinstance(content, str):
-        # ensure bytes
-        content = content.encode("utf-8")
-    b64 = base64.b64encode(content).decode("utf-8")
-    return {"filename": uploaded_file.filename, "mimetype": uploaded_file.content_type, "data": b64}
+    declared = getattr(uploaded_file, "size", None)
+    if declared is not None and declared > max_size:
+        raise UploadTooLarge(f"Il file {uploaded_file.filename} supera {max_size} byte")
+
+    with get_attachment_store().writer() as writer:
+        while True:
+            chunk = await uploaded_file.read(chunk_size)
+            if not chunk:
+                break
+            if writer.size + len(chunk) > max_size:
+                raise UploadTooLarge(f"Il file {uploaded_file.filename} supera {max_size} byte")
+            await run_in_threadpool(writer.write, chunk)
+        digest = await run_in_threadpool(writer.commit)
+
+    return {
+        "filename": uploaded_file.filename,
+        "mimetype": uploaded_file.content_type,
+        "sha256": digest,
+        "size": writer.size,
+        "created": writer.created,
+    }
@@ -0,0 +1,115 @@
+# app/database/crud_async.py
+# Spese e allegati su AsyncSession, per gli endpoint async def: nessuna
+# chiamata blocca l'event loop. Le parti comuni restano in crud.py.
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
+
+from app.database import crud, models, schemas
+from app.filters import SpeseFilter
+from app.pagination import PageParams, paginate_async
+from app.storage import get_attachment_store
+
+# ------------------------
+# Spesa + SpesaFile CRUD
+# ------------------------
+async def create_spesa(db: AsyncSession, spesa_in: schemas.SpesaCreate, creator_id: int,
+                       files_data: Optional[List[dict]] = None) -> models.Spesa:
+    """
+    files_data: list of dict { filename, mimetype, sha256, size }
+    (vedi crud.store_upload: il contenuto è già nell'archivio allegati)
+    Spesa e allegati (in blocco, vedi crud.insert_spesa_files) in un'unica
+    transazione con un solo commit; la risposta
+    si costruisce dagli oggetti in memoria (expire_on_commit=False), senza
+    rileggerli.
+    """
+    spesa = crud.new_spesa(spesa_in)
+    db.add(spesa)
+    await db.flush()
+    await db.run_sync(crud.insert_spesa_files, spesa, files_data)
+    await db.commit()
+    return spesa
+
+async def get_spesa(db: AsyncSession, spesa_id: int) -> Optional[models.Spesa]:
+    stmt = (
+        select(models.Spesa)
+        .options(selectinload(models.Spesa.files))
+        .filter(models.Spesa.id == spesa_id)
+        .execution_options(populate_existing=True)
+    )
+    return (await db.execute(stmt)).scalars().first()
+
+def _spese_select(columns=None):
+    # colonne: righe come tuple per le liste serializzate senza Pydantic (vedi app/serialization.py)
+    if columns is not None:
+        return select(*columns)
+    return select(models.Spesa).options(selectinload(models.Spesa.files))
+
+async def list_spese_by_user(db: AsyncSession, user_id: int, filters: Optional[SpeseFilter] = None,
+                             page: Optional[PageParams] = None, columns=None) -> list:
+    stmt = (
+        _spese_select(columns)
+        .join(models.Trasferta, models.Spesa.id_trasferta == models.Trasferta.id)
+        .filter(models.Trasferta.id_dipendente == user_id)
+    )
+    if filters:
+        stmt = filters.apply(stmt)
+    return await paginate_async(db, stmt, models.Spesa, page, scalars=columns is None)
+
+async def list_all_spese(db: AsyncSession, filters: Optional[SpeseFilter] = None, id_dipendente: Optional[int] = None,
+                         page: Optional[PageParams] = None, columns=None) -> list:
+    stmt = _spese_select(columns)
+    if id_dipendente is not None or (filters and filters.needs_trasferta):
+        stmt = stmt.join(models.Trasferta, models.Spesa.id_trasferta == models.Trasferta.id)
+    if id_dipendente is not None:
+        stmt = stmt.filter(models.Trasferta.id_dipendente == id_dipendente)
+    if filters:
+        stmt = filters.apply(stmt)
+    return await paginate_async(db, stmt, models.Spesa, page, scalars=columns is None)
+
+async def list_files_of_spese(db: AsyncSession, spesa_ids: List[int], columns) -> list:
+    """Allegati di più spese in una query, come righe (*columns, id_spesa)."""
+    if not spesa_ids:
+        return []
+    stmt = (
+        select(*columns, models.SpesaFile.id_spesa)
+        .filter(models.SpesaFile.id_spesa.in_(spesa_ids))
+        .order_by(models.SpesaFile.id)
+    )
+    return (await db.execute(stmt)).all()
+
+async def get_trasferta_of_user(db: AsyncSession, trasferta_id: int, user_id: int) -> Optional[models.Trasferta]:
+    stmt = select(models.Trasferta).filter(
+        models.Trasferta.id == trasferta_id,
+        models.Trasferta.id_dipendente == user_id
+    )
+    return (await db.execute(stmt)).scalars().first()
+
+async def get_spesa_file_with_owner(db: AsyncSession, file_id: int) -> Optional[Tuple[models.SpesaFile, int]]:
+    # file + id_dipendente proprietario della trasferta, in una sola query
+    stmt = (
+        select(models.SpesaFile, models.Trasferta.id_dipendente)
+        .join(models.Spesa, models.SpesaFile.id_spesa == models.Spesa.id)
+        .join(models.Trasferta, models.Spesa.id_trasferta == models.Trasferta.id)
+        .filter(models.SpesaFile.id == file_id)
+    )
+    return (await db.execute(stmt)).first()
+
+async def delete_spesa_file(db: AsyncSession, file_id: int) -> bool:
+    file_rec = await db.get(models.SpesaFile, file_id)
+    if not file_rec:
+        return False
+    digest = file_rec.sha256
+    await db.delete(file_rec)
+    await db.flush()
+    # il blob è condiviso tra righe con lo stesso contenuto: lo eliminiamo solo se orfano
+    still_used = (await db.execute(
+        select(models.SpesaFile.id).filter(models.SpesaFile.sha256 == digest).limit(1)
+    )).first()
+    await db.commit()
+    if not still_used:
+        await run_in_threadpool(get_attachment_store().delete, digest)
+    return True
@@ -0,0 +1,181 @@
+# app/database/import_spese.py
+"""
+Import in blocco di spese da CSV o JSONL (es. estratti conto delle carte).
+
+Il file viene letto riga per riga, ogni riga validata con schemas.SpesaCreate
+e controllata contro l'insieme delle trasferte ammesse, letto una volta
+sola all'inizio. Le righe valide vengono inserite a lotti di
+IMPORT_BATCH_SIZE con un INSERT executemany, una transazione per lotto;
+nella stessa transazione si aggiornano i totali per trasferta e il rollup
+(l'INSERT in blocco non passa dall'ORM, vedi totals.spese_deltas e
+rollup.apply_spese).
+
+Formato: colonne/chiavi come SpesaCreate
+    id_trasferta,categoria,importo,valuta,tipo_scontrino,data_spesa
+(valuta e tipo_scontrino facoltativi: EUR e "altro").
+
+Uso:
+    python -m app.database.import_spese estratto.csv --user 12
+    python -m app.database.import_spese estratto.jsonl   # qualsiasi trasferta (back-office)
+"""
+import argparse
+import csv
+import io
+import json
+import os
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.database import models, rollup, schemas, session, totals
+
+# ======================================
+# CONFIG
+# ======================================
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", 1000))  # errori riportati nel dettaglio
+
+_FIELDS = ("id_trasferta", "categoria", "importo", "valuta", "tipo_scontrino", "data_spesa")
+
+
+# ======================================
+# LETTURA RIGA PER RIGA
+# ======================================
+def _is_jsonl(filename: str) -> bool:
+    return filename.lower().endswith((".jsonl", ".ndjson", ".json"))
+
+
+def iter_rows(stream: BinaryIO, filename: str = "") -> Iterator[Tuple[int, Union[dict, str]]]:
+    """(numero riga, dati) oppure (numero riga, messaggio d'errore) se la riga non si legge."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        yield from _iter_text_rows(text, filename)
+    finally:
+        text.detach()  # lo stream resta del chiamante
+
+
+def _iter_text_rows(text: io.TextIOWrapper, filename: str) -> Iterator[Tuple[int, Union[dict, str]]]:
+    if _is_jsonl(filename):
+        for n, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as exc:
+                yield n, f"JSON non valido: {exc}"
+                continue
+            yield n, data if isinstance(data, dict) else "attesa un oggetto JSON per riga"
+    else:
+        reader = csv.DictReader(text)
+        for row in reader:
+            # riga 1 = intestazione
+            yield reader.line_num, {k: v for k, v in row.items() if k is not None and v not in (None, "")}
+
+
+def _validate(data: dict) -> schemas.SpesaCreate:
+    data = {k: data[k] for k in _FIELDS if k in data}
+    data.setdefault("tipo_scontrino", "altro")
+    return schemas.SpesaCreate(**data)
+
+
+def _error_message(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in exc.errors())
+
+
+# ======================================
+# IMPORT
+# ======================================
+class ImportReport:
+    def __init__(self):
+        self.righe = 0
+        self.importate = 0
+        self.n_errori = 0
+        self.errori: List[dict] = []
+
+    def error(self, riga: int, errore: str) -> None:
+        self.n_errori += 1
+        if len(self.errori) < IMPORT_MAX_ERRORS:
+            self.errori.append({"riga": riga, "errore": errore})
+
+    def dict(self) -> dict:
+        return {"righe": self.righe, "importate": self.importate, "n_errori": self.n_errori, "errori": self.errori}
+
+
+def _allowed_trasferte(engine: Engine, user_id: Optional[int]) -> Dict[int, Tuple[Optional[int], str]]:
+    """id_trasferta -> (id_dipendente, destinazione): controllo proprietà e chiavi del rollup."""
+    t = models.Trasferta
+    query = select(t.id, t.id_dipendente, t.luogo_destinazione)
+    if user_id is not None:
+        query = query.where(t.id_dipendente == user_id)
+    with engine.connect() as conn:
+        return {r.id: (r.id_dipendente, r.luogo_destinazione) for r in conn.execute(query)}
+
+
+def _insert_batch(engine: Engine, batch: List[Tuple[int, dict]], allowed: Dict[int, Tuple[Optional[int], str]],
+                  report: ImportReport) -> None:
+    rows = [row for _, row in batch]
+    try:
+        with engine.begin() as conn:
+            conn.execute(models.Spesa.__table__.insert(), rows)
+            totals.apply_deltas(conn, totals.spese_deltas(rows))
+            rollup.apply_spese(conn, rows, allowed)
+    except SQLAlchemyError as exc:
+        for n, _ in batch:
+            report.error(n, f"lotto non inserito: {exc.__class__.__name__}")
+        return
+    report.importate += len(rows)
+
+
+def import_spese(stream: BinaryIO, filename: str = "", user_id: Optional[int] = None,
+                 engine: Engine = None, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    user_id: se indicato, sono ammesse solo le trasferte di quel dipendente.
+    Ritorna il report {righe, importate, n_errori, errori: [{riga, errore}]}.
+    """
+    engine = engine or session.engine
+    allowed = _allowed_trasferte(engine, user_id)
+    report = ImportReport()
+    batch: List[Tuple[int, dict]] = []
+
+    for n, data in iter_rows(stream, filename):
+        report.righe += 1
+        if isinstance(data, str):
+            report.error(n, data)
+            continue
+        try:
+            spesa = _validate(data)
+        except ValidationError as exc:
+            report.error(n, _error_message(exc))
+            continue
+        if spesa.id_trasferta not in allowed:
+            report.error(n, f"trasferta {spesa.id_trasferta} inesistente o non del dipendente")
+            continue
+        batch.append((n, {**spesa.dict(), "file_scontrino": None}))
+        if len(batch) >= batch_size:
+            _insert_batch(engine, batch, allowed, report)
+            batch = []
+
+    if batch:
+        _insert_batch(engine, batch, allowed, report)
+    return report.dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import in blocco di spese da CSV o JSONL")
+    parser.add_argument("file")
+    parser.add_argument("--user", type=int, default=None, help="ammetti solo le trasferte di questo dipendente")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    with open(args.file, "rb") as f:
+        report = import_spese(f, args.file, user_id=args.user, batch_size=args.batch_size)
+    for err in report["errori"]:
+        print(f"riga {err['riga']}: {err['errore']}")
+    print(f"{report['importate']}/{report['righe']} righe importate, {report['n_errori']} errori")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# app/database/migrations.py
+"""
+Aggiornamento dello schema tramite Alembic (alembic/versions).
+
+I database creati prima di Alembic non hanno la tabella alembic_version:
+la revisione di partenza viene riconosciuta dalle colonne presenti e
+registrata con stamp, poi si applicano le revisioni mancanti.
+
+In produzione conviene eseguire le migrazioni a mano prima del deploy:
+    alembic upgrade head
+e avviare l'app con DB_AUTO_MIGRATE=0.
+"""
+import os
+from typing import Optional
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection, Engine
+
+from app.database import session
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "alembic.ini")
+
+
+def alembic_config(connection: Optional[Connection] = None) -> Config:
+    config = Config(ALEMBIC_INI)
+    # il logging lo configura già l'applicazione
+    config.attributes["configure_logger"] = False
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def _detect_revision(connection: Connection) -> Optional[str]:
+    """Revisione di un database creato con create_all prima di Alembic (None se vuoto)."""
+    insp = inspect(connection)
+    tables = set(insp.get_table_names())
+    if "alembic_version" in tables or "dipendenti" not in tables:
+        return None
+    if "data" in {c["name"] for c in insp.get_columns("spesa_files")}:
+        return "0001"
+    if "token_version" not in {c["name"] for c in insp.get_columns("dipendenti")}:
+        return "0002"
+    return "0003"
+
+
+def upgrade_database(engine: Engine = None) -> None:
+    engine = engine or session.engine
+    with engine.begin() as connection:
+        config = alembic_config(connection)
+        revision = _detect_revision(connection)
+        if revision is not None:
+            command.stamp(config, revision)
+        command.upgrade(config, "head")
+
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Enum, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database.base import Base
@@ -18,6 +18,14 @@ class StatoTrasfertaEnum(str, enum.Enum):
     rifiutata = "rifiutata"
     completata = "completata"
 
+# cambi di stato ammessi dalle operazioni di segreteria in blocco
+TRANSIZIONI_TRASFERTA = {
+    StatoTrasfertaEnum.inviata: {StatoTrasfertaEnum.approvata, StatoTrasfertaEnum.rifiutata},
+    StatoTrasfertaEnum.approvata: {StatoTrasfertaEnum.rifiutata, StatoTrasfertaEnum.completata},
+    StatoTrasfertaEnum.rifiutata: set(),
+    StatoTrasfertaEnum.completata: set(),
+}
+
 class TipoMezzoEnum(str, enum.Enum):
     aereo = "aereo"
     treno = "treno"
@@ -38,13 +46,21 @@ class Dipendente(Base):
     area_lavoro = Column(String, nullable=True)
     ruolo = Column(Enum(RuoloEnum), default=RuoloEnum.dipendente)
     password = Column(String, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    token_version = Column(Integer, nullable=False, default=0)  # +1 revoca i JWT già emessi
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # chiave del cursore (app.pagination)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     trasferte = relationship("Trasferta", back_populates="dipendente")
 
 class Trasferta(Base):
     __tablename__ = "trasferte"
+    # stessi indici delle migrazioni alembic 0004, 0008 e 0009
+    __table_args__ = (
+        Index("ix_trasferte_dipendente_periodo", "id_dipendente", "data_partenza", "data_rientro"),
+        Index("ix_trasferte_stato_rientro", "stato", "data_rientro", "data_partenza"),
+        Index("ix_trasferte_stato_created", "stato", "created_at"),
+        Index("ix_trasferte_created", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     id_dipendente = Column(Integer, ForeignKey("dipendenti.id"))
@@ -56,7 +72,7 @@ class Trasferta(Base):
     stato = Column(Enum(StatoTrasfertaEnum), default=StatoTrasfertaEnum.inviata)
     note_dipendente = Column(String, nullable=True)
     note_segreteria = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # chiave del cursore (app.pagination)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     dipendente = relationship("Dipendente", back_populates="trasferte")
@@ -65,6 +81,10 @@ class Trasferta(Base):
 
 class Spesa(Base):
     __tablename__ = "spese"
+    __table_args__ = (
+        Index("ix_spese_trasferta_data", "id_trasferta", "data_spesa"),
+        Index("ix_spese_created", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     id_trasferta = Column(Integer, ForeignKey("trasferte.id"))
@@ -74,7 +94,7 @@ class Spesa(Base):
     tipo_scontrino = Column(String, default="altro", nullable=False)  # nuova colonna
     file_scontrino = Column(String, nullable=True)
     data_spesa = Column(Date, nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # chiave del cursore (app.pagination)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     trasferta = relationship("Trasferta", back_populates="spese")
@@ -84,11 +104,12 @@ class SpesaFile(Base):
     __tablename__ = "spesa_files"
 
     id = Column(Integer, primary_key=True, index=True)
-    id_spesa = Column(Integer, ForeignKey("spese.id"), nullable=False)
+    id_spesa = Column(Integer, ForeignKey("spese.id"), nullable=False, index=True)
 
     filename = Column(String, nullable=False)
     mimetype = Column(String, nullable=True)
-    data = Column(String, nullable=False)  # base64 per compatibilità SQLite
+    sha256 = Column(String(64), nullable=False, index=True)  # chiave nell'archivio allegati
+    size = Column(Integer, nullable=False, default=0)
 
     created_at = Column(DateTime, default=datetime.utcnow)
 
@@ -98,13 +119,57 @@ class Prenotazione(Base):
     __tablename__ = "prenotazioni"
 
     id = Column(Integer, primary_key=True, index=True)
-    id_trasferta = Column(Integer, ForeignKey("trasferte.id"))
+    id_trasferta = Column(Integer, ForeignKey("trasferte.id"), index=True)
     tipo_mezzo = Column(Enum(TipoMezzoEnum), nullable=False)
     fornitore = Column(String, nullable=True)
     costo = Column(Float, nullable=True)
     dettagli = Column(String, nullable=True)
     file_biglietto = Column(String, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # chiave del cursore (app.pagination)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     trasferta = relationship("Trasferta", back_populates="prenotazioni")
+
+class TotaleTrasferta(Base):
+    """Totali di rimborso per trasferta, mantenuti da app/database/totals.py."""
+    __tablename__ = "totali_trasferta"
+
+    id_trasferta = Column(Integer, ForeignKey("trasferte.id"), primary_key=True)
+    voce = Column(String(16), primary_key=True)  # "spesa" o "prenotazione"
+    valuta = Column(String(16), primary_key=True)
+    categoria = Column(String(255), primary_key=True)  # per le prenotazioni: tipo_mezzo
+    totale = Column(Float, nullable=False, default=0)
+    n_voci = Column(Integer, nullable=False, default=0)
+
+class TassoCambio(Base):
+    """Tassi di cambio in convenzione BCE (unità di valuta per 1 EUR), vedi app/fx.py."""
+    __tablename__ = "tassi_cambio"
+
+    valuta = Column(String(16), primary_key=True)
+    data = Column(Date, primary_key=True)
+    tasso = Column(Float, nullable=False)
+    importato_il = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class SpesaRollup(Base):
+    """Rollup mensile delle spese per le dashboard, mantenuto da app/database/rollup.py."""
+    __tablename__ = "spese_rollup"
+
+    mese = Column(Date, primary_key=True)  # primo giorno del mese
+    id_dipendente = Column(Integer, ForeignKey("dipendenti.id"), primary_key=True)
+    categoria = Column(String(255), primary_key=True)
+    luogo_destinazione = Column(String(255), primary_key=True)
+    valuta = Column(String(16), primary_key=True)
+    totale = Column(Float, nullable=False, default=0)
+    n_voci = Column(Integer, nullable=False, default=0)
+
+class SpesaRollupBucket(Base):
+    """Istogramma degli importi per ogni riga di spese_rollup (per i percentili)."""
+    __tablename__ = "spese_rollup_bucket"
+
+    mese = Column(Date, primary_key=True)
+    id_dipendente = Column(Integer, ForeignKey("dipendenti.id"), primary_key=True)
+    categoria = Column(String(255), primary_key=True)
+    luogo_destinazione = Column(String(255), primary_key=True)
+    valuta = Column(String(16), primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    n_voci = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,191 @@
+# app/database/periodi.py
+"""
+Periodi di trasferta: sovrapposizioni per dipendente e occupazione
+("chi è in trasferta quando/dove").
+
+Le trasferte non rifiutate di un dipendente non devono sovrapporsi
+(estremi inclusi: chi rientra il 5 non può ripartire il 5). Creazione e
+riattivazione chiamano blocca_dipendente() e poi sovrapposta() nella
+stessa transazione dell'INSERT/UPDATE: due richieste concorrenti per lo
+stesso dipendente vengono serializzate, la seconda vede la trasferta
+della prima. Le sovrapposizioni già nei dati (storico, import, SQL a
+mano) le trova trova_sovrapposizioni(), anche via GET
+/trasferte/sovrapposizioni.
+
+occupazione() risponde alla segreteria viaggi: trasferte approvate che
+toccano un intervallo di date e persone fuori sede giorno per giorno.
+
+Uso:
+    python -m app.database.periodi          # elenca le sovrapposizioni, exit 1 se ce ne sono
+"""
+import argparse
+import heapq
+import sys
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.database import models
+
+# righe lette per volta dal cursore del report
+AUDIT_BATCH = 10_000
+# ampiezza massima dell'intervallo richiesto a occupazione()
+OCCUPAZIONE_MAX_GIORNI = 366
+# trasferte che contano come "fuori sede"
+STATI_OCCUPAZIONE = (models.StatoTrasfertaEnum.approvata, models.StatoTrasfertaEnum.completata)
+
+_t = models.Trasferta
+_ATTIVA = _t.stato != models.StatoTrasfertaEnum.rifiutata
+
+
+class Sovrapposizione(NamedTuple):
+    id_dipendente: int
+    id_trasferta: int
+    id_altra: int
+    dal: date
+    al: date
+
+
+def blocca_dipendente(db: Session, id_dipendente: int) -> None:
+    """
+    Lock sulla riga del dipendente fino alla fine della transazione, da
+    prendere prima di sovrapposta(): SELECT ... FOR UPDATE su PostgreSQL e
+    MySQL. SQLite non ha lock di riga: un UPDATE senza effetti prende subito
+    il lock di scrittura del database e le altre scritture aspettano il
+    commit (fino a SQLITE_BUSY_TIMEOUT_MS). È un UPDATE Core sulla
+    connessione: i listener ORM (response_cache) non lo vedono come una
+    modifica ai dipendenti.
+    """
+    d = models.Dipendente
+    if db.get_bind().dialect.name == "sqlite":
+        table = d.__table__
+        # updated_at esplicito: altrimenti scatterebbe l'onupdate
+        db.connection().execute(update(table).where(table.c.id == id_dipendente)
+                                .values(updated_at=table.c.updated_at))
+    else:
+        db.query(d.id).filter(d.id == id_dipendente).with_for_update().first()
+
+
+def sovrapposta(db: Session, id_dipendente: int, data_partenza: date, data_rientro: date,
+                escludi_id: Optional[int] = None):
+    """
+    Trasferta attiva del dipendente che si sovrappone a [data_partenza, data_rientro]
+    (riga con id, data_partenza, data_rientro), oppure None.
+
+    Se le trasferte attive del dipendente non si sovrappongono tra loro (è
+    quello che garantisce questo controllo), sono ordinate allo stesso modo
+    per partenza e per rientro: l'unica candidata è l'ultima che parte entro
+    data_rientro. È una sola ricerca all'indietro sull'indice
+    (id_dipendente, data_partenza, data_rientro), O(log n).
+    Senza blocca_dipendente() nella stessa transazione il controllo è solo
+    indicativo: un INSERT concorrente può passare tra lettura e scrittura.
+    """
+    query = db.query(_t.id, _t.data_partenza, _t.data_rientro).filter(
+        _t.id_dipendente == id_dipendente, _t.data_partenza <= data_rientro, _ATTIVA)
+    if escludi_id is not None:
+        query = query.filter(_t.id != escludi_id)
+    row = query.order_by(_t.data_partenza.desc()).first()
+    return row if row is not None and row.data_rientro >= data_partenza else None
+
+
+def trova_sovrapposizioni(conn: Connection, id_dipendente: Optional[int] = None) -> Iterator[Sovrapposizione]:
+    """
+    Tutte le coppie di trasferte attive sovrapposte, per dipendente.
+
+    Sweep-line sulle trasferte lette in ordine di indice (dipendente,
+    partenza): per ogni dipendente resta in memoria solo un heap delle
+    trasferte ancora "aperte" (rientro >= partenza corrente).
+    """
+    stmt = (
+        select(_t.id_dipendente, _t.id, _t.data_partenza, _t.data_rientro)
+        .where(_ATTIVA)
+        .order_by(_t.id_dipendente, _t.data_partenza, _t.id)
+    )
+    if id_dipendente is not None:
+        stmt = stmt.where(_t.id_dipendente == id_dipendente)
+
+    corrente = None
+    aperte: List[Tuple[date, int]] = []  # heap di (data_rientro, id)
+    result = conn.execution_options(stream_results=True, yield_per=AUDIT_BATCH).execute(stmt)
+    for dipendente, id_, partenza, rientro in result:
+        if dipendente != corrente:
+            corrente, aperte = dipendente, []
+        while aperte and aperte[0][0] < partenza:
+            heapq.heappop(aperte)
+        for altro_rientro, altro_id in aperte:
+            yield Sovrapposizione(dipendente, altro_id, id_, partenza, min(rientro, altro_rientro))
+        heapq.heappush(aperte, (rientro, id_))
+
+
+def occupazione(db: Session, dal: date, al: date, luogo_destinazione: Optional[str] = None,
+                area_lavoro: Optional[str] = None):
+    """
+    Trasferte approvate (o completate) che toccano [dal, al] e persone in
+    trasferta per ogni giorno dell'intervallo.
+
+    La selezione è una ricerca per intervallo sull'indice
+    (stato, data_rientro, data_partenza): rientro >= dal restringe la
+    scansione, partenza <= al si verifica sull'indice stesso. I conteggi
+    giornalieri sono uno sweep-line: i periodi di ogni dipendente vengono
+    uniti (una persona conta una volta anche con dati sovrapposti) e ogni
+    periodo diventa +1 al primo giorno e -1 il giorno dopo l'ultimo.
+    """
+    d = models.Dipendente
+    query = (
+        db.query(_t.id, _t.id_dipendente, d.nome, d.cognome, d.area_lavoro, _t.luogo_destinazione,
+                 _t.data_partenza, _t.data_rientro, _t.stato)
+        .join(d, d.id == _t.id_dipendente)
+        .filter(_t.stato.in_(STATI_OCCUPAZIONE), _t.data_rientro >= dal, _t.data_partenza <= al)
+    )
+    if luogo_destinazione is not None:
+        query = query.filter(_t.luogo_destinazione == luogo_destinazione)
+    if area_lavoro is not None:
+        query = query.filter(d.area_lavoro == area_lavoro)
+    trasferte = query.order_by(_t.data_partenza, _t.id).all()
+
+    # periodi per dipendente, già in ordine di partenza, ritagliati su [dal, al]
+    periodi: Dict[int, List[List[int]]] = {}
+    primo, ultimo = dal.toordinal(), al.toordinal()
+    for row in trasferte:
+        inizio, fine = max(row.data_partenza.toordinal(), primo), min(row.data_rientro.toordinal(), ultimo)
+        uniti = periodi.setdefault(row.id_dipendente, [])
+        if uniti and inizio <= uniti[-1][1] + 1:
+            uniti[-1][1] = max(uniti[-1][1], fine)
+        else:
+            uniti.append([inizio, fine])
+
+    delta = [0] * (ultimo - primo + 2)
+    for uniti in periodi.values():
+        for inizio, fine in uniti:
+            delta[inizio - primo] += 1
+            delta[fine - primo + 1] -= 1
+    giorni, persone = [], 0
+    for i in range(ultimo - primo + 1):
+        persone += delta[i]
+        giorni.append({"giorno": dal + timedelta(days=i), "persone": persone})
+    return trasferte, giorni
+
+
+def main():
+    from app.database.session import engine
+
+    parser = argparse.ArgumentParser(description="Trasferte sovrapposte dello stesso dipendente")
+    parser.add_argument("--dipendente", type=int, default=None, help="solo questo dipendente")
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        n = 0
+        for s in trova_sovrapposizioni(conn, args.dipendente):
+            n += 1
+            print(f"dipendente {s.id_dipendente}: trasferte {s.id_trasferta} e {s.id_altra} dal {s.dal} al {s.al}")
+    if n:
+        print(f"{n} sovrapposizioni")
+        sys.exit(1)
+    print("nessuna sovrapposizione")
+
+
+if __name__ == "__main__":
+    main()
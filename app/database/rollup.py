@@ -0,0 +1,400 @@
+# app/database/rollup.py
+"""
+Rollup mensile delle spese per le dashboard (tabelle spese_rollup e
+spese_rollup_bucket).
+
+Per mese, dipendente, categoria, destinazione e valuta: totale e numero di
+spese, più un istogramma degli importi a bucket logaritmici da cui si
+stimano i percentili (errore relativo massimo ~9%, vedi BUCKET_RATIO).
+Le dashboard leggono solo queste tabelle: il costo dipende dal
+numero di combinazioni, non dal numero di spese.
+
+Si aggiorna a ogni flush come totali_trasferta (listener su Session); se
+una trasferta cambia dipendente o destinazione si ricalcolano le righe
+dei dipendenti coinvolti. Gli import in blocco chiamano apply_spese.
+Per intervalli che non coincidono con mesi interi le analisi vanno
+direttamente su spese con GROUP BY (vedi analytics).
+
+Uso:
+    python -m app.database.rollup --rebuild
+"""
+import argparse
+import enum
+import math
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import and_, bindparam, event, func, inspect, or_, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.database import models
+from app.database.totals import VALUTA_DEFAULT, track_old_values, upsert_increment
+
+BUCKET_MIN = 0.01           # importi fino a 1 centesimo finiscono nel bucket 0
+BUCKET_RATIO = 2 ** 0.25    # ogni bucket copre un intervallo [x, x * 1.19)
+PERCENTILI = (0.5, 0.9, 0.99)
+REBUILD_BATCH = 50_000      # combinazioni per blocco in rebuild
+
+RollupKey = Tuple[date, int, str, str, str]  # (mese, id_dipendente, categoria, destinazione, valuta)
+
+_rollup = models.SpesaRollup.__table__
+_buckets = models.SpesaRollupBucket.__table__
+_KEY_COLUMNS = ("mese", "id_dipendente", "categoria", "luogo_destinazione", "valuta")
+
+
+class Dimensione(str, enum.Enum):
+    id_dipendente = "id_dipendente"
+    area_lavoro = "area_lavoro"
+    mese = "mese"
+    categoria = "categoria"
+    luogo_destinazione = "luogo_destinazione"
+
+
+# ======================================
+# BUCKET E PERCENTILI
+# ======================================
+def bucket(importo: Optional[float]) -> int:
+    if importo is None or importo <= BUCKET_MIN:
+        return 0
+    return 1 + int(math.log(importo / BUCKET_MIN, BUCKET_RATIO))
+
+
+def bucket_value(b: int) -> float:
+    """Valore rappresentativo del bucket (media geometrica degli estremi)."""
+    return 0.0 if b <= 0 else BUCKET_MIN * BUCKET_RATIO ** (b - 0.5)
+
+
+def percentiles(counts: Iterable[Tuple[float, int]]) -> List[Optional[float]]:
+    """Percentili da coppie (valore, quante volte), ordinate per valore."""
+    counts = sorted(counts)
+    total = sum(n for _, n in counts)
+    out: List[Optional[float]] = []
+    for q in PERCENTILI:
+        if total == 0:
+            out.append(None)
+            continue
+        target, seen = q * total, 0
+        for value, n in counts:
+            seen += n
+            if seen >= target:
+                out.append(round(value, 2))
+                break
+    return out
+
+
+def month(d: date) -> date:
+    return d.replace(day=1)
+
+
+# ======================================
+# AGGIORNAMENTO INCREMENTALE
+# ======================================
+# valori che servono per la chiave: vanno noti anche prima della modifica
+_SPESA_ATTRS = ("id_trasferta", "data_spesa", "categoria", "valuta", "importo")
+_TRASFERTA_ATTRS = ("id_dipendente", "luogo_destinazione")
+_PENDING_DELETES = "spese_rollup.deleted"
+
+SpesaValues = Tuple[Optional[int], date, str, Optional[str], float]
+
+
+track_old_values(models.Spesa, _SPESA_ATTRS)
+track_old_values(models.Trasferta, _TRASFERTA_ATTRS)
+
+
+def _values(obj, old: bool = False) -> SpesaValues:
+    if not old:
+        return tuple(getattr(obj, a) for a in _SPESA_ATTRS)
+    state = inspect(obj)
+    values = []
+    for attr in _SPESA_ATTRS:
+        history = state.attrs[attr].history
+        values.append(history.deleted[0] if history.deleted else getattr(obj, attr))
+    return tuple(values)
+
+
+def _changed(obj, attrs: Sequence[str]) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[a].history.has_changes() for a in attrs)
+
+
+@event.listens_for(Session, "before_flush")
+def _before_flush(session: Session, flush_context, instances) -> None:
+    # come in totals.py: le spese cancellate vanno lette prima del DELETE
+    session.info[_PENDING_DELETES] = [_values(obj, old=True) for obj in session.deleted
+                                      if isinstance(obj, models.Spesa)]
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, flush_context) -> None:
+    changes: List[Tuple[SpesaValues, int]] = [(v, -1) for v in session.info.pop(_PENDING_DELETES, ())]
+    rebuild_for: Set[int] = set()
+    for obj in session.new:
+        if isinstance(obj, models.Spesa):
+            changes.append((_values(obj), +1))
+    for obj in session.dirty:
+        if isinstance(obj, models.Spesa) and _changed(obj, _SPESA_ATTRS):
+            changes.append((_values(obj, old=True), -1))
+            changes.append((_values(obj), +1))
+        elif isinstance(obj, models.Trasferta) and _changed(obj, _TRASFERTA_ATTRS):
+            history = inspect(obj).attrs.id_dipendente.history
+            rebuild_for.update(d for d in (*history.deleted, obj.id_dipendente) if d is not None)
+
+    if not changes and not rebuild_for:
+        return
+    conn = session.connection()
+    if changes:
+        trips = _trip_info(conn, {v[0] for v, _ in changes if v[0] is not None})
+        apply_changes(conn, changes, trips)
+    if rebuild_for:
+        rebuild(conn, rebuild_for)
+
+
+def _trip_info(conn: Connection, trasferta_ids: Set[int]) -> Dict[int, Tuple[Optional[int], str]]:
+    if not trasferta_ids:
+        return {}
+    t = models.Trasferta
+    rows = conn.execute(select(t.id, t.id_dipendente, t.luogo_destinazione).where(t.id.in_(trasferta_ids)))
+    return {r.id: (r.id_dipendente, r.luogo_destinazione) for r in rows}
+
+
+def _key(values: SpesaValues, trips: Dict[int, Tuple[Optional[int], str]]) -> Optional[RollupKey]:
+    id_trasferta, data_spesa, categoria, valuta, _ = values
+    trip = trips.get(id_trasferta)
+    if trip is None or trip[0] is None or data_spesa is None:
+        return None  # spese senza trasferta o senza dipendente: solo nel GROUP BY diretto
+    return (month(data_spesa), trip[0], categoria, trip[1], valuta or VALUTA_DEFAULT)
+
+
+def apply_changes(conn: Connection, changes: Iterable[Tuple[SpesaValues, int]],
+                  trips: Dict[int, Tuple[Optional[int], str]]) -> None:
+    """changes: (valori della spesa, +n / -n) con n spese identiche aggiunte o tolte."""
+    totals: Dict[RollupKey, List[float]] = defaultdict(lambda: [0.0, 0])
+    hist: Dict[Tuple, int] = defaultdict(int)
+    for values, sign in changes:
+        key = _key(values, trips)
+        if key is None:
+            continue
+        importo = values[4] or 0.0
+        totals[key][0] += sign * importo
+        totals[key][1] += sign
+        hist[key + (bucket(importo),)] += sign
+
+    upsert_increment(conn, _rollup, [
+        {**dict(zip(_KEY_COLUMNS, k)), "totale": v[0], "n_voci": v[1]}
+        for k, v in totals.items() if v[0] or v[1]
+    ], ("totale", "n_voci"))
+    upsert_increment(conn, _buckets, [
+        {**dict(zip(_KEY_COLUMNS + ("bucket",), k)), "n_voci": n} for k, n in hist.items() if n
+    ], ("n_voci",))
+
+    # solo le righe appena decrementate possono essere arrivate a zero
+    _delete_empty(conn, _rollup, _KEY_COLUMNS, [k for k, v in totals.items() if v[1] < 0])
+    _delete_empty(conn, _buckets, _KEY_COLUMNS + ("bucket",), [k for k, n in hist.items() if n < 0])
+
+
+def _delete_empty(conn: Connection, table, columns: Sequence[str], keys: List[Tuple]) -> None:
+    """DELETE delle righe con n_voci <= 0 tra keys, per chiave primaria completa (executemany)."""
+    if not keys:
+        return
+    stmt = table.delete().where(*(table.c[c] == bindparam(f"k_{c}") for c in columns), table.c.n_voci <= 0)
+    conn.execute(stmt, [{f"k_{c}": v for c, v in zip(columns, k)} for k in keys])
+
+
+def apply_spese(conn: Connection, rows: Iterable[dict], trips: Dict[int, Tuple[Optional[int], str]]) -> None:
+    """Per spese inserite senza ORM (import in blocco); trips: id_trasferta -> (id_dipendente, destinazione)."""
+    apply_changes(conn, [(tuple(row.get(a) for a in _SPESA_ATTRS), +1) for row in rows], trips)
+
+
+# ======================================
+# RICALCOLO
+# ======================================
+def rebuild(conn: Connection, dipendenti: Optional[Iterable[int]] = None) -> None:
+    """Ricalcola il rollup (tutto o solo per i dipendenti indicati) con un GROUP BY sulle spese."""
+    ids = None if dipendenti is None else list(dipendenti)
+    for table in (_rollup, _buckets):
+        delete = table.delete()
+        if ids is not None:
+            delete = delete.where(table.c.id_dipendente.in_(ids))
+        conn.execute(delete)
+
+    s, t = models.Spesa, models.Trasferta
+    stmt = (
+        select(s.id_trasferta, s.data_spesa, s.categoria, s.valuta, s.importo, func.count())
+        .join(t, s.id_trasferta == t.id)
+        .where(t.id_dipendente.is_not(None))
+        .group_by(s.id_trasferta, s.data_spesa, s.categoria, s.valuta, s.importo)
+    )
+    if ids is not None:
+        stmt = stmt.where(t.id_dipendente.in_(ids))
+    trips_stmt = select(t.id, t.id_dipendente, t.luogo_destinazione)
+    if ids is not None:
+        trips_stmt = trips_stmt.where(t.id_dipendente.in_(ids))
+    trips = {r.id: (r.id_dipendente, r.luogo_destinazione) for r in conn.execute(trips_stmt)}
+
+    # il "segno" di apply_changes è un moltiplicatore: qui il numero di spese uguali;
+    # a blocchi, per non tenere in memoria milioni di combinazioni
+    for partition in conn.execute(stmt).partitions(REBUILD_BATCH):
+        apply_changes(conn, [((row[0], row[1], row[2], row[3], row[4]), row[5]) for row in partition], trips)
+
+
+# ======================================
+# LETTURA PER LE DASHBOARD
+# ======================================
+def _whole_months(data_da: Optional[date], data_a: Optional[date]) -> bool:
+    return (data_da is None or data_da.day == 1) and (data_a is None or (data_a + timedelta(days=1)).day == 1)
+
+
+def _group(keys: Tuple, dims: Sequence[Dimensione], valuta: str) -> dict:
+    out = {d.value: k for d, k in zip(dims, keys)}
+    out["valuta"] = valuta or VALUTA_DEFAULT
+    return out
+
+
+def _result(groups: Dict[Tuple, List], dims: Sequence[Dimensione]) -> List[dict]:
+    """groups: chiave -> [totale, n_voci, [p50, p90, p99]]"""
+    out = []
+    for key, (totale, n, (p50, p90, p99)) in sorted(groups.items(), key=lambda kv: tuple(str(k) for k in kv[0])):
+        out.append({
+            **_group(key[:-1], dims, key[-1]),
+            "totale": round(totale, 2),
+            "n_voci": n,
+            "media": round(totale / n, 2) if n else None,
+            "p50": p50, "p90": p90, "p99": p99,
+        })
+    return out
+
+
+def _from_rollup(db: Session, dims: Sequence[Dimensione], data_da: Optional[date], data_a: Optional[date]) -> List[dict]:
+    groups: Dict[Tuple, List] = {}
+    for table, with_buckets in ((_rollup, False), (_buckets, True)):
+        columns = {
+            Dimensione.id_dipendente: table.c.id_dipendente,
+            Dimensione.area_lavoro: models.Dipendente.area_lavoro,
+            Dimensione.mese: table.c.mese,
+            Dimensione.categoria: table.c.categoria,
+            Dimensione.luogo_destinazione: table.c.luogo_destinazione,
+        }
+        keys = [columns[d] for d in dims] + [table.c.valuta]
+        if with_buckets:
+            stmt = select(*keys, table.c.bucket, func.sum(table.c.n_voci)).group_by(*keys, table.c.bucket)
+        else:
+            stmt = select(*keys, func.sum(table.c.totale), func.sum(table.c.n_voci)).group_by(*keys)
+        if Dimensione.area_lavoro in dims:
+            stmt = stmt.join(models.Dipendente, models.Dipendente.id == table.c.id_dipendente)
+        if data_da is not None:
+            stmt = stmt.where(table.c.mese >= month(data_da))
+        if data_a is not None:
+            stmt = stmt.where(table.c.mese <= month(data_a))
+        for row in db.execute(stmt):
+            key = tuple(row[:len(keys)])
+            if with_buckets:
+                groups[key][2].append((bucket_value(row[-2]), row[-1]))
+            else:
+                groups[key] = [row[-2] or 0.0, row[-1], []]
+    for group in groups.values():
+        group[2] = percentiles(group[2])
+    return _result(groups, dims)
+
+
+def _month_expr(db: Session, column):
+    """Primo giorno del mese di column, calcolato nel DB (date_trunc / DATE_FORMAT / strftime)."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return func.date_trunc("month", column)
+    if dialect == "mysql":
+        return func.date_format(column, "%Y-%m-01")
+    return func.strftime("%Y-%m-01", column)
+
+
+def _as_date(value) -> Optional[date]:
+    # date_trunc dà un timestamp, DATE_FORMAT e strftime una stringa
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value)
+    return value
+
+
+def _from_spese(db: Session, dims: Sequence[Dimensione], data_da: Optional[date], data_a: Optional[date]) -> List[dict]:
+    """
+    GROUP BY sulle spese per le dimensioni richieste (mese calcolato nel DB):
+    totale e numero arrivano già aggregati. I percentili (esatti) vengono da
+    una seconda query con ROW_NUMBER() per gruppo, che restituisce solo le
+    righe in posizione ceil(q * n): al più len(PERCENTILI) righe per gruppo.
+    """
+    s, t = models.Spesa, models.Trasferta
+    columns = {
+        Dimensione.id_dipendente: t.id_dipendente,
+        Dimensione.area_lavoro: models.Dipendente.area_lavoro,
+        Dimensione.mese: _month_expr(db, s.data_spesa),
+        Dimensione.categoria: s.categoria,
+        Dimensione.luogo_destinazione: t.luogo_destinazione,
+    }
+    keys = [columns[d] for d in dims] + [func.coalesce(s.valuta, VALUTA_DEFAULT)]
+    # sottoquery con le chiavi come colonne: il GROUP BY usa i nomi, non le espressioni
+    filtered = select(*(k.label(f"k{i}") for i, k in enumerate(keys)),
+                      func.coalesce(s.importo, 0.0).label("importo")).join(t, s.id_trasferta == t.id)
+    if Dimensione.area_lavoro in dims:
+        filtered = filtered.join(models.Dipendente, models.Dipendente.id == t.id_dipendente)
+    if data_da is not None:
+        filtered = filtered.where(s.data_spesa >= data_da)
+    if data_a is not None:
+        filtered = filtered.where(s.data_spesa <= data_a)
+    filtered = filtered.subquery()
+    group_keys = [filtered.c[f"k{i}"] for i in range(len(keys))]
+
+    mese = dims.index(Dimensione.mese) if Dimensione.mese in dims else None
+
+    def group_key(row) -> Tuple:
+        key = list(row[:len(keys)])
+        if mese is not None:
+            key[mese] = _as_date(key[mese])
+        return tuple(key)
+
+    groups: Dict[Tuple, List] = {}
+    totals = select(*group_keys, func.sum(filtered.c.importo), func.count()).group_by(*group_keys)
+    for row in db.execute(totals):
+        groups[group_key(row)] = [row[-2] or 0.0, row[-1], [None] * len(PERCENTILI)]
+
+    ranked = select(
+        *group_keys, filtered.c.importo,
+        func.row_number().over(partition_by=group_keys, order_by=filtered.c.importo).label("rn"),
+        func.count().over(partition_by=group_keys).label("n"),
+    ).subquery()
+    rn, n = ranked.c.rn, ranked.c.n
+    # stessa definizione di percentiles(): primo valore con almeno q * n spese <= valore
+    in_position = or_(*(and_(rn >= q * n, rn - 1 < q * n) for q in PERCENTILI))
+    picks = select(*(ranked.c[f"k{i}"] for i in range(len(keys))), ranked.c.importo, rn, n).where(in_position)
+    for row in db.execute(picks):
+        importo, position, total = row[-3], row[-2], row[-1]
+        out = groups[group_key(row)][2]
+        for i, q in enumerate(PERCENTILI):
+            if position >= q * total > position - 1:
+                out[i] = round(importo, 2)
+    return _result(groups, dims)
+
+
+def analytics(db: Session, dims: Sequence[Dimensione], data_da: Optional[date] = None,
+              data_a: Optional[date] = None) -> Tuple[str, List[dict]]:
+    """Ritorna (fonte, gruppi): fonte è "rollup" per mesi interi, altrimenti "group_by"."""
+    dims = list(dict.fromkeys(dims))  # senza doppioni, nell'ordine richiesto
+    if _whole_months(data_da, data_a):
+        return "rollup", _from_rollup(db, dims, data_da, data_a)
+    return "group_by", _from_spese(db, dims, data_da, data_a)
+
+
+def main():
+    from app.database.session import engine
+
+    parser = argparse.ArgumentParser(description="Ricalcolo del rollup mensile delle spese")
+    parser.add_argument("--rebuild", action="store_true", required=True)
+    parser.parse_args()
+    with engine.begin() as conn:
+        rebuild(conn)
+    print("rollup ricalcolato")
+
+
+if __name__ == "__main__":
+    main()
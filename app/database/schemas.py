@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, validator
 from datetime import date, datetime
-from typing import Optional, List
+from typing import Dict, Optional, List
 from app.database.models import (
     RuoloEnum,
     StatoTrasfertaEnum,
@@ -53,7 +53,12 @@ class TrasfertaBase(BaseModel):
     note_segreteria: Optional[str] = None
 
 class TrasfertaCreate(TrasfertaBase):
-    pass
+    @validator("data_rientro")
+    def check_periodo(cls, v, values):
+        partenza = values.get("data_partenza")
+        if partenza is not None and v < partenza:
+            raise ValueError("data_rientro precede data_partenza")
+        return v
 
 class TrasfertaRead(TrasfertaBase):
     id: int
@@ -73,6 +78,72 @@ class TrasfertaUpdate(BaseModel):
     note_dipendente: Optional[str] = None
     note_segreteria: Optional[str] = None
 
+# ============================
+# TRASFERTE - CAMBIO DI STATO IN BLOCCO
+# ============================
+TRANSIZIONI_MAX_IDS = 1000
+
+class TrasfertaStatoBatch(BaseModel):
+    ids: List[int]
+    stato: StatoTrasfertaEnum
+    note_segreteria: Optional[str] = None
+
+    @validator("ids")
+    def check_ids(cls, v):
+        # senza duplicati, nell'ordine ricevuto (è l'ordine dei risultati)
+        v = list(dict.fromkeys(v))
+        if not v:
+            raise ValueError("serve almeno un id")
+        if len(v) > TRANSIZIONI_MAX_IDS:
+            raise ValueError(f"al massimo {TRANSIZIONI_MAX_IDS} trasferte per richiesta")
+        return v
+
+class TrasfertaStatoEsito(BaseModel):
+    id: int
+    esito: str  # "aggiornata", "invariata" (era già nello stato), "non_trovata", "non_consentita"
+    stato: Optional[StatoTrasfertaEnum] = None  # stato dopo l'operazione
+
+class TrasfertaStatoBatchReport(BaseModel):
+    aggiornate: int
+    risultati: List[TrasfertaStatoEsito] = []
+
+# ============================
+# TRASFERTE - SOVRAPPOSIZIONI (audit)
+# ============================
+class TrasfertaSovrapposizione(BaseModel):
+    id_dipendente: int
+    id_trasferta: int
+    id_altra: int
+    dal: date  # periodo in comune, estremi inclusi
+    al: date
+
+# ============================
+# TRASFERTE - OCCUPAZIONE (chi è fuori sede quando/dove)
+# ============================
+class OccupazioneTrasferta(BaseModel):
+    id: int
+    id_dipendente: int
+    nome: str
+    cognome: str
+    area_lavoro: Optional[str] = None
+    luogo_destinazione: str
+    data_partenza: date
+    data_rientro: date
+    stato: StatoTrasfertaEnum
+
+    class Config:
+        orm_mode = True
+
+class OccupazioneGiorno(BaseModel):
+    giorno: date
+    persone: int
+
+class Occupazione(BaseModel):
+    dal: date
+    al: date
+    trasferte: List[OccupazioneTrasferta] = []
+    giorni: List[OccupazioneGiorno] = []
+
 
 # ============================
 # SPESA - FILE MULTIPLI
@@ -80,10 +151,16 @@ class TrasfertaUpdate(BaseModel):
 class SpesaFileBase(BaseModel):
     filename: str
     mimetype: Optional[str] = None
-    data: str  # base64 del file
 
 class SpesaFileResponse(SpesaFileBase):
+    # solo metadati: il contenuto si scarica da url (GET /spese/file/{id})
     id: int
+    size: int
+    url: Optional[str] = None
+
+    @validator("url", always=True)
+    def build_download_url(cls, v, values):
+        return v or f"/spese/file/{values.get('id')}"
 
     class Config:
         orm_mode = True
@@ -100,6 +177,11 @@ class SpesaBase(BaseModel):
     tipo_scontrino: str  # <-- cambiato da Enum a stringa
     data_spesa: date
 
+    @validator("valuta", pre=True, always=True)
+    def normalize_valuta(cls, v):
+        # testo libero: "usd " e "USD" devono finire sulla stessa valuta (totali e cambi)
+        return (v or "EUR").strip().upper()
+
 class SpesaCreate(SpesaBase):
     pass
 
@@ -107,7 +189,8 @@ class SpesaRead(SpesaBase):
     id: int
     created_at: datetime
     updated_at: datetime
-    files: List[SpesaFileResponse] = []  # allegati multipli
+    files: List[SpesaFileResponse] = []  # allegati multipli (solo metadati)
+    importo_eur: Optional[float] = None  # calcolato con app.fx, None se manca il tasso
 
     class Config:
         orm_mode = True
@@ -121,6 +204,63 @@ class SpesaUpdate(BaseModel):
 
 
 
+# ============================
+# IMPORT SPESE IN BLOCCO
+# ============================
+class ImportRigaErrore(BaseModel):
+    riga: int
+    errore: str
+
+class ImportSpeseReport(BaseModel):
+    righe: int
+    importate: int
+    n_errori: int
+    errori: List[ImportRigaErrore] = []  # al massimo IMPORT_MAX_ERRORS
+
+
+# ============================
+# RIMBORSO (totali per trasferta)
+# ============================
+class TotaleTrasfertaRead(BaseModel):
+    voce: str
+    valuta: str
+    categoria: str
+    totale: float
+    n_voci: int
+
+    class Config:
+        orm_mode = True
+
+class RimborsoRead(BaseModel):
+    id_trasferta: int
+    totale_rimborso: Optional[float] = None  # in EUR; None se manca un tasso di cambio
+    totali_per_valuta: Dict[str, float] = {}
+    dettaglio: List[TotaleTrasfertaRead] = []
+
+
+# ============================
+# ANALISI SPESE (dashboard)
+# ============================
+class SpeseAnalyticsGruppo(BaseModel):
+    # valorizzate solo le dimensioni richieste in group_by
+    id_dipendente: Optional[int] = None
+    area_lavoro: Optional[str] = None
+    mese: Optional[date] = None
+    categoria: Optional[str] = None
+    luogo_destinazione: Optional[str] = None
+    valuta: str
+    totale: float
+    n_voci: int
+    media: Optional[float] = None
+    p50: Optional[float] = None
+    p90: Optional[float] = None
+    p99: Optional[float] = None
+
+class SpeseAnalytics(BaseModel):
+    fonte: str  # "rollup" (mesi interi) o "group_by" (intervallo libero, percentili esatti)
+    gruppi: List[SpeseAnalyticsGruppo] = []
+
+
 # ============================
 # PRENOTAZIONE
 # ============================
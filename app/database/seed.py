@@ -0,0 +1,296 @@
+# app/database/seed.py
+"""
+Dati sintetici in volume per sviluppo e benchmark: dipendenti, trasferte,
+spese con allegati, prenotazioni e tassi di cambio.
+
+Le righe vengono generate a lotti e inserite con INSERT executemany (Core,
+senza ORM), un lotto per transazione. Gli id sono assegnati qui, a partire
+dal massimo già presente: il seed si può rieseguire per aggiungere volume.
+Totali per trasferta e rollup delle spese si ricalcolano una volta alla
+fine (totals.rebuild, rollup.rebuild) invece che riga per riga.
+
+Gli allegati puntano a pochi blob di esempio nell'archivio (stesso hash per
+molte spese, come succede con gli scontrini duplicati). Tutti i dipendenti
+hanno la password SEED_PASSWORD; il primo creato è admin, circa il 2%
+manager.
+
+Uso:
+    python -m app.database.seed                  # 10k dipendenti, 500k trasferte, 5M spese, 1M prenotazioni
+    python -m app.database.seed --scale 0.01     # 1% dei volumi, per prove veloci
+    python -m app.database.seed --spese 200000 --seed 7
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+
+from app import fx
+from app.database import models, rollup, session, totals
+from app.hashing import pwd_context
+from app.storage import get_attachment_store
+
+# ======================================
+# CONFIG
+# ======================================
+SEED_DIPENDENTI = 10_000
+SEED_TRASFERTE = 500_000
+SEED_SPESE = 5_000_000
+SEED_PRENOTAZIONI = 1_000_000
+SEED_ALLEGATI_PER_SPESA = 0.6  # media
+SEED_BATCH_SIZE = 10_000
+SEED_PASSWORD = "password"
+
+AREE = ["IT", "HR", "Vendite", "Marketing", "Amministrazione", "Produzione", "Legale", "Ricerca"]
+NOMI = ["Marco", "Giulia", "Luca", "Francesca", "Andrea", "Sara", "Matteo", "Chiara", "Paolo", "Elena"]
+COGNOMI = ["Rossi", "Bianchi", "Ferrari", "Esposito", "Romano", "Colombo", "Ricci", "Marino", "Greco", "Bruno"]
+DESTINAZIONI = [
+    "Milano", "Roma", "Torino", "Napoli", "Bologna", "Firenze", "Venezia", "Genova", "Bari", "Palermo",
+    "Parigi", "Londra", "Berlino", "Madrid", "Zurigo", "Bruxelles", "Amsterdam", "Vienna", "New York", "Tokyo",
+]
+COMMESSE = ["interna", "cliente", "formazione", "fiera", None]
+# categoria -> (peso, importo mediano in EUR)
+CATEGORIE = {"vitto": (40, 25.0), "taxi": (15, 30.0), "alloggio": (20, 120.0), "carburante": (10, 60.0),
+             "parcheggio": (8, 12.0), "altro": (7, 40.0)}
+# valuta -> (peso, unità per 1 EUR)
+VALUTE = {"EUR": (90, 1.0), "USD": (5, 1.09), "GBP": (3, 0.86), "CHF": (2, 0.95)}
+MEZZI = {models.TipoMezzoEnum.treno: (45, 60.0), models.TipoMezzoEnum.aereo: (30, 180.0),
+         models.TipoMezzoEnum.auto: (20, 50.0), models.TipoMezzoEnum.altro: (5, 30.0)}
+FORNITORI = {models.TipoMezzoEnum.treno: ["Trenitalia", "Italo"], models.TipoMezzoEnum.aereo: ["ITA", "Lufthansa", "Ryanair"],
+             models.TipoMezzoEnum.auto: ["Hertz", "Europcar", "Avis"], models.TipoMezzoEnum.altro: ["FlixBus", None]}
+STATI = {models.StatoTrasfertaEnum.completata: 55, models.StatoTrasfertaEnum.approvata: 20,
+         models.StatoTrasfertaEnum.inviata: 15, models.StatoTrasfertaEnum.rifiutata: 10}
+GIORNI_STORICO = 3 * 365
+DURATE = (1, 1, 2, 2, 3, 4, 5, 7, 10)  # giorni di trasferta, ripetuti secondo il peso
+
+
+def _pool(table: dict) -> list:
+    """Chiavi ripetute secondo il peso: pool[int(random() * len(pool))] costa meno di random.choices."""
+    return [key for key, value in table.items() for _ in range(value[0] if isinstance(value, tuple) else value)]
+
+
+def _pick(rnd: random.Random, pool: Sequence):
+    return pool[int(rnd.random() * len(pool))]
+
+
+def _next_id(engine: Engine, model) -> int:
+    with engine.connect() as conn:
+        return (conn.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _insert(engine: Engine, model, rows: Iterator[dict], total: int, batch_size: int,
+            after_batch: Optional[Callable[[], None]] = None) -> None:
+    """Inserisce a lotti di batch_size righe, un commit per lotto; after_batch gira dopo ogni commit."""
+    table = model.__table__
+    start = time.perf_counter()
+    batch: List[dict] = []
+    done = 0
+
+    def flush():
+        nonlocal batch, done
+        with engine.begin() as conn:
+            conn.execute(table.insert(), batch)
+        done += len(batch)
+        batch = []
+        if after_batch is not None:
+            after_batch()
+        print(f"\r{table.name}: {done}/{total} ({done / (time.perf_counter() - start):,.0f} righe/s)", end="", flush=True)
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    print()
+
+
+# ======================================
+# GENERATORI
+# ======================================
+class Seeder:
+    def __init__(self, engine: Engine, rnd: random.Random, batch_size: int = SEED_BATCH_SIZE):
+        self.engine = engine
+        self.rnd = rnd
+        self.batch_size = batch_size
+        self.today = date.today()
+        # per trasferta (indice = id - primo id): partenza e durata, per date di spesa coerenti
+        self.trip_first_id = 0
+        self.trip_start: List[int] = []
+        self.trip_days: List[int] = []
+
+    def _lognormal(self, median: float, sigma: float = 0.6) -> float:
+        return round(self.rnd.lognormvariate(0, sigma) * median, 2)
+
+    def dipendenti(self, n: int) -> range:
+        first = _next_id(self.engine, models.Dipendente)
+        hashed = pwd_context.hash(SEED_PASSWORD)  # uno solo: bcrypt costa ~0.2 s
+        rnd = self.rnd
+        now = datetime.utcnow()
+
+        def rows():
+            for i in range(first, first + n):
+                ruolo = models.RuoloEnum.admin if i == first else (
+                    models.RuoloEnum.manager if rnd.random() < 0.02 else models.RuoloEnum.dipendente)
+                created = now - timedelta(days=rnd.randint(0, GIORNI_STORICO), seconds=rnd.randint(0, 86399))
+                yield {"id": i, "nome": _pick(rnd, NOMI), "cognome": _pick(rnd, COGNOMI),
+                       "email": f"seed{i}@example.com", "telefono": None, "area_lavoro": _pick(rnd, AREE),
+                       "ruolo": ruolo, "password": hashed, "token_version": 0,
+                       "created_at": created, "updated_at": created}
+
+        _insert(self.engine, models.Dipendente, rows(), n, self.batch_size)
+        return range(first, first + n)
+
+    def trasferte(self, n: int, dipendenti: range) -> range:
+        first = _next_id(self.engine, models.Trasferta)
+        rnd = self.rnd
+        stati = _pool(STATI)
+        self.trip_first_id, self.trip_start, self.trip_days = first, [], []
+        # come impone l'API, le trasferte di un dipendente non si sovrappongono: ognuno
+        # riempie all'indietro da oggi il suo storico, con pause casuali tra una e l'altra
+        pausa_media = max(1.0, GIORNI_STORICO * len(dipendenti) / n - sum(DURATE) / len(DURATE))
+        prima_partenza = {}  # id_dipendente -> ordinale della partenza più vecchia generata
+
+        def rows():
+            for i in range(first, first + n):
+                dipendente = _pick(rnd, dipendenti)
+                giorni = _pick(rnd, DURATE)
+                rientro = prima_partenza.get(dipendente, self.today.toordinal() + 1) - 1 \
+                    - int(rnd.random() * 2 * pausa_media)
+                prima_partenza[dipendente] = rientro - giorni + 1
+                partenza = date.fromordinal(rientro - giorni + 1)
+                self.trip_start.append(partenza.toordinal())
+                self.trip_days.append(giorni)
+                created = datetime.combine(partenza - timedelta(days=rnd.randint(1, 30)), datetime.min.time()) \
+                    + timedelta(seconds=rnd.randint(0, 86399))
+                yield {"id": i, "id_dipendente": dipendente, "data_partenza": partenza,
+                       "data_rientro": partenza + timedelta(days=giorni - 1),
+                       "luogo_destinazione": _pick(rnd, DESTINAZIONI), "luogo_extra": None,
+                       "tipo_commessa": _pick(rnd, COMMESSE), "stato": _pick(rnd, stati),
+                       "note_dipendente": None, "note_segreteria": None,
+                       "created_at": created, "updated_at": created}
+
+        _insert(self.engine, models.Trasferta, rows(), n, self.batch_size)
+        return range(first, first + n)
+
+    def _trip(self) -> int:
+        return int(self.rnd.random() * len(self.trip_start))
+
+    def spese(self, n: int, allegati_per_spesa: float) -> None:
+        first = _next_id(self.engine, models.Spesa)
+        rnd = self.rnd
+        categorie, valute = _pool(CATEGORIE), _pool(VALUTE)
+        tipi = ("scontrino", "fattura", "ricevuta", "altro")
+        sample_files = self._sample_blobs()
+        file_rows: List[dict] = []
+
+        def rows():
+            for i in range(first, first + n):
+                k = self._trip()
+                giorno = date.fromordinal(self.trip_start[k] + int(rnd.random() * self.trip_days[k]))
+                categoria = _pick(rnd, categorie)
+                valuta = _pick(rnd, valute)
+                created = datetime.combine(giorno, datetime.min.time()) + timedelta(seconds=3600 + rnd.random() * 4 * 86400)
+                for _ in range(int(allegati_per_spesa) + (rnd.random() < allegati_per_spesa % 1)):
+                    digest, size, filename, mimetype = _pick(rnd, sample_files)
+                    file_rows.append({"id_spesa": i, "filename": filename, "mimetype": mimetype,
+                                      "sha256": digest, "size": size, "created_at": created})
+                yield {"id": i, "id_trasferta": self.trip_first_id + k, "categoria": categoria,
+                       "importo": self._lognormal(CATEGORIE[categoria][1] * VALUTE[valuta][1]),
+                       "valuta": valuta, "tipo_scontrino": _pick(rnd, tipi),
+                       "file_scontrino": None, "data_spesa": giorno, "created_at": created, "updated_at": created}
+
+        def flush_files():
+            # dopo il commit del lotto di spese: gli allegati puntano solo a spese già
+            # inserite (le FK vengono verificate su PostgreSQL/MySQL e con foreign_keys=ON)
+            if file_rows:
+                with self.engine.begin() as conn:
+                    conn.execute(models.SpesaFile.__table__.insert(), file_rows)
+                file_rows.clear()
+
+        _insert(self.engine, models.Spesa, rows(), n, self.batch_size, after_batch=flush_files)
+
+    def prenotazioni(self, n: int) -> None:
+        first = _next_id(self.engine, models.Prenotazione)
+        rnd = self.rnd
+        mezzi = _pool(MEZZI)
+
+        def rows():
+            for i in range(first, first + n):
+                k = self._trip()
+                mezzo = _pick(rnd, mezzi)
+                created = datetime.combine(date.fromordinal(self.trip_start[k]), datetime.min.time()) \
+                    - timedelta(seconds=rnd.randint(3600, 20 * 86400))
+                yield {"id": i, "id_trasferta": self.trip_first_id + k, "tipo_mezzo": mezzo,
+                       "fornitore": _pick(rnd, FORNITORI[mezzo]), "costo": self._lognormal(MEZZI[mezzo][1]),
+                       "dettagli": None, "file_biglietto": None, "created_at": created, "updated_at": created}
+
+        _insert(self.engine, models.Prenotazione, rows(), n, self.batch_size)
+
+    def _sample_blobs(self) -> List[tuple]:
+        store = get_attachment_store()
+        blobs = []
+        for j in range(8):
+            pdf = b"%PDF-1.4\n% scontrino di prova " + str(j).encode() + b"\n" + self.rnd.randbytes(2048 * (j + 1))
+            blobs.append((store.put(pdf), len(pdf), f"scontrino_{j}.pdf", "application/pdf"))
+        return blobs
+
+    def tassi(self) -> None:
+        """Un tasso per giorno lavorativo e valuta, con una piccola deriva casuale."""
+        rates = []
+        for valuta, (_, base) in VALUTE.items():
+            if valuta == fx.VALUTA_BASE:
+                continue
+            tasso = base
+            for d in range(GIORNI_STORICO + 40, -1, -1):
+                giorno = self.today - timedelta(days=d)
+                if giorno.weekday() < 5:
+                    tasso = round(tasso * (1 + self.rnd.gauss(0, 0.004)), 4)
+                    rates.append((valuta, giorno, tasso))
+        fx.import_rates(rates, self.engine)
+
+
+def _timed(label: str, fn: Callable):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label}: {time.perf_counter() - start:.1f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera dati sintetici in volume (dev e benchmark)")
+    parser.add_argument("--scale", type=float, default=1.0, help="moltiplica tutti i volumi (es. 0.01)")
+    parser.add_argument("--dipendenti", type=int, default=SEED_DIPENDENTI)
+    parser.add_argument("--trasferte", type=int, default=SEED_TRASFERTE)
+    parser.add_argument("--spese", type=int, default=SEED_SPESE)
+    parser.add_argument("--prenotazioni", type=int, default=SEED_PRENOTAZIONI)
+    parser.add_argument("--allegati", type=float, default=SEED_ALLEGATI_PER_SPESA, help="allegati medi per spesa")
+    parser.add_argument("--batch-size", type=int, default=SEED_BATCH_SIZE)
+    parser.add_argument("--seed", type=int, default=42, help="seme del generatore casuale")
+    args = parser.parse_args()
+
+    def scaled(n: int) -> int:
+        return max(1, int(n * args.scale))
+
+    session.create_tables()
+    engine = session.engine
+    seeder = Seeder(engine, random.Random(args.seed), args.batch_size)
+    start = time.perf_counter()
+    dipendenti = seeder.dipendenti(scaled(args.dipendenti))
+    seeder.trasferte(scaled(args.trasferte), dipendenti)
+    seeder.spese(scaled(args.spese), args.allegati)
+    seeder.prenotazioni(scaled(args.prenotazioni))
+    _timed("tassi di cambio", seeder.tassi)
+    with engine.begin() as conn:
+        _timed("totali per trasferta", lambda: totals.rebuild(conn))
+    with engine.begin() as conn:
+        _timed("rollup spese", lambda: rollup.rebuild(conn))
+    print(f"completato in {time.perf_counter() - start:.1f}s (password dei dipendenti: {SEED_PASSWORD!r}, "
+          f"admin id {dipendenti[0]})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,106 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from .base import Base
 
+# ======================================
+# CONFIG (da .env, vedi app/__init__.py)
+# ======================================
+DB_TYPE = os.getenv("DB_TYPE", "sqlite").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "./db.sqlite3")
+
+# pool connessioni (solo database server)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # secondi, < wait_timeout di MySQL
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+# PRAGMA SQLite applicati a ogni connessione
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 65536))
+
+# driver per DB_TYPE: (sincrono, asincrono)
+_DRIVERS = {
+    "sqlite": ("sqlite", "sqlite+aiosqlite"),
+    "mysql": ("mysql+pymysql", "mysql+aiomysql"),
+    "postgresql": ("postgresql+psycopg2", "postgresql+asyncpg"),
+}
+
+
+def database_url(async_driver: bool = False) -> URL:
+    if DB_TYPE not in _DRIVERS:
+        raise ValueError(f"DB_TYPE non supportato: {DB_TYPE} (valori ammessi: {', '.join(_DRIVERS)})")
+    drivername = _DRIVERS[DB_TYPE][1 if async_driver else 0]
+    if DB_TYPE == "sqlite":
+        return URL.create(drivername, database=SQLITE_PATH)
+    return URL.create(
+        drivername,
+        username=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST", "localhost"),
+        port=int(os.getenv("DB_PORT")) if os.getenv("DB_PORT") else None,
+        database=os.getenv("DB_NAME"),
+    )
+
+
+def _engine_options() -> dict:
+    if DB_TYPE == "sqlite":
+        return {"connect_args": {"check_same_thread": False}}  # solo SQLite
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: i lettori non bloccano lo scrittore; synchronous=NORMAL è sicuro con WAL
+    # e fa un fsync per checkpoint invece che per commit
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.close()
+
+
 # URL del database
-DATABASE_URL = "sqlite:///./db.sqlite3"
+DATABASE_URL = database_url()
+# stesso database, driver asincrono (per gli endpoint async def)
+ASYNC_DATABASE_URL = database_url(async_driver=True)
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}  # solo SQLite
-)
+engine = create_engine(DATABASE_URL, **_engine_options())
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options())
+
+if DB_TYPE == "sqlite":
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+# expire_on_commit=False: dopo il commit gli oggetti restano leggibili
+# senza nuove query (in async un lazy load implicito non è permesso)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# totali per trasferta e rollup delle spese aggiornati a ogni flush (listener su Session)
+from app.database import rollup, totals  # noqa: E402,F401
+
 # ======================================
-# CREA TUTTE LE TABELLE ALL'AVVIO
+# CREA / AGGIORNA LE TABELLE
 # ======================================
 def create_tables():
-    import app.database.models
-    Base.metadata.create_all(bind=engine)
+    """Porta il database all'ultima revisione Alembic (lo crea se è vuoto)."""
+    from app.database.migrations import upgrade_database
+    upgrade_database(engine)
 
 # ======================================
 # FUNZIONE get_db (IMPORTANTE ⚠️)
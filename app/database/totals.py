@@ -0,0 +1,327 @@
+# app/database/totals.py
+"""
+Totali di rimborso per trasferta (tabella totali_trasferta), suddivisi per
+voce (spesa/prenotazione), valuta e categoria.
+
+Ogni flush che inserisce, modifica o cancella Spesa o Prenotazione applica
+la differenza nella stessa transazione (listener after_flush su Session,
+vale anche per AsyncSession): leggere il rimborso costa una query sulle
+poche righe della trasferta, qualunque sia il numero di spese.
+
+Le scritture che scavalcano l'ORM (UPDATE/DELETE in blocco, SQL a mano)
+non passano di qui: verify/rebuild ricalcolano da zero e correggono.
+
+Uso:
+    python -m app.database.totals            # verifica, exit 1 se ci sono differenze
+    python -m app.database.totals --repair   # ricalcola le trasferte con differenze
+    python -m app.database.totals --rebuild  # ricalcola tutto
+"""
+import argparse
+import sys
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import Table, event, func, inspect, literal, select, tuple_
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.database import models
+
+VOCE_SPESA = "spesa"
+VOCE_PRENOTAZIONE = "prenotazione"
+VALUTA_DEFAULT = "EUR"  # le prenotazioni non hanno valuta
+TOLLERANZA = 0.005      # mezzo centesimo: somme float incrementali vs ricalcolate
+
+Key = Tuple[int, str, str, str]  # (id_trasferta, voce, valuta, categoria)
+
+_table = models.TotaleTrasferta.__table__
+
+
+class _OldValueUnknown(Exception):
+    """Valore precedente non caricato: la differenza non si può calcolare."""
+
+
+# ======================================
+# CHIAVI E IMPORTI DI UNA RIGA
+# ======================================
+def _value(obj, attr: str, old: bool):
+    if not old:
+        return getattr(obj, attr)
+    history = inspect(obj).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        raise _OldValueUnknown(attr)
+    return history.unchanged[0] if history.unchanged else None
+
+
+def _entry(obj, old: bool = False) -> Optional[Tuple[Key, float]]:
+    if isinstance(obj, models.Spesa):
+        trasferta_id = _value(obj, "id_trasferta", old)
+        key = (trasferta_id, VOCE_SPESA, _value(obj, "valuta", old) or VALUTA_DEFAULT, _value(obj, "categoria", old))
+        amount = _value(obj, "importo", old) or 0.0
+    elif isinstance(obj, models.Prenotazione):
+        trasferta_id = _value(obj, "id_trasferta", old)
+        tipo = _value(obj, "tipo_mezzo", old)
+        key = (trasferta_id, VOCE_PRENOTAZIONE, VALUTA_DEFAULT, getattr(tipo, "value", tipo))
+        amount = _value(obj, "costo", old) or 0.0
+    else:
+        return None
+    return None if trasferta_id is None else (key, amount)
+
+
+# ======================================
+# AGGIORNAMENTO INCREMENTALE
+# ======================================
+_TRACKED = {
+    models.Spesa: ("id_trasferta", "valuta", "categoria", "importo"),
+    models.Prenotazione: ("id_trasferta", "tipo_mezzo", "costo"),
+}
+_PENDING_DELETES = "totali_trasferta.deleted"
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+
+def track_old_values(model, attrs: Sequence[str]) -> None:
+    """
+    active_history sugli attributi: alla modifica SQLAlchemy carica il valore
+    precedente anche se l'attributo era scaduto (es. dopo un commit), così la
+    differenza è sempre nota. Un solo listener per attributo, anche se più
+    moduli (totali, rollup) chiedono lo stesso.
+    """
+    for attr in attrs:
+        attribute = getattr(model, attr)
+        if not event.contains(attribute, "set", _keep_old_value):
+            event.listen(attribute, "set", _keep_old_value, active_history=True)
+
+
+for _model, _attrs in _TRACKED.items():
+    track_old_values(_model, _attrs)
+
+
+@event.listens_for(Session, "before_flush")
+def _before_flush(session: Session, flush_context, instances) -> None:
+    # le righe cancellate vanno lette prima del DELETE: dopo non sono più caricabili
+    entries = []
+    for obj in session.deleted:
+        attrs = _TRACKED.get(type(obj))
+        if attrs:
+            for attr in attrs:
+                getattr(obj, attr)  # carica gli attributi scaduti
+            entries.append(_entry(obj, old=True))
+    session.info[_PENDING_DELETES] = entries
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, flush_context) -> None:
+    # after_flush: new/dirty e la history degli attributi sono ancora quelli pre-flush
+    deltas: Dict[Key, List[float]] = defaultdict(lambda: [0.0, 0])
+    recompute: Set[int] = set()
+
+    def add(entry, sign):
+        if entry is not None:
+            delta = deltas[entry[0]]
+            delta[0] += sign * entry[1]
+            delta[1] += sign
+
+    for obj in session.new:
+        add(_entry(obj), +1)
+    for entry in session.info.pop(_PENDING_DELETES, ()):
+        add(entry, -1)
+    for obj in session.dirty:
+        if type(obj) not in _TRACKED or not session.is_modified(obj):
+            continue
+        try:
+            old = _entry(obj, old=True)
+        except _OldValueUnknown:
+            new = _entry(obj)
+            if new is not None:
+                recompute.add(new[0][0])
+            continue
+        add(old, -1)
+        add(_entry(obj), +1)
+
+    if not deltas and not recompute:
+        return
+    conn = session.connection()
+    changes = {k: v for k, v in deltas.items() if k[0] not in recompute and (v[0] or v[1])}
+    if changes:
+        apply_deltas(conn, changes)
+    if recompute:
+        rebuild(conn, recompute)
+
+
+def upsert_increment(conn: Connection, table: Table, rows: List[dict], columns: Sequence[str]) -> None:
+    """
+    Inserisce le righe o, se la chiave primaria esiste già, somma i valori
+    delle colonne indicate (INSERT ... ON CONFLICT / ON DUPLICATE KEY dove
+    il dialetto lo supporta, altrimenti UPDATE e poi INSERT).
+    """
+    if not rows:
+        return
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=[c.name for c in table.primary_key],
+            set_={c: table.c[c] + stmt.excluded[c] for c in columns},
+        ), rows)
+    elif dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        conn.execute(stmt.on_duplicate_key_update(
+            {c: table.c[c] + stmt.inserted[c] for c in columns}
+        ), rows)
+    else:
+        pk = list(table.primary_key.columns)
+        for row in rows:
+            updated = conn.execute(
+                table.update()
+                .where(tuple_(*pk) == tuple_(*(row[c.name] for c in pk)))
+                .values({c: table.c[c] + row[c] for c in columns})
+            )
+            if updated.rowcount == 0:
+                conn.execute(table.insert(), row)
+
+
+def apply_deltas(conn: Connection, deltas: Dict[Key, List[float]]) -> None:
+    rows = [
+        {"id_trasferta": k[0], "voce": k[1], "valuta": k[2], "categoria": k[3], "totale": v[0], "n_voci": v[1]}
+        for k, v in deltas.items()
+    ]
+    upsert_increment(conn, _table, rows, ("totale", "n_voci"))
+    # chiavi rimaste senza voci (ultima spesa cancellata o spostata)
+    conn.execute(_table.delete().where(
+        _table.c.n_voci <= 0,
+        _table.c.id_trasferta.in_({k[0] for k in deltas}),
+    ))
+
+
+def spese_deltas(rows: Iterable[dict]) -> Dict[Key, List[float]]:
+    """Differenze per spese inserite senza ORM (es. import in blocco), da passare ad apply_deltas."""
+    deltas: Dict[Key, List[float]] = defaultdict(lambda: [0.0, 0])
+    for row in rows:
+        if row.get("id_trasferta") is None:
+            continue
+        delta = deltas[(row["id_trasferta"], VOCE_SPESA, row.get("valuta") or VALUTA_DEFAULT, row["categoria"])]
+        delta[0] += row["importo"] or 0.0
+        delta[1] += 1
+    return deltas
+
+
+# ======================================
+# RICALCOLO E VERIFICA
+# ======================================
+def _expected(trasferta_ids: Optional[Iterable[int]] = None):
+    """Le due SELECT ... GROUP BY da cui si ricava la tabella."""
+    s, p = models.Spesa, models.Prenotazione
+    spese = (
+        select(s.id_trasferta, literal(VOCE_SPESA), func.coalesce(s.valuta, VALUTA_DEFAULT), s.categoria,
+               func.sum(s.importo), func.count())
+        .where(s.id_trasferta.is_not(None))
+        .group_by(s.id_trasferta, func.coalesce(s.valuta, VALUTA_DEFAULT), s.categoria)
+    )
+    prenotazioni = (
+        select(p.id_trasferta, literal(VOCE_PRENOTAZIONE), literal(VALUTA_DEFAULT), p.tipo_mezzo,
+               func.sum(func.coalesce(p.costo, 0.0)), func.count())
+        .where(p.id_trasferta.is_not(None))
+        .group_by(p.id_trasferta, p.tipo_mezzo)
+    )
+    if trasferta_ids is not None:
+        ids = list(trasferta_ids)
+        spese = spese.where(s.id_trasferta.in_(ids))
+        prenotazioni = prenotazioni.where(p.id_trasferta.in_(ids))
+    return spese, prenotazioni
+
+
+def _key(row) -> Key:
+    return (row[0], row[1], row[2], getattr(row[3], "value", row[3]))
+
+
+def rebuild(conn: Connection, trasferta_ids: Optional[Iterable[int]] = None) -> None:
+    """Ricalcola da zero i totali (di tutte le trasferte o solo di quelle indicate)."""
+    ids = None if trasferta_ids is None else list(trasferta_ids)
+    delete = _table.delete()
+    if ids is not None:
+        delete = delete.where(_table.c.id_trasferta.in_(ids))
+    conn.execute(delete)
+    columns = ["id_trasferta", "voce", "valuta", "categoria", "totale", "n_voci"]
+    for stmt in _expected(ids):
+        conn.execute(_table.insert().from_select(columns, stmt))
+
+
+def verify(conn: Connection) -> List[Tuple[Key, Optional[Tuple[float, int]], Optional[Tuple[float, int]]]]:
+    """Ritorna le differenze come (chiave, atteso, in tabella); lista vuota se tutto torna."""
+    expected = {}
+    for stmt in _expected():
+        for row in conn.execute(stmt):
+            expected[_key(row)] = (row[4] or 0.0, row[5])
+    actual = {_key(row): (row.totale, row.n_voci) for row in conn.execute(select(_table))}
+
+    drift = []
+    for key in expected.keys() | actual.keys():
+        exp, act = expected.get(key), actual.get(key)
+        if exp is None or act is None or exp[1] != act[1] or abs(exp[0] - act[0]) > TOLLERANZA:
+            drift.append((key, exp, act))
+    return sorted(drift, key=lambda d: d[0])
+
+
+# ======================================
+# LETTURA
+# ======================================
+def totali_trasferta(db: Session, trasferta_id: int) -> List[models.TotaleTrasferta]:
+    return (
+        db.query(models.TotaleTrasferta)
+        .filter(models.TotaleTrasferta.id_trasferta == trasferta_id)
+        .order_by(models.TotaleTrasferta.voce, models.TotaleTrasferta.valuta, models.TotaleTrasferta.categoria)
+        .all()
+    )
+
+
+def riepilogo_rimborso(trasferta_id: int, righe: List[models.TotaleTrasferta],
+                       totale_eur: Optional[float]) -> dict:
+    """totale_eur viene da app.fx.totale_eur (conversione al cambio del giorno di ogni spesa)."""
+    per_valuta: Dict[str, float] = defaultdict(float)
+    for r in righe:
+        per_valuta[r.valuta] += r.totale
+    return {
+        "id_trasferta": trasferta_id,
+        "totale_rimborso": totale_eur,
+        "totali_per_valuta": dict(per_valuta),
+        "dettaglio": righe,
+    }
+
+def main():
+    from app.database.session import engine
+
+    parser = argparse.ArgumentParser(description="Verifica/ricalcolo della tabella totali_trasferta")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--repair", action="store_true", help="ricalcola solo le trasferte con differenze")
+    group.add_argument("--rebuild", action="store_true", help="ricalcola tutte le trasferte")
+    args = parser.parse_args()
+
+    with engine.begin() as conn:
+        if args.rebuild:
+            rebuild(conn)
+            print("totali ricalcolati")
+            return
+        drift = verify(conn)
+        for key, exp, act in drift:
+            print(f"trasferta {key[0]} {key[1]}/{key[2]}/{key[3]}: atteso {exp}, in tabella {act}")
+        if args.repair and drift:
+            rebuild(conn, {key[0] for key, _, _ in drift})
+            print(f"ricalcolate {len({key[0] for key, _, _ in drift})} trasferte")
+        elif drift:
+            sys.exit(1)
+        else:
+            print("nessuna differenza")
+
+
+if __name__ == "__main__":
+    main()
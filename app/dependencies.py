@@ -1,6 +1,11 @@
+import os
+from typing import Optional
+
 from fastapi import Depends, Header, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 from app.database import models, session
+from app.tokens import CurrentUser, authenticate_token
 
 # =========================
 # Dipendenza DB
@@ -12,54 +17,53 @@ def get_db():
     finally:
         db.close()
 
+# Dipendenza DB asincrona (per gli endpoint async def)
+async def get_async_db():
+    async with session.AsyncSessionLocal() as db:
+        yield db
+
 # =========================
-# MOCK: Dipendenza "utente corrente" senza autenticazione
+# UTENTE CORRENTE (JWT)
 # =========================
-# Invia un header 'x-user-id' per simulare l'utente corrente
+# Authorization: Bearer <token> -> utente dai claim sub/role del token,
+# senza query al DB (vedi app/tokens.py).
+bearer_scheme = HTTPBearer(auto_error=False)
+
+# MOCK: senza token, l'header 'x-user-id' simula l'utente corrente (default ID=1).
+# Disattivabile con AUTH_ALLOW_MOCK=0.
+AUTH_ALLOW_MOCK = os.getenv("AUTH_ALLOW_MOCK", "1") == "1"
+
 def get_current_user(
-    x_user_id: int = Header(default=1),  # default ID=1
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme),
+    x_user_id: int = Header(default=1),
     db: Session = Depends(get_db)
-) -> models.Dipendente:
+) -> CurrentUser:
+    if credentials is not None:
+        user = authenticate_token(credentials.credentials)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Impossibile autenticare l'utente",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return user
+
+    if not AUTH_ALLOW_MOCK:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token mancante",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     user = db.query(models.Dipendente).filter(models.Dipendente.id == x_user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail=f"Dipendente con id {x_user_id} non trovato")
-    return user
-
-# =========================
-# AUTENTICAZIONE CON JWT (COMMENTATA)
-# =========================
-"""
-from fastapi.security import OAuth2PasswordBearer
-from jose import jwt, JWTError
-from app.routers.auth import SECRET_KEY, ALGORITHM
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Impossibile autenticare l'utente",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-
-    user = db.query(models.Dipendente).filter(models.Dipendente.id == int(user_id)).first()
-    if user is None:
-        raise credentials_exception
-    return user
-"""
+    return CurrentUser(user.id, user.ruolo)
 
 # =========================
 # Dipendenza generica per controllare il ruolo
 # =========================
 def require_role(required_roles: list):
-    def role_checker(current_user: models.Dipendente = Depends(get_current_user)):
+    def role_checker(current_user: CurrentUser = Depends(get_current_user)):
         if current_user.ruolo not in required_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
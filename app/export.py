@@ -0,0 +1,142 @@
+# app/export.py
+"""
+Export in streaming (CSV o NDJSON) di spese, trasferte e prenotazioni.
+
+Le righe arrivano dal DB con un cursore lato server (stream_results +
+yield_per), come semplici tuple di colonne, e vengono serializzate una alla
+volta dentro un generatore: in memoria resta solo il blocco corrente,
+qualunque sia il numero di righe esportate.
+
+Il generatore apre una connessione propria: le dipendenze con yield
+(get_db) vengono chiuse prima che parta il corpo della risposta.
+"""
+import csv
+import enum
+import io
+import json
+import os
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.sql import Select
+
+from app import fx
+from app.database import models, session
+from app.filters import PrenotazioniFilter, SpeseFilter, TrasferteFilter
+from app.serialization import plain
+
+# ======================================
+# CONFIG
+# ======================================
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", 1000))
+EXPORT_CHUNK_BYTES = 64 * 1024  # righe accorpate prima di ogni invio
+
+
+class ExportFormat(str, enum.Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+_MEDIA_TYPES = {
+    ExportFormat.csv: "text/csv; charset=utf-8",
+    ExportFormat.ndjson: "application/x-ndjson",
+}
+
+
+# ======================================
+# SERIALIZZAZIONE
+# ======================================
+def _csv_chunks(header: Sequence[str], rows: Iterable[Sequence]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([plain(v) for v in row])
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(header: Sequence[str], rows: Iterable[Sequence]) -> Iterator[str]:
+    parts: List[str] = []
+    size = 0
+    for row in rows:
+        line = json.dumps({k: plain(v) for k, v in zip(header, row)}, ensure_ascii=False) + "\n"
+        parts.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(parts)
+            parts, size = [], 0
+    yield "".join(parts)
+
+
+def _stream_rows(stmt: Select) -> Iterator[Sequence]:
+    with session.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_YIELD_PER).execute(stmt)
+        for partition in result.partitions():
+            yield from partition
+
+
+def stream_export(stmt: Select, formato: ExportFormat, filename: str,
+                  extra: Optional[Callable[[Sequence], Sequence]] = None,
+                  extra_columns: Sequence[str] = ()) -> StreamingResponse:
+    """extra(row) aggiunge valori calcolati in coda a ogni riga (es. importo_eur)."""
+    header = [c.name for c in stmt.selected_columns] + list(extra_columns)
+
+    def rows():
+        for row in _stream_rows(stmt):
+            yield tuple(row) + tuple(extra(row)) if extra else row
+
+    chunks = _csv_chunks if formato == ExportFormat.csv else _ndjson_chunks
+    return StreamingResponse(
+        chunks(header, rows()),
+        media_type=_MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{formato.value}"'},
+    )
+
+
+# ======================================
+# QUERY (stessi filtri delle liste)
+# ======================================
+def spese_query(filters: SpeseFilter, id_dipendente: Optional[int] = None) -> Select:
+    s = models.Spesa
+    stmt = select(s.id, s.id_trasferta, s.categoria, s.importo, s.valuta, s.tipo_scontrino,
+                  s.data_spesa, s.created_at, s.updated_at).order_by(s.id)
+    if id_dipendente is not None or filters.needs_trasferta:
+        stmt = stmt.join(models.Trasferta, s.id_trasferta == models.Trasferta.id)
+    if id_dipendente is not None:
+        stmt = stmt.filter(models.Trasferta.id_dipendente == id_dipendente)
+    return filters.apply(stmt)
+
+
+def trasferte_query(filters: TrasferteFilter, id_dipendente: Optional[int] = None) -> Select:
+    stmt = select(*models.Trasferta.__table__.columns).order_by(models.Trasferta.id)
+    if id_dipendente is not None:
+        stmt = stmt.filter(models.Trasferta.id_dipendente == id_dipendente)
+    return filters.apply(stmt)
+
+
+def prenotazioni_query(filters: PrenotazioniFilter, id_dipendente: Optional[int] = None) -> Select:
+    p = models.Prenotazione
+    stmt = select(*p.__table__.columns).order_by(p.id)
+    if id_dipendente is not None or filters.needs_trasferta:
+        stmt = stmt.join(models.Trasferta, p.id_trasferta == models.Trasferta.id)
+    if id_dipendente is not None:
+        stmt = stmt.filter(models.Trasferta.id_dipendente == id_dipendente)
+    return filters.apply(stmt)
+
+
+def export_spese(filters: SpeseFilter, formato: ExportFormat, id_dipendente: Optional[int] = None) -> StreamingResponse:
+    table = fx.get_table()
+
+    def importo_eur(row):
+        try:
+            return (round(table.to_eur(row.importo, row.valuta, row.data_spesa), 2),)
+        except fx.RateNotFound:
+            return (None,)
+
+    return stream_export(spese_query(filters, id_dipendente), formato, "spese",
+                         extra=importo_eur, extra_columns=["importo_eur"])
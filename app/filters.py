@@ -0,0 +1,124 @@
+# app/filters.py
+from datetime import date
+from typing import Optional
+
+from fastapi import Query
+from sqlalchemy.orm import Query as SAQuery
+
+from app.database import models
+
+# ======================================
+# FILTRI LATO SERVER PER LE LISTE
+# ======================================
+# Dipendenze FastAPI: i parametri diventano query string e apply()
+# aggiunge le condizioni alla query SQLAlchemy.
+
+
+class TrasferteFilter:
+    def __init__(
+        self,
+        stato: Optional[models.StatoTrasfertaEnum] = Query(None),
+        data_da: Optional[date] = Query(None, description="Partenza dal (incluso)"),
+        data_a: Optional[date] = Query(None, description="Partenza fino al (incluso)"),
+        luogo_destinazione: Optional[str] = Query(None),
+    ):
+        self.stato = stato
+        self.data_da = data_da
+        self.data_a = data_a
+        self.luogo_destinazione = luogo_destinazione
+
+    def apply(self, query: SAQuery) -> SAQuery:
+        if self.stato is not None:
+            query = query.filter(models.Trasferta.stato == self.stato)
+        if self.data_da is not None:
+            query = query.filter(models.Trasferta.data_partenza >= self.data_da)
+        if self.data_a is not None:
+            query = query.filter(models.Trasferta.data_partenza <= self.data_a)
+        if self.luogo_destinazione is not None:
+            query = query.filter(models.Trasferta.luogo_destinazione == self.luogo_destinazione)
+        return query
+
+
+class SpeseFilter:
+    def __init__(
+        self,
+        categoria: Optional[str] = Query(None),
+        id_trasferta: Optional[int] = Query(None),
+        stato: Optional[models.StatoTrasfertaEnum] = Query(None, description="Stato della trasferta"),
+        data_da: Optional[date] = Query(None, description="Data spesa dal (incluso)"),
+        data_a: Optional[date] = Query(None, description="Data spesa fino al (incluso)"),
+    ):
+        self.categoria = categoria
+        self.id_trasferta = id_trasferta
+        self.stato = stato
+        self.data_da = data_da
+        self.data_a = data_a
+
+    @property
+    def needs_trasferta(self) -> bool:
+        return self.stato is not None
+
+    def apply(self, query: SAQuery) -> SAQuery:
+        # se stato è valorizzato la query deve già includere il join con Trasferta
+        if self.categoria is not None:
+            query = query.filter(models.Spesa.categoria == self.categoria)
+        if self.id_trasferta is not None:
+            query = query.filter(models.Spesa.id_trasferta == self.id_trasferta)
+        if self.stato is not None:
+            query = query.filter(models.Trasferta.stato == self.stato)
+        if self.data_da is not None:
+            query = query.filter(models.Spesa.data_spesa >= self.data_da)
+        if self.data_a is not None:
+            query = query.filter(models.Spesa.data_spesa <= self.data_a)
+        return query
+
+
+class PrenotazioniFilter:
+    def __init__(
+        self,
+        tipo_mezzo: Optional[models.TipoMezzoEnum] = Query(None),
+        id_trasferta: Optional[int] = Query(None),
+        stato: Optional[models.StatoTrasfertaEnum] = Query(None, description="Stato della trasferta"),
+        data_da: Optional[date] = Query(None, description="Partenza della trasferta dal (incluso)"),
+        data_a: Optional[date] = Query(None, description="Partenza della trasferta fino al (incluso)"),
+    ):
+        self.tipo_mezzo = tipo_mezzo
+        self.id_trasferta = id_trasferta
+        self.stato = stato
+        self.data_da = data_da
+        self.data_a = data_a
+
+    @property
+    def needs_trasferta(self) -> bool:
+        return self.stato is not None or self.data_da is not None or self.data_a is not None
+
+    def apply(self, query: SAQuery) -> SAQuery:
+        # stato e date filtrano sulla trasferta: la query deve includere il join
+        if self.tipo_mezzo is not None:
+            query = query.filter(models.Prenotazione.tipo_mezzo == self.tipo_mezzo)
+        if self.id_trasferta is not None:
+            query = query.filter(models.Prenotazione.id_trasferta == self.id_trasferta)
+        if self.stato is not None:
+            query = query.filter(models.Trasferta.stato == self.stato)
+        if self.data_da is not None:
+            query = query.filter(models.Trasferta.data_partenza >= self.data_da)
+        if self.data_a is not None:
+            query = query.filter(models.Trasferta.data_partenza <= self.data_a)
+        return query
+
+
+class DipendentiFilter:
+    def __init__(
+        self,
+        ruolo: Optional[models.RuoloEnum] = Query(None),
+        area_lavoro: Optional[str] = Query(None),
+    ):
+        self.ruolo = ruolo
+        self.area_lavoro = area_lavoro
+
+    def apply(self, query: SAQuery) -> SAQuery:
+        if self.ruolo is not None:
+            query = query.filter(models.Dipendente.ruolo == self.ruolo)
+        if self.area_lavoro is not None:
+            query = query.filter(models.Dipendente.area_lavoro == self.area_lavoro)
+        return query
@@ -0,0 +1,280 @@
+# app/fx.py
+"""
+Conversione in EUR con una tabella di cambi locale (tabella tassi_cambio).
+
+I tassi seguono la convenzione BCE: unità di valuta per 1 EUR. In memoria,
+per ogni valuta, due array ordinati (giorni, tassi): il tasso di un giorno
+è l'ultimo pubblicato fino a quel giorno (la BCE non pubblica nei festivi)
+e si trova con bisect in O(log n).
+
+La tabella in memoria ha una versione (righe + ultimo import) e viene
+ricaricata quando quella nel DB cambia, controllando al massimo ogni
+FX_RELOAD_TTL secondi; un import nello stesso processo la invalida subito.
+
+Import:
+    python -m app.fx tassi.csv           # data,valuta,tasso  oppure  Date,USD,JPY,... (CSV BCE)
+    python -m app.fx eurofxref-hist.xml  # XML BCE
+"""
+import argparse
+import csv
+import io
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import Session
+
+from app.database import models, session
+
+# ======================================
+# CONFIG
+# ======================================
+VALUTA_BASE = "EUR"
+FX_RELOAD_TTL = float(os.getenv("FX_RELOAD_TTL", 60))
+FX_MEMO_SIZE = int(os.getenv("FX_MEMO_SIZE", 4096))
+IMPORT_BATCH_SIZE = 500
+
+# trasferte che non cambiano più: il totale convertito si può memorizzare
+STATI_CHIUSI = {models.StatoTrasfertaEnum.completata, models.StatoTrasfertaEnum.rifiutata}
+
+Rate = Tuple[str, date, float]  # (valuta, giorno, tasso)
+
+
+class RateNotFound(LookupError):
+    """Nessun tasso per la valuta alla data richiesta (o prima)."""
+
+
+def normalize(valuta: Optional[str]) -> str:
+    return (valuta or VALUTA_BASE).strip().upper()
+
+
+# ======================================
+# TABELLA IN MEMORIA
+# ======================================
+class FxTable:
+    __slots__ = ("version", "_days", "_rates")
+
+    def __init__(self, rows: Iterable[Rate], version: str = ""):
+        self.version = version
+        self._days: Dict[str, List[int]] = defaultdict(list)
+        self._rates: Dict[str, List[float]] = defaultdict(list)
+        for valuta, giorno, tasso in sorted(rows, key=lambda r: (r[0], r[1])):
+            self._days[valuta].append(giorno.toordinal())
+            self._rates[valuta].append(tasso)
+
+    def currencies(self) -> List[str]:
+        return sorted(self._days)
+
+    def rate(self, valuta: str, giorno: date) -> float:
+        valuta = normalize(valuta)
+        if valuta == VALUTA_BASE:
+            return 1.0
+        days = self._days.get(valuta)
+        i = bisect_right(days, giorno.toordinal()) - 1 if days else -1
+        if i < 0:
+            raise RateNotFound(f"Nessun tasso {valuta} al {giorno.isoformat()}")
+        return self._rates[valuta][i]
+
+    def to_eur(self, importo: float, valuta: str, giorno: date) -> float:
+        return importo / self.rate(valuta, giorno)
+
+    def to_eur_many(self, items: Sequence[Tuple[float, str, date]]) -> List[Optional[float]]:
+        """
+        Conversione in blocco di (importo, valuta, giorno): None dove manca il tasso.
+        Le coppie (valuta, giorno) distinte vengono ordinate e risolte scorrendo
+        gli array dei tassi una volta sola per valuta, invece di una ricerca per riga.
+        """
+        wanted: Dict[str, set] = defaultdict(set)
+        for _, valuta, giorno in items:
+            wanted[normalize(valuta)].add(giorno.toordinal())
+
+        resolved: Dict[Tuple[str, int], Optional[float]] = {}
+        for valuta, days in wanted.items():
+            if valuta == VALUTA_BASE:
+                resolved.update(((valuta, d), 1.0) for d in days)
+                continue
+            table_days, rates = self._days.get(valuta, []), self._rates.get(valuta, [])
+            j = -1
+            for d in sorted(days):
+                while j + 1 < len(table_days) and table_days[j + 1] <= d:
+                    j += 1
+                resolved[(valuta, d)] = rates[j] if j >= 0 else None
+
+        out: List[Optional[float]] = []
+        for importo, valuta, giorno in items:
+            tasso = resolved[(normalize(valuta), giorno.toordinal())]
+            out.append(None if tasso is None or importo is None else importo / tasso)
+        return out
+
+
+# ======================================
+# CARICAMENTO E VERSIONE
+# ======================================
+_lock = threading.Lock()
+_table: Optional[FxTable] = None
+_checked_at = 0.0
+_memo: "OrderedDict[tuple, Optional[float]]" = OrderedDict()
+
+
+def _db_version(db: Session) -> str:
+    count, last = db.query(func.count(), func.max(models.TassoCambio.importato_il)).one()
+    return f"{count}:{last.isoformat() if last else ''}"
+
+
+def get_table() -> FxTable:
+    """Tabella corrente; rilegge il DB solo se è cambiata la versione (sincrona: fa I/O)."""
+    global _table, _checked_at
+    now = time.monotonic()
+    with _lock:
+        table, checked_at = _table, _checked_at
+    if table is not None and now - checked_at < FX_RELOAD_TTL:
+        return table
+
+    db = session.SessionLocal()
+    try:
+        version = _db_version(db)
+        if table is None or table.version != version:
+            t = models.TassoCambio
+            table = FxTable(db.query(t.valuta, t.data, t.tasso).all(), version)
+    finally:
+        db.close()
+    with _lock:
+        _table, _checked_at = table, now
+    return table
+
+
+def invalidate() -> None:
+    global _table
+    with _lock:
+        _table = None
+        _memo.clear()
+
+
+# ======================================
+# CONVERSIONI PER REPORT E LISTE
+# ======================================
+def annotate_eur(spese: Sequence[models.Spesa], table: FxTable) -> None:
+    """Imposta spesa.importo_eur (letto da SpesaRead) su tutta la pagina in un colpo."""
+    converted = table.to_eur_many([(s.importo, s.valuta, s.data_spesa) for s in spese])
+    for spesa, eur in zip(spese, converted):
+        spesa.importo_eur = None if eur is None else round(eur, 2)
+
+
+def totale_eur(db: Session, trasferta: models.Trasferta, righe: Sequence[models.TotaleTrasferta]) -> Optional[float]:
+    """
+    Totale della trasferta in EUR a partire da totali_trasferta. Solo le spese in
+    altre valute vanno rilette, raggruppate per (valuta, giorno), per usare il
+    tasso del giorno della spesa. None se manca un tasso.
+    """
+    eur = sum(r.totale for r in righe if normalize(r.valuta) == VALUTA_BASE)
+    foreign = sorted({r.valuta for r in righe if normalize(r.valuta) != VALUTA_BASE})
+    if not foreign:
+        return round(eur, 2)
+
+    table = get_table()
+    memo_key = None
+    if trasferta.stato in STATI_CHIUSI:
+        memo_key = (trasferta.id, table.version, tuple((r.voce, r.valuta, r.categoria, r.totale, r.n_voci) for r in righe))
+        with _lock:
+            if memo_key in _memo:
+                _memo.move_to_end(memo_key)
+                return _memo[memo_key]
+
+    s = models.Spesa
+    groups = (
+        db.query(func.sum(s.importo), s.valuta, s.data_spesa)
+        .filter(s.id_trasferta == trasferta.id, s.valuta.in_(foreign))
+        .group_by(s.valuta, s.data_spesa)
+        .all()
+    )
+    converted = table.to_eur_many(groups)
+    result = None if None in converted else round(eur + sum(converted), 2)
+
+    if memo_key is not None:
+        with _lock:
+            _memo[memo_key] = result
+            while len(_memo) > FX_MEMO_SIZE:
+                _memo.popitem(last=False)
+    return result
+
+
+# ======================================
+# IMPORT
+# ======================================
+def parse_csv(text: str) -> Iterator[Rate]:
+    """CSV "lungo" (data,valuta,tasso) oppure "largo" come eurofxref-hist.csv (Date,USD,JPY,...)."""
+    reader = csv.reader(io.StringIO(text))
+    header = [h.strip().lower() for h in next(reader, [])]
+    if {"data", "valuta", "tasso"} <= set(header):
+        i_data, i_valuta, i_tasso = header.index("data"), header.index("valuta"), header.index("tasso")
+        for row in reader:
+            if row:
+                yield normalize(row[i_valuta]), date.fromisoformat(row[i_data].strip()), float(row[i_tasso])
+        return
+    currencies = [normalize(h) for h in header[1:]]
+    for row in reader:
+        if not row:
+            continue
+        giorno = date.fromisoformat(row[0].strip())
+        for valuta, value in zip(currencies, row[1:]):
+            value = value.strip()
+            if valuta and value and value.upper() != "N/A":
+                yield valuta, giorno, float(value)
+
+
+def parse_ecb_xml(data: bytes) -> Iterator[Rate]:
+    """<Cube time="..."><Cube currency="USD" rate="1.09"/>...</Cube> (namespace ignorato)."""
+    giorno = None
+    for event, elem in ET.iterparse(io.BytesIO(data), events=("start",)):
+        if not elem.tag.endswith("Cube"):
+            continue
+        if "time" in elem.attrib:
+            giorno = date.fromisoformat(elem.attrib["time"])
+        elif "currency" in elem.attrib and giorno is not None:
+            rate = elem.get("rate")
+            if rate is None:
+                raise ValueError(f"Cube {elem.attrib['currency']!r} del {giorno} senza attributo rate")
+            yield normalize(elem.attrib["currency"]), giorno, float(rate)
+
+
+def parse_file(data: bytes, filename: str = "") -> List[Rate]:
+    if filename.lower().endswith(".xml") or data.lstrip().startswith(b"<"):
+        return list(parse_ecb_xml(data))
+    return list(parse_csv(data.decode("utf-8-sig")))
+
+
+def import_rates(rows: Iterable[Rate], engine=None) -> int:
+    """Inserisce o sostituisce i tassi (stessa valuta e giorno) in un'unica transazione."""
+    engine = engine or session.engine
+    table = models.TassoCambio.__table__
+    now = datetime.utcnow()
+    rows = list({(v, g): (v, g, t) for v, g, t in rows}.values())  # l'ultimo vince
+    with engine.begin() as conn:
+        for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+            batch = rows[start:start + IMPORT_BATCH_SIZE]
+            conn.execute(table.delete().where(tuple_(table.c.valuta, table.c.data).in_([(v, g) for v, g, _ in batch])))
+            conn.execute(table.insert(), [
+                {"valuta": v, "data": g, "tasso": t, "importato_il": now} for v, g, t in batch
+            ])
+    invalidate()
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa tassi di cambio (CSV o XML BCE)")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+    for path in args.files:
+        with open(path, "rb") as f:
+            count = import_rates(parse_file(f.read(), path))
+        print(f"{path}: {count} tassi importati")
+
+
+if __name__ == "__main__":
+    main()
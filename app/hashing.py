@@ -0,0 +1,128 @@
+# app/hashing.py
+"""
+Hash e verifica delle password (bcrypt) in un pool di processi dedicato.
+
+bcrypt costa 100-300 ms di CPU per chiamata: eseguito nei worker del pool
+non occupa il processo dell'API. Il numero di operazioni in corso + in coda
+è limitato; oltre il limite si fallisce subito con PasswordPoolSaturated
+invece di accodare all'infinito. Anche l'attesa oltre PASSWORD_POOL_TIMEOUT
+finisce in PasswordPoolSaturated (sottoclasse PasswordPoolTimeout): il posto
+nel pool resta occupato finché il worker non ha davvero finito.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+# ======================================
+# CONFIG
+# ======================================
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# 0 = nessun pool, hash calcolato nel thread chiamante
+PASSWORD_POOL_SIZE = int(os.getenv("PASSWORD_POOL_SIZE", min(4, os.cpu_count() or 1)))
+PASSWORD_POOL_QUEUE = int(os.getenv("PASSWORD_POOL_QUEUE", 16))
+PASSWORD_POOL_TIMEOUT = float(os.getenv("PASSWORD_POOL_TIMEOUT", 10))
+
+# min = max = default: un hash con un costo diverso da BCRYPT_ROUNDS
+# risulta "da aggiornare" e viene ricalcolato al login successivo
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordPoolSaturated(RuntimeError):
+    """Troppe operazioni bcrypt in corso o in coda."""
+
+
+class PasswordPoolTimeout(PasswordPoolSaturated):
+    """Operazione bcrypt non completata entro PASSWORD_POOL_TIMEOUT."""
+
+
+# ======================================
+# FUNZIONI ESEGUITE NEI WORKER
+# ======================================
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed)
+
+
+# ======================================
+# POOL
+# ======================================
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(1, PASSWORD_POOL_SIZE + PASSWORD_POOL_QUEUE))
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: il server ha già dei thread attivi, fork non è sicuro
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_POOL_SIZE,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+
+def _run(fn, *args):
+    if PASSWORD_POOL_SIZE <= 0:
+        return fn(*args)
+    if not _slots.acquire(blocking=False):
+        raise PasswordPoolSaturated("Troppe richieste di autenticazione in corso")
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    # il posto si libera quando il lavoro finisce (o viene annullato), non quando
+    # il chiamante smette di aspettare: così il semaforo limita davvero la coda
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=PASSWORD_POOL_TIMEOUT)
+    except FutureTimeoutError:
+        future.cancel()  # se è ancora in coda non parte più
+        raise PasswordPoolTimeout("Autenticazione non completata in tempo")
+
+
+def _noop() -> None:
+    return None
+
+
+def start_pool() -> None:
+    # avvia subito i worker: lo spawn costa ~1s e non deve pesare sui primi login
+    if PASSWORD_POOL_SIZE > 0:
+        executor = _get_executor()
+        for future in [executor.submit(_noop) for _ in range(PASSWORD_POOL_SIZE)]:
+            future.result()
+
+
+def hash_password(password: str) -> str:
+    return _run(_hash, password)
+
+
+def verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """
+    Ritorna (valida, nuovo_hash): nuovo_hash non è None se l'hash salvato
+    usa parametri diversi da quelli correnti e va sostituito.
+    """
+    return _run(_verify_and_update, password, hashed)
+
+
+def shutdown_pool() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -1,7 +1,12 @@
+import os
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import auth, transfers, expenses, bookings, admin
-from app.database.session import create_tables
+from app.routers import auth, transfers, expenses, bookings, admin, analytics
+from app.database.migrations import upgrade_database
+from app.hashing import shutdown_pool, start_pool
+from app import metrics, profiling
+from app.pagination import NEXT_CURSOR_HEADER
 
 app = FastAPI(
     title="Applicazione Trasferte",
@@ -20,21 +25,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# Metriche Prometheus su /metrics e log delle query lente (METRICS_ENABLED=0 per spegnere)
+metrics.install(app)
+# Profilazione a richiesta con l'header X-Profile (PROFILING_ENABLED=1, vedi app/profiling.py)
+profiling.install(app)
+
 # Routers
 app.include_router(auth.router)
 app.include_router(transfers.router)
 app.include_router(expenses.router)
 app.include_router(bookings.router)
 app.include_router(admin.router)
+app.include_router(analytics.router)
 
 # ======================================
-# CREAZIONE TABELLE AUTOMATICA ALL'AVVIO
+# MIGRAZIONI AUTOMATICHE ALL'AVVIO
 # ======================================
+# 0 = schema gestito a mano con "alembic upgrade head" prima del deploy
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+
 @app.on_event("startup")
 def on_startup():
-    create_tables()
+    if DB_AUTO_MIGRATE:
+        upgrade_database()
+    start_pool()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    shutdown_pool()
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,248 @@
+# app/metrics.py
+"""
+Metriche in formato Prometheus su GET /metrics e log delle query lente.
+
+- MetricsMiddleware (ASGI puro, non rompe le risposte in streaming): per
+  route (il template, es. /trasferte/{trasferta_id}) e metodo registra
+  durata, status, byte caricati e richieste in corso.
+- Hook before/after_cursor_execute su tutti gli Engine (anche quello
+  asincrono): numero di query e tempo di DB per richiesta, attribuiti con
+  una contextvar che segue la richiesta anche nel threadpool.
+- Query più lente di SLOW_QUERY_MS: warning sul logger app.metrics con
+  route e SQL (senza parametri, possono contenere dati personali).
+
+Le metriche sono per processo: con più worker ognuno ha le sue.
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Dict, Optional, Sequence, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# ======================================
+# CONFIG
+# ======================================
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+SLOW_QUERY_MAX_SQL = 2000  # caratteri di SQL riportati nel log
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+UNMATCHED = "<unmatched>"  # 404: il percorso grezzo farebbe esplodere le etichette
+
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+# ======================================
+# REGISTRO
+# ======================================
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Contatori, gauge e istogrammi con etichette; render() nel formato testuale Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}  # nome -> (tipo, descrizione)
+        self._values: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = defaultdict(dict)
+        self._buckets: Dict[str, Sequence[float]] = {}
+
+    def counter(self, name: str, doc: str) -> None:
+        self._help[name] = ("counter", doc)
+
+    def gauge(self, name: str, doc: str) -> None:
+        self._help[name] = ("gauge", doc)
+
+    def histogram(self, name: str, doc: str, buckets: Sequence[float]) -> None:
+        self._help[name] = ("histogram", doc)
+        self._buckets[name] = buckets
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1.0) -> None:
+        with self._lock:
+            series = self._values[name]
+            series[labels] = series.get(labels, 0.0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        with self._lock:
+            series = self._histograms[name]
+            hist = series.get(labels)
+            if hist is None:
+                hist = series[labels] = _Histogram(self._buckets[name])
+            hist.observe(value)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, doc) in self._help.items():
+                lines.append(f"# HELP {name} {doc}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "histogram":
+                    for labels, hist in sorted(self._histograms[name].items()):
+                        cumulative = 0
+                        for bound, n in zip(hist.buckets, hist.counts):
+                            cumulative += n
+                            lines.append(f"{name}_bucket{_fmt(labels + (('le', _num(bound)),))} {cumulative}")
+                        lines.append(f"{name}_bucket{_fmt(labels + (('le', '+Inf'),))} {hist.count}")
+                        lines.append(f"{name}_sum{_fmt(labels)} {_num(hist.sum)}")
+                        lines.append(f"{name}_count{_fmt(labels)} {hist.count}")
+                else:
+                    for labels, value in sorted(self._values[name].items()):
+                        lines.append(f"{name}{_fmt(labels)} {_num(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _num(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _fmt(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+registry = Registry()
+registry.counter("http_requests_total", "Richieste HTTP completate")
+registry.histogram("http_request_duration_seconds", "Durata delle richieste HTTP", LATENCY_BUCKETS)
+registry.gauge("http_requests_in_progress", "Richieste HTTP in corso")
+registry.counter("http_request_body_bytes_total", "Byte ricevuti nel corpo delle richieste (upload)")
+registry.histogram("db_queries_per_request", "Query SQL eseguite per richiesta", QUERY_COUNT_BUCKETS)
+registry.histogram("db_time_per_request_seconds", "Tempo passato nel DB per richiesta", LATENCY_BUCKETS)
+registry.counter("db_queries_total", "Query SQL eseguite (anche fuori dalle richieste)")
+registry.counter("db_slow_queries_total", f"Query oltre SLOW_QUERY_MS ({SLOW_QUERY_MS:g} ms)")
+
+
+# ======================================
+# STATO PER RICHIESTA
+# ======================================
+class _RequestStats:
+    __slots__ = ("scope", "queries", "db_time")
+
+    def __init__(self, scope):
+        self.scope = scope  # lo stesso dict che il router completa con "route"
+        self.queries = 0
+        self.db_time = 0.0
+
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or UNMATCHED
+
+
+_current: contextvars.ContextVar[Optional[_RequestStats]] = contextvars.ContextVar("metrics_request", default=None)
+
+
+# ======================================
+# HOOK SQLALCHEMY
+# ======================================
+_START = "metrics.query_start"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault(_START, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    starts = conn.info.get(_START)
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = _current.get()
+    route = stats.route() if stats is not None else None
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+    registry.inc("db_queries_total")
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        registry.inc("db_slow_queries_total", (("route", route or "-"),))
+        sql = " ".join(statement.split())
+        logger.warning("query lenta %.1f ms [%s] %s", elapsed * 1000, route or "fuori richiesta",
+                       sql[:SLOW_QUERY_MAX_SQL])
+
+
+# ======================================
+# MIDDLEWARE
+# ======================================
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = _RequestStats(scope)
+        token = _current.set(stats)
+        status = 500
+        body_bytes = 0
+
+        async def receive_counting():
+            nonlocal body_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                body_bytes += len(message.get("body", b""))
+            return message
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        registry.inc("http_requests_in_progress", value=1)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_counting, send_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            registry.inc("http_requests_in_progress", value=-1)
+            _current.reset(token)
+            labels = (("method", scope["method"]), ("route", stats.route()))
+            registry.inc("http_requests_total", labels + (("status", str(status)),))
+            registry.observe("http_request_duration_seconds", labels, elapsed)
+            registry.observe("db_queries_per_request", labels, stats.queries)
+            registry.observe("db_time_per_request_seconds", labels, stats.db_time)
+            if body_bytes:
+                registry.inc("http_request_body_bytes_total", labels, body_bytes)
+
+
+def metrics_endpoint(request: Request) -> Response:
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+
+def install(app) -> None:
+    """Middleware, hook sugli Engine e GET /metrics (fuori dallo schema OpenAPI)."""
+    if not METRICS_ENABLED:
+        return
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
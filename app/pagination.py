@@ -0,0 +1,109 @@
+# app/pagination.py
+import base64
+import enum
+import os
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Query as SAQuery
+
+# ======================================
+# CONFIG
+# ======================================
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 100))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 500))
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class SortOrder(str, enum.Enum):
+    asc = "asc"
+    desc = "desc"
+
+
+# ======================================
+# CURSORE (created_at, id)
+# ======================================
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursore non valido")
+
+
+# ======================================
+# DIPENDENZA PAGINAZIONE
+# ======================================
+class PageParams:
+    """
+    Paginazione keyset su (created_at, id): il costo di una pagina non dipende
+    da quante righe la precedono. Il cursore della pagina successiva viene
+    restituito nell'header X-Next-Cursor (assente sull'ultima pagina).
+    """
+
+    def __init__(
+        self,
+        response: Response,
+        cursor: Optional[str] = Query(None, description="Valore di X-Next-Cursor della pagina precedente"),
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, description=f"Righe per pagina (max {PAGE_SIZE_MAX})"),
+        order: SortOrder = Query(SortOrder.desc, description="Ordinamento per data di creazione"),
+    ):
+        self.response = response
+        self.cursor = cursor
+        self.limit = min(limit, PAGE_SIZE_MAX)
+        self.order = order
+
+
+def _keyset(query, model, page: PageParams):
+    # vale sia per Query (sync) sia per select() (async): entrambi hanno filter/order_by/limit
+    key = tuple_(model.created_at, model.id)
+    if page.cursor:
+        after = tuple_(*decode_cursor(page.cursor))
+        query = query.filter(key > after if page.order == SortOrder.asc else key < after)
+
+    if page.order == SortOrder.asc:
+        query = query.order_by(model.created_at.asc(), model.id.asc())
+    else:
+        query = query.order_by(model.created_at.desc(), model.id.desc())
+    return query.limit(page.limit + 1)
+
+
+def _trim(rows: list, page: PageParams) -> list:
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        last = rows[-1]
+        page.response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.created_at, last.id)
+    return rows
+
+
+def paginate(query: SAQuery, model, page: Optional[PageParams] = None) -> list:
+    """
+    Applica ordinamento, cursore e limite a una query su un modello con
+    created_at e id. Senza page ritorna tutte le righe (uso interno).
+    """
+    if page is None:
+        return query.all()
+    return _trim(_keyset(query, model, page).all(), page)
+
+
+async def paginate_async(db: AsyncSession, stmt: Select, model, page: Optional[PageParams] = None,
+                         scalars: bool = True) -> list:
+    """
+    Come paginate(), per select() eseguite su una AsyncSession.
+    scalars=False per select di colonne: ritorna le righe (tuple) intere.
+    """
+    if page is not None:
+        stmt = _keyset(stmt, model, page)
+    result = await db.execute(stmt)
+    rows = result.scalars().all() if scalars else result.all()
+    return rows if page is None else _trim(list(rows), page)
@@ -0,0 +1,232 @@
+# app/profiling.py
+"""
+Profilazione a richiesta di una singola chiamata.
+
+Con PROFILING_ENABLED=1, una richiesta con l'header X-Profile viene
+profilata se l'header contiene PROFILE_TOKEN oppure se arriva con un
+Bearer token di un admin. In PROFILE_DIR finiscono due file per richiesta:
+
+- <id>.folded: stack campionati nel formato "collassato" (frame;frame;... n),
+  da aprire con flamegraph.pl, speedscope o inferno;
+- <id>.sql: le query SQL della richiesta con la durata (senza parametri).
+
+L'id torna nell'header di risposta X-Profile ("busy" se un'altra
+profilazione è in corso: ne gira una alla volta). Si tengono gli ultimi
+PROFILE_KEEP profili, i più vecchi vengono cancellati.
+
+Il campionatore è un thread che legge gli stack di tutti i thread ogni
+PROFILE_INTERVAL_MS: copre sia l'event loop sia il threadpool degli
+endpoint sincroni, ma vede anche le richieste concorrenti (va usato su
+un'istanza poco carica o accettando un po' di rumore).
+
+Con PROFILING_ENABLED=0 (default) il middleware e gli hook SQL non vengono
+nemmeno installati.
+"""
+import contextvars
+import hmac
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.concurrency import run_in_threadpool
+
+from app.database import models
+from app.tokens import authenticate_token
+
+# ======================================
+# CONFIG
+# ======================================
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")  # vuoto = solo admin
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 50))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+
+PROFILE_HEADER = "X-Profile"
+
+# funzioni in cima allo stack di un thread fermo (event loop in attesa,
+# worker del threadpool senza lavoro): quei campioni non dicono niente
+_IDLE_FRAMES = {("selectors.py", "select"), ("threading.py", "wait"),
+                ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get")}
+
+
+# ======================================
+# CAMPIONATORE
+# ======================================
+def _short_path(path: str) -> str:
+    # percorso relativo alla voce di sys.path più lunga che lo contiene
+    for prefix in _SYS_PATHS:
+        if path.startswith(prefix):
+            return path[len(prefix):]
+    return path
+
+
+_SYS_PATHS = sorted((os.path.join(os.path.abspath(p), "") for p in sys.path if p), key=len, reverse=True)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(name="profiler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop_event.wait(self.interval):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                code = frame.f_code
+                if ident == me or (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+
+# ======================================
+# QUERY DELLA RICHIESTA
+# ======================================
+class _Profile:
+    def __init__(self, profile_id: str):
+        self.id = profile_id
+        self.queries: List[Tuple[float, str]] = []  # (secondi, sql)
+
+
+_current: contextvars.ContextVar[Optional[_Profile]] = contextvars.ContextVar("profiling_request", default=None)
+_START = "profiling.query_start"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    if _current.get() is not None:
+        conn.info.setdefault(_START, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    profile = _current.get()
+    starts = conn.info.get(_START)
+    if profile is None or not starts:
+        return
+    profile.queries.append((time.perf_counter() - starts.pop(), statement))
+
+
+# ======================================
+# SCRITTURA E ROTAZIONE
+# ======================================
+def _write(profile: _Profile, sampler: _Sampler, request_line: str, elapsed: float) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile.id)
+    with open(base + ".folded", "w", encoding="utf-8") as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(base + ".sql", "w", encoding="utf-8") as f:
+        db_time = sum(t for t, _ in profile.queries)
+        f.write(f"-- {request_line}\n")
+        f.write(f"-- durata {elapsed * 1000:.1f} ms, {sampler.samples} campioni ogni {PROFILE_INTERVAL_MS:g} ms\n")
+        f.write(f"-- {len(profile.queries)} query, {db_time * 1000:.1f} ms nel DB\n\n")
+        for seconds, statement in profile.queries:
+            f.write(f"-- {seconds * 1000:.2f} ms\n{statement.strip()};\n\n")
+    _rotate()
+
+
+def _rotate() -> None:
+    ids = sorted({os.path.splitext(name)[0] for name in os.listdir(PROFILE_DIR)
+                  if name.endswith((".folded", ".sql"))})
+    for old in ids[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else ids:
+        for ext in (".folded", ".sql"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, old + ext))
+            except FileNotFoundError:
+                pass
+
+
+# ======================================
+# MIDDLEWARE
+# ======================================
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _allowed(scope, value: str) -> bool:
+    if PROFILE_TOKEN and hmac.compare_digest(value.encode(), PROFILE_TOKEN.encode()):
+        return True
+    authorization = _header(scope, b"authorization") or ""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    user = authenticate_token(token.strip())
+    return user is not None and user.ruolo == models.RuoloEnum.admin
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        value = _header(scope, PROFILE_HEADER.lower().encode()) if scope["type"] == "http" else None
+        if value is None or not await run_in_threadpool(_allowed, scope, value):
+            return await self.app(scope, receive, send)
+        if not self._busy.acquire(blocking=False):
+            return await self.app(scope, receive, _with_header(send, "busy"))
+
+        profile = _Profile(f"{datetime.now():%Y%m%d-%H%M%S-%f}-{secrets.token_hex(3)}")
+        sampler = _Sampler(PROFILE_INTERVAL_MS / 1000)
+        token = _current.set(profile)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, _with_header(send, profile.id))
+        finally:
+            sampler.stop()
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            try:
+                request_line = f"{scope['method']} {scope['path']}"
+                await run_in_threadpool(_write, profile, sampler, request_line, elapsed)
+            finally:
+                self._busy.release()
+
+
+def _with_header(send, value: str):
+    async def send_with_header(message):
+        if message["type"] == "http.response.start":
+            message = {**message, "headers": [*message.get("headers", []),
+                                              (PROFILE_HEADER.lower().encode(), value.encode("latin-1"))]}
+        await send(message)
+    return send_with_header
+
+
+def install(app) -> None:
+    if not PROFILING_ENABLED:
+        return
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    app.add_middleware(ProfilingMiddleware)
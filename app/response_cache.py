@@ -0,0 +1,172 @@
+# app/response_cache.py
+"""
+Cache delle risposte GET più richieste (liste per dropdown e polling), con
+ETag debole e If-None-Match -> 304.
+
+Ogni tabella ha un contatore di generazione in memoria, incrementato dopo
+ogni commit che l'ha toccata (listener su Session, vale anche per
+AsyncSession, compresi INSERT/UPDATE/DELETE in blocco via ORM) oppure a mano con bump() per le scritture Core. Una voce in
+cache vale finché le generazioni delle sue tabelle sono quelle lette prima
+della query: in quel caso la risposta (anche il 304) esce senza toccare
+l'ORM né rifare la serializzazione.
+
+L'ETag è l'hash del corpo, quindi è lo stesso in tutti i worker. Le
+generazioni invece sono per processo: con più worker una scrittura fatta
+altrove si vede al più dopo RESPONSE_CACHE_TTL secondi, quando la voce
+viene comunque ricalcolata.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+from fastapi import Request, Response, status
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.pagination import NEXT_CURSOR_HEADER
+from app.responses import etag_matches
+
+# ======================================
+# CONFIG
+# ======================================
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 512))            # voci nella LRU
+RESPONSE_CACHE_MAX_BODY = int(os.getenv("RESPONSE_CACHE_MAX_BODY", 1 << 20))  # corpi più grandi non si tengono
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 30))              # conta con più worker/processi
+
+# dati per utente: i proxy condivisi non devono tenerli, il client rivalida sempre
+CACHE_CONTROL = "private, no-cache"
+
+_CACHED_HEADERS = (NEXT_CURSOR_HEADER,)
+
+
+# ======================================
+# GENERAZIONI PER TABELLA
+# ======================================
+_lock = threading.Lock()
+_generations: Dict[str, int] = defaultdict(int)
+_TOUCHED = "response_cache.tables"
+
+
+def bump(*tables: str) -> None:
+    """Da chiamare dopo il commit di scritture che non passano dall'ORM."""
+    with _lock:
+        for table in tables:
+            _generations[table] += 1
+
+
+def generations(tables: Sequence[str]) -> Tuple[int, ...]:
+    with _lock:
+        return tuple(_generations[t] for t in tables)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, flush_context) -> None:
+    touched = session.info.setdefault(_TOUCHED, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table is not None:
+            touched.add(table)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _do_orm_execute(orm_execute_state) -> None:
+    # INSERT/UPDATE/DELETE in blocco via ORM: non passano dal flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            orm_execute_state.session.info.setdefault(_TOUCHED, set()).add(mapper.local_table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    # dopo il commit, non al flush: chi legge nel frattempo vede ancora i dati
+    # vecchi e deve salvarli con la generazione vecchia
+    touched = session.info.pop(_TOUCHED, None)
+    if touched:
+        bump(*touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session) -> None:
+    session.info.pop(_TOUCHED, None)
+
+
+# ======================================
+# LRU DELLE RISPOSTE
+# ======================================
+class _Entry:
+    __slots__ = ("generations", "stored_at", "etag", "body", "headers")
+
+    def __init__(self, generations: Tuple[int, ...], etag: str, body: bytes, headers: Dict[str, str]):
+        self.generations = generations
+        self.stored_at = time.monotonic()
+        self.etag = etag
+        self.body = body
+        self.headers = headers
+
+
+_cache: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+
+
+def clear() -> None:
+    with _lock:
+        _cache.clear()
+
+
+def _lookup(key: Hashable, gens: Tuple[int, ...]) -> Optional[_Entry]:
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if entry.generations != gens or now - entry.stored_at >= RESPONSE_CACHE_TTL:
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return entry
+
+
+def _store(key: Hashable, entry: _Entry) -> None:
+    if len(entry.body) > RESPONSE_CACHE_MAX_BODY:
+        return
+    with _lock:
+        _cache[key] = entry
+        _cache.move_to_end(key)
+        while len(_cache) > RESPONSE_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _response(request: Request, entry: _Entry) -> Response:
+    headers = {**entry.headers, "ETag": f"W/{entry.etag}", "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+
+def cached_list(
+    request: Request,
+    tables: Sequence[str],
+    load: Callable[[], bytes],
+    response: Optional[Response] = None,
+    user_id: Optional[int] = None,
+) -> Response:
+    """
+    Risposta di una lista GET, dalla cache se le tabelle non sono cambiate.
+    Chiave: percorso, utente (None per le liste uguali per tutti) e query string.
+    load() esegue la query e ritorna il corpo JSON, solo in caso di miss;
+    response è quello della paginazione, da cui si copia X-Next-Cursor.
+    """
+    key = (request.url.path, user_id, tuple(sorted(request.query_params.multi_items())))
+    gens = generations(tables)  # prima della query: una scrittura concorrente invalida la voce
+    entry = _lookup(key, gens)
+    if entry is None:
+        body = load()
+        headers = {}
+        if response is not None:
+            headers = {h: response.headers[h] for h in _CACHED_HEADERS if h in response.headers}
+        entry = _Entry(gens, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"', body, headers)
+        _store(key, entry)
+    return _response(request, entry)
@@ -0,0 +1,112 @@
+# app/responses.py
+from typing import Optional, Tuple
+
+from fastapi import Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
+
+from app.storage import AttachmentStore
+
+# gli allegati sono immutabili (indirizzati per hash): il client può tenerli in cache
+ATTACHMENT_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta un header Range "bytes=a-b" (singolo intervallo).
+    Ritorna (start, end) inclusivi, None se l'header è assente/non gestito
+    (si risponde con il file intero), RangeNotSatisfiable se fuori dal file.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        return None  # multi-range: non supportato, file intero
+    start_s, sep, end_s = spec.partition("-")
+    if not sep:
+        return None
+    try:
+        if start_s == "":
+            # suffisso: ultimi N byte
+            suffix = int(end_s)
+            start, end = max(0, size - suffix), size - 1
+            if suffix <= 0:
+                start = size
+        else:
+            start = int(start_s)
+            end = min(int(end_s), size - 1) if end_s else size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # confronto debole, come richiesto da RFC 9110 per If-None-Match
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates
+
+
+def attachment_response(
+    request: Request,
+    store: AttachmentStore,
+    digest: str,
+    size: int,
+    media_type: Optional[str],
+    filename: str,
+) -> Response:
+    """
+    Risposta per il download di un allegato:
+    - ETag forte = hash del contenuto, 304 con If-None-Match
+    - Range singolo -> 206 (If-Range rispettato)
+    - file intero servito da disco (pathsend/sendfile se il server lo supporta)
+    """
+    etag = f'"{digest}"'
+    media_type = media_type or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Cache-Control": ATTACHMENT_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range.strip() == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{size}"},
+            )
+
+    if byte_range is not None:
+        start, end = byte_range
+        length = end - start + 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(
+            store.iter_content(digest, start=start, length=length),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=media_type,
+            headers=headers,
+        )
+
+    path = store.local_path(digest)
+    if path is not None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(store.iter_content(digest), media_type=media_type, headers=headers)
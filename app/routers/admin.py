@@ -1,39 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File
 from sqlalchemy.orm import Session
 from typing import List
+from app import fx, response_cache
 from app.database import models, schemas, session
-from app.dependencies import get_db, require_role
+from app.dependencies import CurrentUser, get_db, require_role
+from app.filters import DipendentiFilter
+from app.pagination import PageParams, paginate
+from app.serialization import RowSerializer, json_list_response
 from app.routers.auth import get_password_hash
+from app.tokens import invalidate_user
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
+# liste: solo le colonne di DipendenteRead (mai la password), senza passare da Pydantic
+_LIST_JSON = RowSerializer(schemas.DipendenteRead, models.Dipendente)
+
 # ==============================
 # LISTA TUTTI GLI UTENTI
 # ==============================
 @router.get("/utenti", response_model=List[schemas.DipendenteRead])
 def get_all_users(
+    filters: DipendentiFilter = Depends(),
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
-    current_user: models.Dipendente = Depends(require_role(["admin"]))
+    current_user: CurrentUser = Depends(require_role(["admin"]))
 ):
     """
     Lista tutti gli utenti (solo admin può accedere)
     """
-    return db.query(models.Dipendente).all()
+    query = db.query(*_LIST_JSON.columns)
+    return json_list_response(_LIST_JSON.dumps(paginate(filters.apply(query), models.Dipendente, page)), page.response)
 
 
 # ==============================
 # LISTA DIPENDENTI (pubblico / test senza autenticazione)
 # ==============================
 @router.get("/dipendenti", response_model=List[schemas.DipendenteRead])
-def list_dipendenti(db: Session = Depends(get_db)):
+def list_dipendenti(
+    request: Request,
+    filters: DipendentiFilter = Depends(),
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db)
+):
     """
-    Restituisce tutti i dipendenti.
+    Restituisce i dipendenti, paginati (vedi header X-Next-Cursor).
     Utile per popolare dropdown nel frontend durante i test.
     Al momento non richiede autenticazione.
     In futuro, puoi aggiungere:
-        current_user: models.Dipendente = Depends(require_role(["admin"]))
+        current_user: CurrentUser = Depends(require_role(["admin"]))
+    Risposta in cache con ETag finché la tabella dipendenti non cambia.
     """
-    return db.query(models.Dipendente).all()
+    return response_cache.cached_list(
+        request, ["dipendenti"],
+        lambda: _LIST_JSON.dumps(paginate(filters.apply(db.query(*_LIST_JSON.columns)), models.Dipendente, page)),
+        response=page.response,
+    )
 
 
 # ==============================
@@ -47,7 +68,7 @@ def reset_user_password(
     user_id: int,
     req: PasswordResetRequest,
     db: Session = Depends(get_db),
-    current_user: models.Dipendente = Depends(require_role(["admin"]))
+    current_user: CurrentUser = Depends(require_role(["admin"]))
 ):
     user = db.query(models.Dipendente).filter(models.Dipendente.id == user_id).first()
     if not user:
@@ -55,8 +76,10 @@ def reset_user_password(
 
     hashed_password = get_password_hash(req.new_password)
     user.password = hashed_password
+    user.token_version = (user.token_version or 0) + 1  # revoca i token già emessi
     db.commit()
     db.refresh(user)
+    invalidate_user(user.id, user.token_version)
     return user
 
 
@@ -71,13 +94,31 @@ def update_user_role(
     user_id: int,
     req: RoleUpdateRequest,
     db: Session = Depends(get_db),
-    current_user: models.Dipendente = Depends(require_role(["admin"]))
+    current_user: CurrentUser = Depends(require_role(["admin"]))
 ):
     user = db.query(models.Dipendente).filter(models.Dipendente.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="Utente non trovato")
 
     user.ruolo = req.ruolo
+    user.token_version = (user.token_version or 0) + 1  # il ruolo è nel token: va riemesso
     db.commit()
     db.refresh(user)
+    invalidate_user(user.id, user.token_version)
     return user
+
+
+# ==============================
+# IMPORT TASSI DI CAMBIO (CSV o XML BCE)
+# ==============================
+@router.post("/tassi-cambio")
+def import_tassi_cambio(
+    file: UploadFile = File(...),
+    current_user: CurrentUser = Depends(require_role(["admin"]))
+):
+    try:
+        rows = fx.parse_file(file.file.read(), file.filename or "")
+    except (ValueError, IndexError, SyntaxError) as exc:  # ET.ParseError è una SyntaxError
+        raise HTTPException(status_code=400, detail=f"File tassi non valido: {exc}")
+    count = fx.import_rates(rows)
+    return {"importati": count, "valute": fx.get_table().currencies()}
@@ -0,0 +1,30 @@
+from datetime import date
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.database import schemas
+from app.database.rollup import Dimensione, analytics
+from app.dependencies import CurrentUser, get_db, require_role
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+# ==============================
+# MANAGER/ADMIN: spesa aggregata per le dashboard
+# ==============================
+@router.get("/spese", response_model=schemas.SpeseAnalytics)
+def spese_analytics(
+    group_by: List[Dimensione] = Query([Dimensione.mese]),
+    data_da: Optional[date] = Query(None, description="Data spesa dal (incluso)"),
+    data_a: Optional[date] = Query(None, description="Data spesa fino al (incluso)"),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(require_role(["manager", "admin"]))
+):
+    """
+    Totali, conteggi e percentili per le dimensioni in group_by, sempre divisi per valuta.
+    Con intervalli a mesi interi (o senza intervallo) legge il rollup mensile,
+    altrimenti aggrega direttamente le spese con GROUP BY.
+    """
+    fonte, gruppi = analytics(db, group_by, data_da, data_a)
+    return {"fonte": fonte, "gruppi": gruppi}
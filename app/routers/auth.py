@@ -1,19 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
-from jose import JWTError, jwt
 from app.database import models, schemas, session
+from app.hashing import PasswordPoolSaturated, hash_password, pwd_context, verify_and_update
+from app.tokens import ACCESS_TOKEN_EXPIRE_MINUTES, ALGORITHM, SECRET_KEY, claims_for, create_access_token
 from pydantic import BaseModel
 
 # =========================
 # CONFIG
 # =========================
-SECRET_KEY = "questa_dovrai_cambiarla_con_un_valore_super_segreto"
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# SECRET_KEY, ALGORITHM e la scadenza sono in app/tokens.py (re-esportati qui)
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 # Dipendenza DB
@@ -27,24 +22,29 @@ def get_db():
 # =========================
 # UTILITY
 # =========================
+# bcrypt gira nel pool di app/hashing.py: se è saturo rispondiamo subito 503
+def _password_pool_busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Servizio di autenticazione sovraccarico, riprova tra poco",
+        headers={"Retry-After": "1"},
+    )
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return verify_password_and_update(plain_password, hashed_password)[0]
+
+def verify_password_and_update(plain_password, hashed_password):
+    """Ritorna (valida, nuovo_hash o None)."""
+    try:
+        return verify_and_update(plain_password, hashed_password)
+    except PasswordPoolSaturated:
+        raise _password_pool_busy()
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
-
-def create_access_token(data: dict, expires_delta: timedelta = None):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
-    # Aggiungiamo il ruolo al token
-    if "role" not in to_encode and "sub" in to_encode:
-        db = next(get_db())  # otteniamo sessione db
-        user = db.query(models.Dipendente).filter(models.Dipendente.id == int(to_encode["sub"])).first()
-        if user:
-            to_encode.update({"role": user.ruolo.value})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    try:
+        return hash_password(password)
+    except PasswordPoolSaturated:
+        raise _password_pool_busy()
 
 
 # =========================
@@ -86,8 +86,25 @@ def login(form_data: LoginRequest, db: Session = Depends(get_db)):
     user = db.query(models.Dipendente).filter(models.Dipendente.email == form_data.email).first()
 
     # <-- QUI ALTRA CORREZIONE
-    if not user or not verify_password(form_data.password, user.password):
+    if not user:
+        raise HTTPException(status_code=401, detail="Email o password errati")
+
+    # chiude la transazione di lettura: la connessione torna al pool
+    # mentre bcrypt lavora (può attendere in coda)
+    # claims letti adesso: dopo il commit gli attributi scadono e rileggerli
+    # costerebbe un'altra SELECT
+    hashed_password = user.password
+    claims = claims_for(user)
+    db.commit()
+
+    valid, new_hash = verify_password_and_update(form_data.password, hashed_password)
+    if not valid:
         raise HTTPException(status_code=401, detail="Email o password errati")
+    if new_hash:
+        # costo bcrypt cambiato: aggiorniamo l'hash ora che abbiamo la password in chiaro
+        user.password = new_hash
+        db.commit()
 
-    access_token = create_access_token(data={"sub": str(user.id)})
+    # ruolo e versione dal dipendente già caricato: nessuna query in più
+    access_token = create_access_token(data=claims)
     return {"access_token": access_token, "token_type": "bearer"}
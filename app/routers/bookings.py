@@ -1,13 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from app.database import models, schemas, session
-from app.dependencies import get_db, require_role, get_current_user
+from app import export
+from app.dependencies import CurrentUser, get_db, require_role, get_current_user
+from app.filters import PrenotazioniFilter
+from app.pagination import PageParams, paginate
+from app.serialization import RowSerializer, json_list_response
 import shutil
 import os
 
 router = APIRouter(prefix="/prenotazioni", tags=["prenotazioni"])
 
+# liste: solo le colonne di PrenotazioneRead, come tuple, senza passare da Pydantic
+_LIST_JSON = RowSerializer(schemas.PrenotazioneRead, models.Prenotazione)
+
 UPLOAD_DIR = "uploads/biglietti"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
@@ -19,7 +26,7 @@ def create_prenotazione(
     prenotazione: schemas.PrenotazioneCreate,
     file_biglietto: UploadFile = File(None),
     db: Session = Depends(get_db),
-    current_user: models.Dipendente = Depends(require_role(["dipendente", "manager", "admin"]))
+    current_user: CurrentUser = Depends(require_role(["dipendente", "manager", "admin"]))
 ):
     trasferta = db.query(models.Trasferta).filter(models.Trasferta.id == prenotazione.id_trasferta).first()
     if not trasferta or trasferta.id_dipendente != current_user.id:
@@ -49,17 +56,45 @@ def create_prenotazione(
 # ==============================
 @router.get("/mie", response_model=List[schemas.PrenotazioneRead])
 def get_my_prenotazioni(
+    filters: PrenotazioniFilter = Depends(),
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
-    current_user: models.Dipendente = Depends(require_role(["dipendente", "manager", "admin"]))
+    current_user: CurrentUser = Depends(require_role(["dipendente", "manager", "admin"]))
 ):
-    return db.query(models.Prenotazione).join(models.Trasferta).filter(models.Trasferta.id_dipendente == current_user.id).all()
+    query = (
+        db.query(*_LIST_JSON.columns)
+        .join(models.Trasferta, models.Prenotazione.id_trasferta == models.Trasferta.id)
+        .filter(models.Trasferta.id_dipendente == current_user.id)
+    )
+    return json_list_response(_LIST_JSON.dumps(paginate(filters.apply(query), models.Prenotazione, page)), page.response)
 
 # ==============================
 # SEGRETERIA/MANAGER: lista tutte prenotazioni
 # ==============================
 @router.get("/", response_model=List[schemas.PrenotazioneRead])
 def get_all_prenotazioni(
+    id_dipendente: Optional[int] = None,
+    filters: PrenotazioniFilter = Depends(),
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
-    current_user: models.Dipendente = Depends(require_role(["manager", "admin"]))
+    current_user: CurrentUser = Depends(require_role(["manager", "admin"]))
+):
+    query = db.query(*_LIST_JSON.columns)
+    if id_dipendente is not None or filters.needs_trasferta:
+        query = query.join(models.Trasferta, models.Prenotazione.id_trasferta == models.Trasferta.id)
+    if id_dipendente is not None:
+        query = query.filter(models.Trasferta.id_dipendente == id_dipendente)
+    return json_list_response(_LIST_JSON.dumps(paginate(filters.apply(query), models.Prenotazione, page)), page.response)
+
+# ==============================
+# SEGRETERIA/MANAGER: export CSV / NDJSON
+# ==============================
+@router.get("/export")
+def export_prenotazioni(
+    formato: export.ExportFormat = export.ExportFormat.csv,
+    id_dipendente: Optional[int] = None,
+    filters: PrenotazioniFilter = Depends(),
+    current_user: CurrentUser = Depends(require_role(["manager", "admin"]))
 ):
-    return db.query(models.Prenotazione).all()
+    # in streaming da un cursore lato server: memoria costante anche con milioni di righe
+    return export.stream_export(export.prenotazioni_query(filters, id_dipendente), formato, "prenotazioni")
@@ -1,16 +1,26 @@
 # app/routers/expenses.py
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, Header
-from fastapi.responses import StreamingResponse
-from typing import List, Optional, Union
-from sqlalchemy.orm import Session
-import base64
-import io
-
-from app.database import schemas, crud, models
-from app.dependencies import get_db
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from collections import defaultdict
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import export, fx
+from app.database import models, schemas, crud, crud_async
+from app.database.import_spese import import_spese
+from app.dependencies import CurrentUser, get_async_db, require_role
+from app.filters import SpeseFilter
+from app.pagination import PageParams
+from app.responses import attachment_response
+from app.serialization import RowSerializer, json_list_response
+from app.storage import UPLOAD_MAX_FILE_SIZE, UPLOAD_MAX_REQUEST_SIZE, UploadTooLarge, get_attachment_store
 
 router = APIRouter(prefix="/spese", tags=["spese"])
 
+# liste: colonne di SpesaRead come tuple + allegati e importo_eur, senza passare da Pydantic
+_LIST_JSON = RowSerializer(schemas.SpesaRead, models.Spesa, extra=("files", "importo_eur"))
+_FILE_JSON = RowSerializer(schemas.SpesaFileResponse, models.SpesaFile, extra=("url",))
+
 # ------------------------
 # Fallback temporaneo per l'ID utente
 # ------------------------
@@ -28,27 +38,18 @@ async def create_spesa_with_files(
     valuta: str = Form("EUR"),
     tipo_scontrino: str = Form("altro"),  # aggiornato a stringa
     data_spesa: str = Form(...),
-    files: Optional[Union[UploadFile, List[UploadFile]]] = File(None),
-    db: Session = Depends(get_db),
+    files: Optional[List[UploadFile]] = File(None),
+    db: AsyncSession = Depends(get_async_db),
     current_user_id: int = Depends(get_user_id)
 ):
     """
     Crea una spesa collegata a una trasferta e gestisce sia singolo file sia più file.
+    Gli allegati vengono letti a blocchi e scritti direttamente nell'archivio.
     """
-
-    # Normalizza a lista
-    files_list = []
-    if files:
-        if isinstance(files, list):
-            files_list = files
-        else:
-            files_list = [files]
+    files_list = files or []
 
     # --- Validazione: trasferta esiste e appartiene al dipendente ---
-    trasferta = db.query(models.Trasferta).filter(
-        models.Trasferta.id == id_trasferta,
-        models.Trasferta.id_dipendente == current_user_id
-    ).first()
+    trasferta = await crud_async.get_trasferta_of_user(db, id_trasferta, current_user_id)
 
     if not trasferta:
         raise HTTPException(
@@ -66,95 +67,168 @@ async def create_spesa_with_files(
         data_spesa=data_spesa
     )
 
-    # --- Preparazione file ---
-    files_data = []
+    # --- Validazione file (prima di scrivere qualsiasi cosa) ---
     for f in files_list:
         if f.content_type not in ["image/jpeg", "image/png", "application/pdf"]:
             raise HTTPException(
                 status_code=400,
                 detail=f"Formato non valido per il file {f.filename}"
             )
-        data = await f.read()
-        files_data.append({
-            "filename": f.filename,
-            "mimetype": f.content_type,
-            "data": base64.b64encode(data).decode("utf-8")
-        })
-
-    # --- Salvataggio nel DB ---
-    created = crud.create_spesa(
-        db=db,
-        spesa_in=spesa_in,
-        creator_id=current_user_id,
-        files_data=files_data
-    )
+    if sum(f.size or 0 for f in files_list) > UPLOAD_MAX_REQUEST_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Gli allegati superano {UPLOAD_MAX_REQUEST_SIZE} byte complessivi"
+        )
 
+    # --- Salvataggio file nell'archivio, a blocchi ---
+    files_data = []
+    try:
+        remaining = UPLOAD_MAX_REQUEST_SIZE
+        for f in files_list:
+            stored = await crud.store_upload(f, max_size=min(UPLOAD_MAX_FILE_SIZE, remaining))
+            remaining -= stored["size"]
+            files_data.append(stored)
+
+        # --- Salvataggio nel DB ---
+        created = await crud_async.create_spesa(
+            db=db,
+            spesa_in=spesa_in,
+            creator_id=current_user_id,
+            files_data=files_data
+        )
+    except Exception as exc:
+        # niente blob orfani se la richiesta fallisce a metà
+        store = get_attachment_store()
+        for stored in files_data:
+            if stored["created"]:
+                store.delete(stored["sha256"])
+        if isinstance(exc, UploadTooLarge):
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+        raise
+
+    fx.annotate_eur([created], await run_in_threadpool(fx.get_table))
     return created
 
+# ------------------------
+# IMPORT IN BLOCCO (CSV / JSONL)
+# ------------------------
+@router.post("/import", response_model=schemas.ImportSpeseReport)
+async def import_spese_file(
+    file: UploadFile = File(...),
+    current_user_id: int = Depends(get_user_id),
+):
+    """
+    Una riga per spesa (colonne come SpesaCreate), solo su trasferte del dipendente.
+    Le righe valide vengono inserite a lotti; il report elenca le righe scartate.
+    """
+    return await run_in_threadpool(import_spese, file.file, file.filename or "", current_user_id)
+
 # ------------------------
 # GET - Spese mie
 # ------------------------
 @router.get("/mine", response_model=List[schemas.SpesaRead])
-def get_my_spese(
-    db: Session = Depends(get_db),
+async def get_my_spese(
+    filters: SpeseFilter = Depends(),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
     current_user_id: int = Depends(get_user_id),
 ):
-    return crud.list_spese_by_user(db, current_user_id)
+    rows = await crud_async.list_spese_by_user(db, current_user_id, filters=filters, page=page,
+                                               columns=_LIST_JSON.columns)
+    return json_list_response(await _spese_json(db, rows), page.response)
 
 # ------------------------
 # GET - Tutte le spese
 # ------------------------
 @router.get("/", response_model=List[schemas.SpesaRead])
-def get_all_spese(db: Session = Depends(get_db)):
-    return crud.list_all_spese(db)
+async def get_all_spese(
+    id_dipendente: Optional[int] = None,
+    filters: SpeseFilter = Depends(),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_async_db),
+):
+    rows = await crud_async.list_all_spese(db, filters=filters, id_dipendente=id_dipendente, page=page,
+                                           columns=_LIST_JSON.columns)
+    return json_list_response(await _spese_json(db, rows), page.response)
+
+async def _spese_json(db: AsyncSession, rows: list) -> bytes:
+    """Corpo di List[SpesaRead]: allegati con una query per pagina, importi in EUR in blocco."""
+    files = defaultdict(list)
+    for row in await crud_async.list_files_of_spese(db, [r.id for r in rows], _FILE_JSON.columns):
+        files[row.id_spesa].append(row)
+    table = await run_in_threadpool(fx.get_table)
+    eur = dict(zip((r.id for r in rows), table.to_eur_many([(r.importo, r.valuta, r.data_spesa) for r in rows])))
+
+    def extra(row):
+        value = eur[row.id]
+        return {
+            "valuta": fx.normalize(row.valuta),  # come il validator di SpesaBase
+            "files": _FILE_JSON.dicts(files.get(row.id, ()), lambda f: {"url": f"/spese/file/{f.id}"}),
+            "importo_eur": None if value is None else round(value, 2),
+        }
+
+    return _LIST_JSON.dumps(rows, extra)
+
+# ------------------------
+# SEGRETERIA/MANAGER: EXPORT (CSV / NDJSON, in streaming)
+# ------------------------
+@router.get("/export")
+async def export_spese(
+    formato: export.ExportFormat = export.ExportFormat.csv,
+    id_dipendente: Optional[int] = None,
+    filters: SpeseFilter = Depends(),
+    current_user: CurrentUser = Depends(require_role(["manager", "admin"]))
+):
+    """Stessi filtri di GET /spese/, senza paginazione: le righe escono man mano dal cursore."""
+    return await run_in_threadpool(export.export_spese, filters, formato, id_dipendente)
 
 # ------------------------
 # DOWNLOAD FILE
 # ------------------------
 @router.get("/file/{file_id}")
-def download_spesa_file(
+async def download_spesa_file(
     file_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user_id: int = Depends(get_user_id)
 ):
-    file_rec = crud.get_spesa_file(db, file_id)
-    if not file_rec:
+    """
+    Scarica un allegato. Supporta Range (206) e If-None-Match (304):
+    l'ETag è lo SHA-256 del contenuto, che non cambia mai.
+    """
+    found = await crud_async.get_spesa_file_with_owner(db, file_id)
+    if not found:
         raise HTTPException(status_code=404, detail="File non trovato")
 
-    spesa = crud.get_spesa(db, file_rec.id_spesa)
-    trasferta = db.query(models.Trasferta).filter(
-        models.Trasferta.id == spesa.id_trasferta
-    ).first()
-
-    if trasferta.id_dipendente != current_user_id:
+    file_rec, id_dipendente = found
+    if id_dipendente != current_user_id:
         raise HTTPException(status_code=403, detail="Permesso negato")
 
-    return StreamingResponse(
-        io.BytesIO(base64.b64decode(file_rec.data)),
-        media_type=file_rec.mimetype or "application/octet-stream",
-        headers={"Content-Disposition": f'attachment; filename="{file_rec.filename}"'}
+    return attachment_response(
+        request,
+        get_attachment_store(),
+        digest=file_rec.sha256,
+        size=file_rec.size,
+        media_type=file_rec.mimetype,
+        filename=file_rec.filename,
     )
 
 # ------------------------
 # DELETE FILE
 # ------------------------
 @router.delete("/file/{file_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_file(
+async def delete_file(
     file_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user_id: int = Depends(get_user_id)
 ):
-    file_rec = crud.get_spesa_file(db, file_id)
-    if not file_rec:
+    found = await crud_async.get_spesa_file_with_owner(db, file_id)
+    if not found:
         raise HTTPException(status_code=404, detail="File non trovato")
 
-    spesa = crud.get_spesa(db, file_rec.id_spesa)
-    trasferta = db.query(models.Trasferta).filter(
-        models.Trasferta.id == spesa.id_trasferta
-    ).first()
-
-    if trasferta.id_dipendente != current_user_id:
+    _, id_dipendente = found
+    if id_dipendente != current_user_id:
         raise HTTPException(status_code=403, detail="Permesso negato")
 
-    crud.delete_spesa_file(db, file_id)
+    await crud_async.delete_spesa_file(db, file_id)
     return None
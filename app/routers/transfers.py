@@ -1,11 +1,32 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import date
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import models, schemas, session
-from app.dependencies import get_db, require_role, get_current_user
+from typing import List, Optional
+from app.database import crud, models, periodi, schemas, session, totals
+from app import export, fx, response_cache
+from app.dependencies import CurrentUser, get_db, require_role, get_current_user
+from app.filters import TrasferteFilter
+from app.pagination import PageParams, paginate
+from app.serialization import RowSerializer, json_list_response
 
 router = APIRouter(prefix="/trasferte", tags=["trasferte"])
 
+# liste: solo le colonne di TrasfertaRead, come tuple, senza passare da Pydantic
+_LIST_JSON = RowSerializer(schemas.TrasfertaRead, models.Trasferta)
+
+
+def _check_periodo(db: Session, id_dipendente: int, data_partenza, data_rientro, escludi_id: Optional[int] = None):
+    # lock sul dipendente fino al commit, poi una ricerca sull'indice
+    # (id_dipendente, data_partenza, data_rientro), vedi app/database/periodi.py
+    periodi.blocca_dipendente(db, id_dipendente)
+    conflitto = periodi.sovrapposta(db, id_dipendente, data_partenza, data_rientro, escludi_id)
+    if conflitto:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Periodo sovrapposto alla trasferta {conflitto.id} "
+                   f"(dal {conflitto.data_partenza} al {conflitto.data_rientro})",
+        )
+
 # ==============================
 # DIPENDENTE: crea trasferta
 # ==============================
@@ -13,8 +34,10 @@ router = APIRouter(prefix="/trasferte", tags=["trasferte"])
 def create_trasferta(
     trasferta: schemas.TrasfertaCreate,
     db: Session = Depends(get_db),
-    current_user: models.Dipendente = Depends(require_role(["dipendente", "manager", "admin"]))
+    current_user: CurrentUser = Depends(require_role(["dipendente", "manager", "admin"]))
 ):
+    if trasferta.stato != models.StatoTrasfertaEnum.rifiutata:
+        _check_periodo(db, current_user.id, trasferta.data_partenza, trasferta.data_rientro)
     new_trasferta = models.Trasferta(
         id_dipendente=current_user.id,
         data_partenza=trasferta.data_partenza,
@@ -35,20 +58,111 @@ def create_trasferta(
 # ==============================
 @router.get("/miei", response_model=List[schemas.TrasfertaRead])
 def get_my_trasferte(
+    request: Request,
+    filters: TrasferteFilter = Depends(),
+    page: PageParams = Depends(),
     db: Session = Depends(get_db),
-    current_user: models.Dipendente = Depends(require_role(["dipendente", "manager", "admin"]))
+    current_user: CurrentUser = Depends(require_role(["dipendente", "manager", "admin"]))
 ):
-    return db.query(models.Trasferta).filter(models.Trasferta.id_dipendente == current_user.id).all()
+    # interrogata di continuo dal frontend: ETag + cache finché trasferte non cambia
+    def load():
+        query = db.query(*_LIST_JSON.columns).filter(models.Trasferta.id_dipendente == current_user.id)
+        return _LIST_JSON.dumps(paginate(filters.apply(query), models.Trasferta, page))
+
+    return response_cache.cached_list(request, ["trasferte"], load,
+                                      response=page.response, user_id=current_user.id)
 
 # ==============================
 # SEGRETERIA/MANAGER/ADMIN: lista tutte trasferte
 # ==============================
 @router.get("/", response_model=List[schemas.TrasfertaRead])
 def get_all_trasferte(
+    id_dipendente: Optional[int] = None,
+    filters: TrasferteFilter = Depends(),
+    page: PageParams = Depends(),
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(require_role(["manager", "admin"]))
+):
+    query = db.query(*_LIST_JSON.columns)
+    if id_dipendente is not None:
+        query = query.filter(models.Trasferta.id_dipendente == id_dipendente)
+    return json_list_response(_LIST_JSON.dumps(paginate(filters.apply(query), models.Trasferta, page)), page.response)
+
+# ==============================
+# SEGRETERIA/MANAGER/ADMIN: export CSV / NDJSON
+# ==============================
+@router.get("/export")
+def export_trasferte(
+    formato: export.ExportFormat = export.ExportFormat.csv,
+    id_dipendente: Optional[int] = None,
+    filters: TrasferteFilter = Depends(),
+    current_user: CurrentUser = Depends(require_role(["manager", "admin"]))
+):
+    # in streaming da un cursore lato server: memoria costante anche con milioni di righe
+    return export.stream_export(export.trasferte_query(filters, id_dipendente), formato, "trasferte")
+
+# ==============================
+# SEGRETERIA/MANAGER/ADMIN: audit trasferte sovrapposte
+# ==============================
+@router.get("/sovrapposizioni", response_model=List[schemas.TrasfertaSovrapposizione])
+def get_sovrapposizioni(
+    id_dipendente: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(require_role(["manager", "admin"]))
+):
+    # sweep-line in ordine di indice: una sola passata, nessun confronto tutti-contro-tutti
+    return [s._asdict() for s in periodi.trova_sovrapposizioni(db.connection(), id_dipendente)]
+
+# ==============================
+# SEGRETERIA/MANAGER/ADMIN: chi è in trasferta quando/dove
+# ==============================
+@router.get("/occupazione", response_model=schemas.Occupazione)
+def get_occupazione(
+    dal: date = Query(..., description="Primo giorno (incluso)"),
+    al: date = Query(..., description="Ultimo giorno (incluso)"),
+    luogo_destinazione: Optional[str] = None,
+    area_lavoro: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(require_role(["manager", "admin"]))
+):
+    """Trasferte approvate o completate che toccano l'intervallo e persone in trasferta giorno per giorno."""
+    if al < dal:
+        raise HTTPException(status_code=422, detail="al precede dal")
+    if (al - dal).days + 1 > periodi.OCCUPAZIONE_MAX_GIORNI:
+        raise HTTPException(status_code=422, detail=f"Intervallo oltre {periodi.OCCUPAZIONE_MAX_GIORNI} giorni")
+    trasferte, giorni = periodi.occupazione(db, dal, al, luogo_destinazione, area_lavoro)
+    return {"dal": dal, "al": al, "trasferte": trasferte, "giorni": giorni}
+
+# ==============================
+# RIMBORSO: totali per valuta e categoria
+# ==============================
+@router.get("/{trasferta_id}/rimborso", response_model=schemas.RimborsoRead)
+def get_rimborso_trasferta(
+    trasferta_id: int,
     db: Session = Depends(get_db),
-    current_user: models.Dipendente = Depends(require_role(["manager", "admin"]))
+    current_user: CurrentUser = Depends(require_role(["dipendente", "manager", "admin"]))
 ):
-    return db.query(models.Trasferta).all()
+    # letto da totali_trasferta (aggiornata a ogni scrittura): costo indipendente dal numero di spese
+    t = models.Trasferta
+    trasferta = db.query(t.id, t.id_dipendente, t.stato).filter(t.id == trasferta_id).first()
+    if not trasferta:
+        raise HTTPException(status_code=404, detail="Trasferta non trovata")
+    if trasferta.id_dipendente != current_user.id and current_user.ruolo == models.RuoloEnum.dipendente:
+        raise HTTPException(status_code=403, detail="Non puoi vedere il rimborso di questa trasferta")
+    righe = totals.totali_trasferta(db, trasferta_id)
+    return totals.riepilogo_rimborso(trasferta_id, righe, fx.totale_eur(db, trasferta, righe))
+
+# ==============================
+# SEGRETERIA/MANAGER: approva/rifiuta in blocco
+# ==============================
+@router.patch("/stato", response_model=schemas.TrasfertaStatoBatchReport)
+def update_stato_trasferte(
+    batch: schemas.TrasfertaStatoBatch,
+    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(require_role(["manager", "admin"]))
+):
+    # un solo UPDATE per tutte le trasferte; esito per id nell'ordine ricevuto
+    return crud.transizione_trasferte(db, batch.ids, batch.stato, batch.note_segreteria)
 
 # ==============================
 # SEGRETERIA/MANAGER: approva/rifiuta trasferta
@@ -58,12 +172,16 @@ def update_stato_trasferta(
     trasferta_id: int,
     stato: schemas.TrasfertaUpdate,
     db: Session = Depends(get_db),
-    current_user: models.Dipendente = Depends(require_role(["manager", "admin"]))
+    current_user: CurrentUser = Depends(require_role(["manager", "admin"]))
 ):
     trasferta = db.query(models.Trasferta).filter(models.Trasferta.id == trasferta_id).first()
     if not trasferta:
         raise HTTPException(status_code=404, detail="Trasferta non trovata")
-    
+
+    # una trasferta rifiutata non occupa il periodo: riattivarla richiede che sia ancora libero
+    if (trasferta.stato == models.StatoTrasfertaEnum.rifiutata and stato.stato
+            and stato.stato != models.StatoTrasfertaEnum.rifiutata):
+        _check_periodo(db, trasferta.id_dipendente, trasferta.data_partenza, trasferta.data_rientro, trasferta.id)
     if stato.stato:
         trasferta.stato = stato.stato
     if stato.note_segreteria:
@@ -2,8 +2,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from sqlalchemy.orm import Session
 from typing import List
-from app.database import models, schemas, session
-from app.dependencies import get_current_user, get_current_admin
+from app.database import models, periodi, schemas, session, totals
+from app import fx
+from app.dependencies import CurrentUser, get_current_user, get_current_admin
 from datetime import date
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -17,6 +18,14 @@ def get_db():
         db.close()
 
 
+def _check_periodo(db: Session, trasferta):
+    periodi.blocca_dipendente(db, trasferta.id_dipendente)
+    conflitto = periodi.sovrapposta(db, trasferta.id_dipendente, trasferta.data_partenza,
+                                    trasferta.data_rientro, getattr(trasferta, "id", None))
+    if conflitto:
+        raise HTTPException(status_code=409, detail=f"Periodo sovrapposto alla trasferta {conflitto.id}")
+
+
 # =========================
 # DIPENDENTE
 # =========================
@@ -24,7 +33,7 @@ def get_db():
 @router.post("/trasferte/", response_model=schemas.TrasfertaRead)
 def create_trasferta(trasferta: schemas.TrasfertaCreate,
                      db: Session = Depends(get_db),
-                     current_user: models.Dipendente = Depends(get_current_user)):
+                     current_user: CurrentUser = Depends(get_current_user)):
     new_trasferta = models.Trasferta(
         id_dipendente=current_user.id,
         data_partenza=trasferta.data_partenza,
@@ -34,6 +43,7 @@ def create_trasferta(trasferta: schemas.TrasfertaCreate,
         tipo_commessa=trasferta.tipo_commessa,
         note_dipendente=trasferta.note_dipendente
     )
+    _check_periodo(db, new_trasferta)
     db.add(new_trasferta)
     db.commit()
     db.refresh(new_trasferta)
@@ -42,7 +52,7 @@ def create_trasferta(trasferta: schemas.TrasfertaCreate,
 
 @router.get("/trasferte/", response_model=List[schemas.TrasfertaRead])
 def get_mie_trasferte(db: Session = Depends(get_db),
-                       current_user: models.Dipendente = Depends(get_current_user)):
+                       current_user: CurrentUser = Depends(get_current_user)):
     return db.query(models.Trasferta).filter(models.Trasferta.id_dipendente == current_user.id).all()
 
 
@@ -53,7 +63,7 @@ def carica_spesa(trasferta_id: int,
                  data_spesa: date,
                  file_scontrino: UploadFile = File(None),
                  db: Session = Depends(get_db),
-                 current_user: models.Dipendente = Depends(get_current_user)):
+                 current_user: CurrentUser = Depends(get_current_user)):
     trasferta = db.query(models.Trasferta).filter(models.Trasferta.id == trasferta_id,
                                                  models.Trasferta.id_dipendente == current_user.id).first()
     if not trasferta:
@@ -86,7 +96,7 @@ def proporre_prenotazione(trasferta_id: int,
                           dettagli: str = None,
                           file_biglietto: UploadFile = File(None),
                           db: Session = Depends(get_db),
-                          current_user: models.Dipendente = Depends(get_current_user)):
+                          current_user: CurrentUser = Depends(get_current_user)):
     trasferta = db.query(models.Trasferta).filter(models.Trasferta.id == trasferta_id,
                                                  models.Trasferta.id_dipendente == current_user.id).first()
     if not trasferta:
@@ -118,7 +128,7 @@ def proporre_prenotazione(trasferta_id: int,
 
 @router.get("/trasferte/all", response_model=List[schemas.TrasfertaRead])
 def get_tutte_trasferte(db: Session = Depends(get_db),
-                         current_user: models.Dipendente = Depends(get_current_admin)):
+                         current_user: CurrentUser = Depends(get_current_admin)):
     return db.query(models.Trasferta).all()
 
 
@@ -126,11 +136,13 @@ def get_tutte_trasferte(db: Session = Depends(get_db),
 def approva_trasferta(trasferta_id: int,
                       note_segreteria: str = None,
                       db: Session = Depends(get_db),
-                      current_user: models.Dipendente = Depends(get_current_admin)):
+                      current_user: CurrentUser = Depends(get_current_admin)):
     trasferta = db.query(models.Trasferta).filter(models.Trasferta.id == trasferta_id).first()
     if not trasferta:
         raise HTTPException(status_code=404, detail="Trasferta non trovata")
-    
+    if trasferta.stato == models.StatoTrasfertaEnum.rifiutata:
+        _check_periodo(db, trasferta)
+
     trasferta.stato = models.StatoTrasfertaEnum.approvata
     if note_segreteria:
         trasferta.note_segreteria = note_segreteria
@@ -143,7 +155,7 @@ def approva_trasferta(trasferta_id: int,
 def rifiuta_trasferta(trasferta_id: int,
                        note_segreteria: str = None,
                        db: Session = Depends(get_db),
-                       current_user: models.Dipendente = Depends(get_current_admin)):
+                       current_user: CurrentUser = Depends(get_current_admin)):
     trasferta = db.query(models.Trasferta).filter(models.Trasferta.id == trasferta_id).first()
     if not trasferta:
         raise HTTPException(status_code=404, detail="Trasferta non trovata")
@@ -156,24 +168,22 @@ def rifiuta_trasferta(trasferta_id: int,
     return trasferta
 
 
-@router.get("/trasferte/{trasferta_id}/rimborsi")
+@router.get("/trasferte/{trasferta_id}/rimborsi", response_model=schemas.RimborsoRead)
 def calcola_rimborso(trasferta_id: int,
                      db: Session = Depends(get_db),
-                     current_user: models.Dipendente = Depends(get_current_admin)):
-    trasferta = db.query(models.Trasferta).filter(models.Trasferta.id == trasferta_id).first()
+                     current_user: CurrentUser = Depends(get_current_admin)):
+    # totali già aggregati in totali_trasferta: nessuna spesa/prenotazione da caricare
+    trasferta = db.query(models.Trasferta.id, models.Trasferta.stato).filter(models.Trasferta.id == trasferta_id).first()
     if not trasferta:
         raise HTTPException(status_code=404, detail="Trasferta non trovata")
-    
-    totale_spese = sum([s.importo for s in trasferta.spese])
-    totale_prenotazioni = sum([p.costo or 0 for p in trasferta.prenotazioni])
-    totale = totale_spese + totale_prenotazioni
-    return {"totale_rimborso": totale}
+    righe = totals.totali_trasferta(db, trasferta_id)
+    return totals.riepilogo_rimborso(trasferta_id, righe, fx.totale_eur(db, trasferta, righe))
 
 
 @router.patch("/trasferte/{trasferta_id}/completa", response_model=schemas.TrasfertaRead)
 def completa_trasferta(trasferta_id: int,
                         db: Session = Depends(get_db),
-                        current_user: models.Dipendente = Depends(get_current_admin)):
+                        current_user: CurrentUser = Depends(get_current_admin)):
     trasferta = db.query(models.Trasferta).filter(models.Trasferta.id == trasferta_id).first()
     if not trasferta:
         raise HTTPException(status_code=404, detail="Trasferta non trovata")
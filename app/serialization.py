@@ -0,0 +1,99 @@
+# app/serialization.py
+"""
+Serializzazione veloce delle liste grandi, senza passare da Pydantic.
+
+Con response_model=List[SchemaRead] FastAPI valida e copia ogni riga con
+Pydantic v1 e poi la passa a json.dumps: sulle liste lunghe è la parte che
+costa di più. Gli endpoint che lo scelgono leggono invece solo le colonne
+dello schema, come tuple, e le codificano con un RowSerializer costruito una
+volta sola dallo schema (orjson se installato, altrimenti json).
+
+Lo schema resta il response_model dell'endpoint, quindi l'OpenAPI non cambia.
+I validator dello schema non vengono eseguiti: i valori escono come sono nel
+DB, quindi vanno usati solo schemi che non trasformano i dati in uscita (o
+aggiungendo a mano i campi calcolati, vedi extra).
+"""
+import enum
+import json
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Type
+
+from fastapi import Response
+from pydantic import BaseModel
+
+from app.pagination import NEXT_CURSOR_HEADER
+
+try:
+    import orjson
+except ImportError:  # facoltativo: senza, si usa json della libreria standard
+    orjson = None
+
+
+def plain(value):
+    """Valore per JSON/CSV: enum per valore, date e datetime in ISO 8601 (usato anche da app.export)."""
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _json_default(value):
+    converted = plain(value)
+    if converted is value:
+        raise TypeError(f"{type(value).__name__} non serializzabile")
+    return converted
+
+
+def dumps(content) -> bytes:
+    """JSON in UTF-8, come JSONResponse di FastAPI (date ISO 8601, enum per valore)."""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+                      default=_json_default).encode("utf-8")
+
+
+class RowSerializer:
+    """
+    Serializer precompilato per uno schema di risposta su un modello ORM.
+
+    columns: attributi del modello da selezionare, nell'ordine dei campi
+    dello schema; dumps(rows) codifica le righe (tuple) di quella select
+    (eventuali colonne in più in coda alla riga vengono ignorate).
+    extra: campi dello schema che non sono colonne, aggiunti riga per riga
+    da una funzione (es. allegati o importi convertiti); la funzione può
+    anche sostituire il valore di una colonna.
+    """
+
+    def __init__(self, schema: Type[BaseModel], model, extra: Sequence[str] = ()):
+        names = [name for name in schema.__fields__ if name not in extra]
+        table = model.__table__
+        missing = [name for name in names if name not in table.c]
+        if missing:
+            raise ValueError(f"{schema.__name__}: campi senza colonna in {table.name}: {missing}")
+        self.schema = schema
+        self.names = tuple(names)
+        self.extra = tuple(extra)
+        self.columns = [getattr(model, name) for name in names]
+
+    def dicts(self, rows: Iterable[Sequence],
+              extra: Optional[Callable[[Sequence], Dict[str, object]]] = None) -> List[dict]:
+        names = self.names
+        if extra is None:
+            return [dict(zip(names, row)) for row in rows]
+        return [{**dict(zip(names, row)), **extra(row)} for row in rows]
+
+    def dumps(self, rows: Iterable[Sequence],
+              extra: Optional[Callable[[Sequence], Dict[str, object]]] = None) -> bytes:
+        return dumps(self.dicts(rows, extra))
+
+
+def json_list_response(body: bytes, page_response: Optional[Response] = None) -> Response:
+    """
+    Risposta con il corpo già serializzato. Restituendo una Response, FastAPI
+    non copia gli header impostati dalla paginazione: lo facciamo qui.
+    """
+    headers = {}
+    if page_response is not None and NEXT_CURSOR_HEADER in page_response.headers:
+        headers[NEXT_CURSOR_HEADER] = page_response.headers[NEXT_CURSOR_HEADER]
+    return Response(body, media_type="application/json", headers=headers)
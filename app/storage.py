@@ -0,0 +1,214 @@
+# app/storage.py
+import abc
+import hashlib
+import os
+import re
+import tempfile
+from typing import BinaryIO, Iterator, Optional
+
+# ======================================
+# CONFIG
+# ======================================
+ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", "uploads/spese")
+CHUNK_SIZE = 64 * 1024
+
+# limiti sugli allegati in upload (byte)
+UPLOAD_MAX_FILE_SIZE = int(os.getenv("UPLOAD_MAX_FILE_SIZE", 10 * 1024 * 1024))
+UPLOAD_MAX_REQUEST_SIZE = int(os.getenv("UPLOAD_MAX_REQUEST_SIZE", 25 * 1024 * 1024))
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _check_digest(digest: str) -> str:
+    # il digest finisce in un path: accettiamo solo sha256 esadecimali
+    if not isinstance(digest, str) or not _DIGEST_RE.match(digest):
+        raise ValueError(f"Digest non valido: {digest!r}")
+    return digest
+
+
+class UploadTooLarge(ValueError):
+    """Allegato (o insieme di allegati) oltre il limite consentito."""
+
+
+# ======================================
+# SCRITTURA INCREMENTALE
+# ======================================
+class BlobWriter(abc.ABC):
+    """
+    Riceve il contenuto a blocchi, calcola lo SHA-256 mentre scrive
+    e rende il blob visibile solo con commit().
+    Dopo commit(): digest, size e created (False se il contenuto esisteva già).
+    Un backend implementa _write, commit e abort.
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.size = 0
+        self.digest: Optional[str] = None
+        self.created = False
+
+    def write(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        self._write(chunk)
+
+    @abc.abstractmethod
+    def _write(self, chunk: bytes) -> None:
+        ...
+
+    @abc.abstractmethod
+    def commit(self) -> str:
+        ...
+
+    @abc.abstractmethod
+    def abort(self) -> None:
+        ...
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and self.digest is None:
+            self.abort()
+
+
+# ======================================
+# INTERFACCIA ARCHIVIO ALLEGATI
+# ======================================
+class AttachmentStore(abc.ABC):
+    """
+    Archivio di allegati indirizzato per contenuto (chiave = SHA-256).
+    Contenuti identici vengono salvati una sola volta.
+    Un backend implementa writer, exists, open e delete: se ne manca uno
+    la classe non si può istanziare.
+    """
+
+    @abc.abstractmethod
+    def writer(self) -> BlobWriter:
+        ...
+
+    def put(self, data: bytes) -> str:
+        with self.writer() as w:
+            w.write(data)
+            return w.commit()
+
+    @abc.abstractmethod
+    def exists(self, digest: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def open(self, digest: str) -> BinaryIO:
+        ...
+
+    @abc.abstractmethod
+    def delete(self, digest: str) -> None:
+        ...
+
+    def read(self, digest: str) -> bytes:
+        with self.open(digest) as fh:
+            return fh.read()
+
+    def local_path(self, digest: str) -> Optional[str]:
+        # path su disco se l'archivio è locale (permette sendfile), altrimenti None
+        return None
+
+    def iter_content(self, digest: str, start: int = 0, length: Optional[int] = None,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        with self.open(digest) as fh:
+            if start:
+                fh.seek(start)
+            while length is None or length > 0:
+                chunk = fh.read(chunk_size if length is None else min(chunk_size, length))
+                if not chunk:
+                    break
+                if length is not None:
+                    length -= len(chunk)
+                yield chunk
+
+
+# ======================================
+# IMPLEMENTAZIONE SU DISCO LOCALE
+# ======================================
+class LocalBlobWriter(BlobWriter):
+    """
+    Scrive su un file temporaneo nella root dell'archivio e a commit()
+    lo rinomina (atomicamente) nel suo path definitivo.
+    """
+
+    def __init__(self, store: "LocalAttachmentStore"):
+        super().__init__()
+        self._store = store
+        fd, self._tmp_path = tempfile.mkstemp(dir=store.root, prefix=".tmp-")
+        self._fh = os.fdopen(fd, "wb")
+
+    def _write(self, chunk: bytes) -> None:
+        self._fh.write(chunk)
+
+    def commit(self) -> str:
+        self._fh.close()
+        digest = self._hash.hexdigest()
+        dest = self._store.path(digest)
+        if os.path.exists(dest):
+            os.unlink(self._tmp_path)  # deduplicazione
+        else:
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            os.replace(self._tmp_path, dest)
+            self.created = True
+        self.digest = digest
+        return digest
+
+    def abort(self) -> None:
+        self._fh.close()
+        if os.path.exists(self._tmp_path):
+            os.unlink(self._tmp_path)
+
+
+class LocalAttachmentStore(AttachmentStore):
+    """
+    Salva i blob in directory a due livelli: <root>/ab/cd/abcd...
+    così nessuna directory cresce oltre qualche migliaio di file.
+    """
+
+    def __init__(self, root: str = ATTACHMENTS_DIR):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, digest: str) -> str:
+        _check_digest(digest)
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def local_path(self, digest: str) -> Optional[str]:
+        return self.path(digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def writer(self) -> LocalBlobWriter:
+        return LocalBlobWriter(self)
+
+    def open(self, digest: str) -> BinaryIO:
+        return open(self.path(digest), "rb")
+
+    def delete(self, digest: str) -> None:
+        try:
+            os.unlink(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+
+# ======================================
+# ISTANZA GLOBALE (sostituibile)
+# ======================================
+_store: Optional[AttachmentStore] = None
+
+
+def get_attachment_store() -> AttachmentStore:
+    global _store
+    if _store is None:
+        _store = LocalAttachmentStore(ATTACHMENTS_DIR)
+    return _store
+
+
+def set_attachment_store(store: AttachmentStore) -> None:
+    global _store
+    _store = store
@@ -0,0 +1,126 @@
+# app/tokens.py
+"""
+JWT di accesso: emissione e verifica senza query al DB per ogni richiesta.
+
+Il token porta sub (id), role e ver (token_version del dipendente).
+I token già verificati finiscono in una piccola LRU; ver viene confrontato
+con la versione corrente, tenuta in memoria e riletta dal DB al massimo
+ogni TOKEN_VERSION_TTL secondi. Cambio ruolo o reset password incrementano
+token_version: i token emessi prima smettono di valere.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from jose import JWTError, jwt
+
+from app.database import models, session
+
+# =========================
+# CONFIG
+# =========================
+SECRET_KEY = "questa_dovrai_cambiarla_con_un_valore_super_segreto"
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 60
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 1024))
+# ogni quanto rileggere token_version dal DB (conta con più worker/processi)
+TOKEN_VERSION_TTL = float(os.getenv("TOKEN_VERSION_TTL", 30))
+
+
+class CurrentUser:
+    """Utente autenticato ricavato dai claim del token (nessun oggetto ORM)."""
+    __slots__ = ("id", "ruolo")
+
+    def __init__(self, id: int, ruolo: models.RuoloEnum):
+        self.id = id
+        self.ruolo = ruolo
+
+    def __repr__(self):
+        return f"CurrentUser(id={self.id}, ruolo={self.ruolo.value})"
+
+
+# =========================
+# EMISSIONE
+# =========================
+def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
+    """data deve contenere sub, role e ver (vedi claims_for)."""
+    to_encode = data.copy()
+    expire = datetime.utcnow() + (expires_delta if expires_delta else timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def claims_for(user: models.Dipendente) -> dict:
+    return {"sub": str(user.id), "role": user.ruolo.value, "ver": user.token_version or 0}
+
+
+# =========================
+# VERSIONI TOKEN
+# =========================
+_lock = threading.Lock()
+_versions: Dict[int, Tuple[Optional[int], float]] = {}  # user_id -> (versione, letta_il)
+_cache: "OrderedDict[str, Tuple[CurrentUser, int, float]]" = OrderedDict()  # token -> (utente, ver, exp)
+
+
+def _load_version(user_id: int) -> Optional[int]:
+    db = session.SessionLocal()
+    try:
+        row = db.query(models.Dipendente.token_version).filter(models.Dipendente.id == user_id).first()
+        return None if row is None else (row[0] or 0)
+    finally:
+        db.close()
+
+
+def _current_version(user_id: int) -> Optional[int]:
+    now = time.monotonic()
+    with _lock:
+        cached = _versions.get(user_id)
+    if cached is not None and now - cached[1] < TOKEN_VERSION_TTL:
+        return cached[0]
+    version = _load_version(user_id)  # None se il dipendente non esiste più
+    with _lock:
+        _versions[user_id] = (version, now)
+    return version
+
+
+def invalidate_user(user_id: int, new_version: int) -> None:
+    """Da chiamare dopo aver incrementato token_version (stesso processo: effetto immediato)."""
+    with _lock:
+        _versions[user_id] = (new_version, time.monotonic())
+        for token in [t for t, (u, _, _) in _cache.items() if u.id == user_id]:
+            del _cache[token]
+
+
+# =========================
+# VERIFICA
+# =========================
+def authenticate_token(token: str) -> Optional[CurrentUser]:
+    """Ritorna l'utente del token, None se non valido, scaduto o revocato."""
+    now = time.time()
+    with _lock:
+        hit = _cache.get(token)
+        if hit is not None:
+            _cache.move_to_end(token)
+
+    if hit is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            user = CurrentUser(int(payload["sub"]), models.RuoloEnum(payload["role"]))
+            hit = (user, int(payload.get("ver", 0)), float(payload["exp"]))
+        except (JWTError, KeyError, ValueError):
+            return None
+        with _lock:
+            _cache[token] = hit
+            while len(_cache) > TOKEN_CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    user, version, exp = hit
+    if exp <= now or version != _current_version(user.id):
+        with _lock:
+            _cache.pop(token, None)
+        return None
+    return user
@@ -0,0 +1,311 @@
+# benchmarks/bench_api.py
+"""
+Latenza end-to-end di tutti i router, con l'app eseguita in-process
+(httpx + ASGITransport, lifespan compreso).
+
+Per ogni endpoint: N richieste a concorrenza C, poi p50/p95/p99, richieste
+al secondo, errori (status >= 400) e picco di RSS del processo durante lo
+scenario (VmHWM, azzerato prima di ogni scenario dove Linux lo consente).
+I risultati si salvano in JSON e si confrontano con una baseline: exit 1 se
+il p95 di qualche endpoint peggiora oltre la soglia.
+
+Il DB è quello configurato (.env); va popolato prima, ad esempio:
+    python -m app.database.seed --scale 0.1
+
+Uso (dalla stessa directory di lavoro del seed):
+    python benchmarks/bench_api.py --requests 200 --concurrency 4
+    python benchmarks/bench_api.py --save baseline.json
+    python benchmarks/bench_api.py --compare baseline.json --threshold 0.2
+    python benchmarks/bench_api.py --only spese analytics --read-only
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import func, select
+
+from app.database import models
+from app.database.seed import SEED_PASSWORD
+from app.database.session import SessionLocal
+from app.main import app
+
+PDF = b"%PDF-1.4\n% scontrino benchmark\n" + b"0" * 4096
+
+Request = Tuple[str, str, dict]  # (metodo, url, argomenti per httpx)
+
+
+class Scenario:
+    __slots__ = ("name", "ruolo", "build", "max_requests", "write")
+
+    def __init__(self, name: str, ruolo: str, build: Callable[[dict, int], Request],
+                 max_requests: Optional[int] = None, write: bool = False):
+        self.name = name
+        self.ruolo = ruolo  # utente simulato con x-user-id: dipendente, manager o admin
+        self.build = build
+        self.max_requests = max_requests
+        self.write = write
+
+
+# ======================================
+# SCENARI (uno o più per router)
+# ======================================
+def _import_csv(ctx, i):
+    rows = "".join(f"{ctx['trasferta']},vitto,{10 + j},EUR,scontrino,{ctx['giorno']}\n" for j in range(20))
+    return {"files": {"file": ("import.csv", ("id_trasferta,categoria,importo,valuta,tipo_scontrino,data_spesa\n" + rows).encode())}}
+
+
+def _libero(ctx, i):
+    return (date.fromisoformat(ctx["libero"]) + timedelta(days=i)).isoformat()
+
+
+SCENARI = [
+    Scenario("root", "dipendente", lambda c, i: ("GET", "/", {})),
+    Scenario("auth.login", "dipendente", lambda c, i: (
+        "POST", "/auth/login", {"json": {"email": c["email"], "password": SEED_PASSWORD}}), max_requests=20),
+    Scenario("auth.register", "dipendente", lambda c, i: ("POST", "/auth/register", {"json": {
+        "nome": "Bench", "cognome": "API", "email": f"bench-api-{c['run']}-{i}@example.com", "password": SEED_PASSWORD}}),
+        max_requests=10, write=True),
+
+    Scenario("trasferte.miei", "dipendente", lambda c, i: ("GET", "/trasferte/miei", {"params": {"limit": 50}})),
+    Scenario("trasferte.lista", "manager", lambda c, i: ("GET", "/trasferte/", {"params": {"limit": 100}})),
+    Scenario("trasferte.lista_filtrata", "manager", lambda c, i: (
+        "GET", "/trasferte/", {"params": {"stato": "approvata", "luogo_destinazione": "Milano", "limit": 100}})),
+    Scenario("trasferte.occupazione", "manager", lambda c, i: (
+        "GET", "/trasferte/occupazione", {"params": {"dal": c["settimana_fa"], "al": c["giorno"]}})),
+    Scenario("trasferte.rimborso", "dipendente", lambda c, i: ("GET", f"/trasferte/{c['trasferta']}/rimborso", {})),
+    Scenario("trasferte.export", "manager", lambda c, i: (
+        "GET", "/trasferte/export", {"params": {"formato": "ndjson", "data_da": c["settimana_fa"]}}), max_requests=20),
+    Scenario("trasferte.crea", "dipendente", lambda c, i: ("POST", "/trasferte/", {"json": {
+        # un giorno diverso per richiesta, dopo l'ultima trasferta: niente 409 per sovrapposizione
+        "id_dipendente": c["dipendente"], "data_partenza": _libero(c, i), "data_rientro": _libero(c, i),
+        "luogo_destinazione": "Benchmark"}}), write=True),
+    Scenario("trasferte.stato", "manager", lambda c, i: ("PATCH", f"/trasferte/{c['trasferta']}/stato", {
+        "json": {"stato": "approvata" if i % 2 else "inviata"}}), write=True),
+
+    Scenario("spese.mine", "dipendente", lambda c, i: ("GET", "/spese/mine", {"params": {"limit": 50}})),
+    Scenario("spese.lista", "manager", lambda c, i: ("GET", "/spese/", {"params": {"limit": 100}})),
+    Scenario("spese.lista_trasferta", "manager", lambda c, i: (
+        "GET", "/spese/", {"params": {"id_trasferta": c["trasferta"], "limit": 100}})),
+    Scenario("spese.upload", "dipendente", lambda c, i: ("POST", "/spese/", {
+        "data": {"id_trasferta": c["trasferta"], "categoria": "vitto", "importo": 12.5, "data_spesa": c["giorno"]},
+        "files": [("files", ("scontrino.pdf", PDF, "application/pdf"))]}), write=True),
+    Scenario("spese.import", "dipendente", lambda c, i: ("POST", "/spese/import", _import_csv(c, i)),
+             max_requests=20, write=True),
+    Scenario("spese.file", "dipendente", lambda c, i: ("GET", f"/spese/file/{c['file']}", {})),
+    Scenario("spese.export", "dipendente", lambda c, i: (
+        "GET", "/spese/export", {"params": {"id_trasferta": c["trasferta"]}}), max_requests=50),
+
+    Scenario("prenotazioni.mie", "dipendente", lambda c, i: ("GET", "/prenotazioni/mie", {"params": {"limit": 50}})),
+    Scenario("prenotazioni.lista", "manager", lambda c, i: ("GET", "/prenotazioni/", {"params": {"limit": 100}})),
+    Scenario("prenotazioni.export", "manager", lambda c, i: (
+        "GET", "/prenotazioni/export", {"params": {"id_trasferta": c["trasferta"]}}), max_requests=50),
+
+    Scenario("admin.dipendenti", "dipendente", lambda c, i: ("GET", "/admin/dipendenti", {"params": {"limit": 200}})),
+    Scenario("admin.utenti", "admin", lambda c, i: ("GET", "/admin/utenti", {"params": {"limit": 200, "area_lavoro": "IT"}})),
+    Scenario("admin.tassi_cambio", "admin", lambda c, i: ("POST", "/admin/tassi-cambio", {
+        "files": {"file": ("tassi.csv", f"data,valuta,tasso\n2000-01-0{1 + i % 9},XBN,1.5\n".encode())}}),
+        max_requests=20, write=True),
+
+    Scenario("analytics.mesi_interi", "manager", lambda c, i: ("GET", "/analytics/spese", {
+        "params": {"group_by": ["area_lavoro", "categoria"], "data_da": c["anno_da"], "data_a": c["anno_a"]}})),
+    Scenario("analytics.intervallo", "manager", lambda c, i: ("GET", "/analytics/spese", {
+        "params": {"group_by": ["mese", "categoria"], "data_da": c["settimana_fa"], "data_a": c["giorno"]}}),
+        max_requests=20),
+]
+
+
+# ======================================
+# CONTESTO: utenti e id dal DB
+# ======================================
+def discover() -> dict:
+    db = SessionLocal()
+    try:
+        t, s, d = models.Trasferta, models.Spesa, models.Dipendente
+        admin = db.query(d.id).filter(d.ruolo == models.RuoloEnum.admin).order_by(d.id).limit(1).scalar()
+        manager = db.query(d.id).filter(d.ruolo == models.RuoloEnum.manager).order_by(d.id).limit(1).scalar()
+        busiest = db.execute(
+            select(t.id_dipendente).join(d, d.id == t.id_dipendente)
+            .where(d.ruolo == models.RuoloEnum.dipendente)
+            .group_by(t.id_dipendente).order_by(func.count().desc()).limit(1)
+        ).scalar()
+        if busiest is None or (admin or manager) is None:
+            sys.exit("DB vuoto o senza admin/manager: eseguire prima python -m app.database.seed")
+        trasferta = db.execute(
+            select(s.id_trasferta).join(t, t.id == s.id_trasferta)
+            .where(t.id_dipendente == busiest).order_by(s.id.desc()).limit(1)
+        ).scalar() or db.query(t.id).filter(t.id_dipendente == busiest).limit(1).scalar()
+        file_id = db.execute(
+            select(models.SpesaFile.id).join(s, s.id == models.SpesaFile.id_spesa)
+            .where(s.id_trasferta == trasferta).limit(1)
+        ).scalar()
+        email = db.query(d.email).filter(d.id == busiest).scalar()
+        ultimo_rientro = db.query(func.max(t.data_rientro)).filter(t.id_dipendente == busiest).scalar()
+    finally:
+        db.close()
+
+    today = date.today()
+    return {
+        "run": int(time.time()),
+        "dipendente": busiest, "manager": manager or admin, "admin": admin or manager,
+        "email": email, "trasferta": trasferta, "file": file_id,
+        "libero": (max(ultimo_rientro or today, today) + timedelta(days=1)).isoformat(),
+        "giorno": today.isoformat(), "settimana_fa": (today - timedelta(days=7)).isoformat(),
+        "anno_da": date(today.year - 1, 1, 1).isoformat(), "anno_a": date(today.year - 1, 12, 31).isoformat(),
+    }
+
+
+# ======================================
+# MEMORIA
+# ======================================
+def reset_peak_rss() -> None:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")  # azzera VmHWM (Linux >= 4.0)
+    except OSError:
+        pass
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        # non azzerabile: picco dall'avvio del processo (kB su Linux, byte su macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        return None
+
+
+# ======================================
+# ESECUZIONE
+# ======================================
+def _pct(values: List[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] * 1000 if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] * 1000
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, ctx: dict,
+                       requests: int, concurrency: int) -> dict:
+    total = min(requests, scenario.max_requests or requests)
+    headers = {"x-user-id": str(ctx[scenario.ruolo])}
+    counter = itertools.count()
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+
+    async def worker():
+        while (i := next(counter)) < total:
+            method, url, kwargs = scenario.build(ctx, i)
+            start = time.perf_counter()
+            r = await client.request(method, url, headers=headers, **kwargs)
+            await r.aread()
+            latencies.append(time.perf_counter() - start)
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    reset_peak_rss()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+    elapsed = time.perf_counter() - start
+    return {
+        "n": total,
+        "errori": sum(n for code, n in statuses.items() if code >= 400),
+        "status": {str(k): v for k, v in sorted(statuses.items())},
+        "rps": total / elapsed if elapsed else 0.0,
+        "p50_ms": _pct(latencies, 50),
+        "p95_ms": _pct(latencies, 95),
+        "p99_ms": _pct(latencies, 99),
+        "rss_mb": peak_rss_mb(),
+    }
+
+
+async def run(args) -> Dict[str, dict]:
+    ctx = discover()
+    scenari = [s for s in SCENARI
+               if (not args.only or any(s.name.startswith(p) for p in args.only))
+               and not (args.read_only and s.write)
+               and not (s.name == "spese.file" and ctx["file"] is None)]
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async with app.router.lifespan_context(app):
+            print(f"{'endpoint':<28} {'n':>5} {'err':>4} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'RSS MB':>7}")
+            for scenario in scenari:
+                # una richiesta di riscaldamento (import, cache, connessioni)
+                method, url, kwargs = scenario.build(ctx, -1)
+                if not scenario.write:
+                    await client.request(method, url, headers={"x-user-id": str(ctx[scenario.ruolo])}, **kwargs)
+                r = await run_scenario(client, scenario, ctx, args.requests, args.concurrency)
+                results[scenario.name] = r
+                rss = f"{r['rss_mb']:.0f}" if r["rss_mb"] is not None else "-"
+                print(f"{scenario.name:<28} {r['n']:>5} {r['errori']:>4} {r['rps']:>8.1f} "
+                      f"{r['p50_ms']:>6.1f}ms {r['p95_ms']:>6.1f}ms {r['p99_ms']:>6.1f}ms {rss:>7}")
+    return results
+
+
+# ======================================
+# BASELINE
+# ======================================
+def compare(results: Dict[str, dict], baseline_path: str, threshold: float) -> bool:
+    """Stampa le differenze con la baseline; False se qualche p95 peggiora oltre la soglia."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["risultati"]
+    ok = True
+    print(f"\n{'endpoint':<28} {'p95 base':>9} {'p95 ora':>9} {'delta':>7} {'req/s delta':>12}")
+    for name, now in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<28} {'-':>9} {now['p95_ms']:>7.1f}ms {'nuovo':>7}")
+            continue
+        delta = now["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rps_delta = now["rps"] / before["rps"] - 1 if before["rps"] else 0.0
+        flag = ""
+        if delta > threshold:
+            ok, flag = False, "  <-- regressione"
+        print(f"{name:<28} {before['p95_ms']:>7.1f}ms {now['p95_ms']:>7.1f}ms {delta:>+6.0%} {rps_delta:>+11.0%}{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end degli endpoint (in-process)")
+    parser.add_argument("--requests", type=int, default=200, help="richieste per endpoint")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--only", nargs="+", help="prefissi degli scenari da eseguire (es. spese analytics)")
+    parser.add_argument("--read-only", action="store_true", help="salta gli scenari che scrivono")
+    parser.add_argument("--save", help="salva i risultati in questo file JSON")
+    parser.add_argument("--compare", help="baseline JSON con cui confrontare")
+    parser.add_argument("--threshold", type=float, default=0.2, help="peggioramento del p95 tollerato (0.2 = +20%%)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "meta": {"data": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                         "requests": args.requests, "concurrency": args.concurrency},
+                "risultati": results,
+            }, f, indent=2)
+        print(f"\nrisultati salvati in {args.save}")
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
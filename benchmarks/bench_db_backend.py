@@ -0,0 +1,120 @@
+# benchmarks/bench_db_backend.py
+"""
+Throughput letture/scritture con N thread concorrenti, direttamente sull'ORM.
+
+Di default confronta SQLite "di fabbrica" (journal DELETE, synchronous FULL)
+con SQLite configurato come in app/database/session.py (WAL, NORMAL,
+busy_timeout, cache più grande), su file temporanei.
+Con --configured usa invece l'engine costruito da .env (es. MySQL/PostgreSQL).
+
+Uso:
+    python benchmarks/bench_db_backend.py --workers 1 4 16 --duration 5
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.database import models, session
+from app.database.base import Base
+
+
+def prepare(engine):
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        if not db.query(models.Dipendente).first():
+            db.add(models.Dipendente(nome="Bench", cognome="DB", email="bench-db@example.com", password="x"))
+            db.commit()
+        user_id = db.query(models.Dipendente.id).scalar()
+        db.add_all([
+            models.Trasferta(id_dipendente=user_id, data_partenza=date(2024, 1, 1),
+                             data_rientro=date(2024, 1, 2), luogo_destinazione="Milano")
+            for _ in range(200)
+        ])
+        db.commit()
+    return Session, user_id
+
+
+def worker(Session, user_id, deadline, write_ratio, counts, lock):
+    reads = writes = errors = 0
+    rnd = random.Random()
+    while time.perf_counter() < deadline:
+        try:
+            with Session() as db:
+                if rnd.random() < write_ratio:
+                    db.add(models.Trasferta(id_dipendente=user_id, data_partenza=date(2024, 2, 1),
+                                            data_rientro=date(2024, 2, 3), luogo_destinazione="Roma"))
+                    db.commit()
+                    writes += 1
+                else:
+                    db.query(models.Trasferta).filter(models.Trasferta.id_dipendente == user_id) \
+                        .order_by(models.Trasferta.id.desc()).limit(50).all()
+                    reads += 1
+        except OperationalError:
+            errors += 1  # "database is locked"
+    with lock:
+        counts["reads"] += reads
+        counts["writes"] += writes
+        counts["errors"] += errors
+
+
+def run(Session, user_id, workers, duration, write_ratio):
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=worker, args=(Session, user_id, deadline, write_ratio, counts, lock))
+               for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return counts
+
+
+def sqlite_engine(path, tuned):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    if tuned:
+        event.listen(engine, "connect", session.set_sqlite_pragmas)
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--configured", action="store_true", help="usa l'engine configurato da .env")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.configured:
+            targets = [(str(session.DATABASE_URL.render_as_string(hide_password=True)), session.engine)]
+        else:
+            targets = [
+                ("sqlite default", sqlite_engine(os.path.join(tmp, "plain.sqlite3"), tuned=False)),
+                ("sqlite tuned", sqlite_engine(os.path.join(tmp, "tuned.sqlite3"), tuned=True)),
+            ]
+
+        print(f"{'engine':<24} {'workers':>7} {'read/s':>9} {'write/s':>9} {'locked':>7}")
+        for name, engine in targets:
+            Session, user_id = prepare(engine)
+            for w in args.workers:
+                c = run(Session, user_id, w, args.duration, args.write_ratio)
+                print(f"{name:<24} {w:>7} {c['reads'] / args.duration:>9.1f} "
+                      f"{c['writes'] / args.duration:>9.1f} {c['errors']:>7}")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
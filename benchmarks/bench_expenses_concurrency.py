@@ -0,0 +1,106 @@
+# benchmarks/bench_expenses_concurrency.py
+"""
+Traffico misto su /spese (upload + liste) a concorrenza crescente,
+con l'app eseguita in-process (httpx + ASGITransport).
+
+Uso (da una directory di lavoro vuota: usa ./db.sqlite3 e ./uploads):
+    python benchmarks/bench_expenses_concurrency.py --duration 5 --concurrency 1 8 32
+
+Per confrontare con un'altra versione basta rieseguirlo dopo un git checkout.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app.database import models
+from app.database.session import SessionLocal, create_tables
+from app.main import app
+
+USER_ID = 1
+
+
+def seed() -> int:
+    create_tables()
+    db = SessionLocal()
+    try:
+        if not db.get(models.Dipendente, USER_ID):
+            db.add(models.Dipendente(id=USER_ID, nome="Bench", cognome="User",
+                                     email="bench@example.com", password="x"))
+        trasferta = models.Trasferta(id_dipendente=USER_ID, data_partenza=date(2024, 1, 1),
+                                     data_rientro=date(2024, 1, 3), luogo_destinazione="Milano")
+        db.add(trasferta)
+        db.commit()
+        return trasferta.id
+    finally:
+        db.close()
+
+
+async def worker(client, trasferta_id, payload, deadline, upload_ratio, latencies, i):
+    n = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if (n + i) % upload_ratio == 0:
+            r = await client.post(
+                "/spese/",
+                data={"id_trasferta": trasferta_id, "categoria": "vitto", "importo": 12.5,
+                      "data_spesa": "2024-01-02"},
+                files=[("files", ("scontrino.pdf", payload, "application/pdf"))],
+            )
+            kind = "upload"
+        else:
+            r = await client.get("/spese/mine", params={"limit": 50})
+            kind = "list"
+        r.raise_for_status()
+        latencies[kind].append(time.perf_counter() - start)
+        n += 1
+
+
+async def run(concurrency, duration, trasferta_id, payload, upload_ratio):
+    transport = httpx.ASGITransport(app=app)
+    latencies = {"upload": [], "list": []}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 headers={"x-user-id": str(USER_ID)}) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            worker(client, trasferta_id, payload, deadline, upload_ratio, latencies, i)
+            for i in range(concurrency)
+        ))
+    return latencies
+
+
+def pct(values, q):
+    if not values:
+        return 0.0
+    return statistics.quantiles(values, n=100)[q - 1] * 1000 if len(values) > 1 else values[0] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--file-kb", type=int, default=256)
+    parser.add_argument("--upload-ratio", type=int, default=4, help="1 upload ogni N richieste")
+    args = parser.parse_args()
+
+    trasferta_id = seed()
+    payload = os.urandom(args.file_kb * 1024)
+
+    print(f"{'conc':>5} {'req/s':>8} {'list p50':>9} {'list p95':>9} {'upl p50':>9} {'upl p95':>9}")
+    for c in args.concurrency:
+        lat = asyncio.run(run(c, args.duration, trasferta_id, payload, args.upload_ratio))
+        total = len(lat["upload"]) + len(lat["list"])
+        print(f"{c:>5} {total / args.duration:>8.1f} "
+              f"{pct(lat['list'], 50):>8.1f}ms {pct(lat['list'], 95):>8.1f}ms "
+              f"{pct(lat['upload'], 50):>8.1f}ms {pct(lat['upload'], 95):>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/bench_login.py
+"""
+Raffica di login concorrenti + traffico "leggero" su GET / nello stesso momento.
+Misura login/s, quante risposte 503 (pool saturo) e la latenza delle altre
+richieste durante la raffica.
+
+Uso (da una directory di lavoro vuota: usa ./db.sqlite3):
+    PASSWORD_POOL_SIZE=4 PASSWORD_POOL_QUEUE=16 \
+        python benchmarks/bench_login.py --users 50 --concurrency 64 --duration 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app.main import app
+
+PASSWORD = "password-di-prova"
+
+
+async def login_worker(client, emails, deadline, stats, i):
+    n = i
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        r = await client.post("/auth/login", json={"email": emails[n % len(emails)], "password": PASSWORD})
+        stats[r.status_code] = stats.get(r.status_code, 0) + 1
+        if r.status_code == 200:
+            stats["latency"].append(time.perf_counter() - start)
+        elif r.status_code == 503:
+            await asyncio.sleep(0.05)  # un client reale rispetta (in parte) Retry-After
+        n += 1
+
+
+async def probe_worker(client, deadline, latencies):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get("/")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+async def main(args):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        async with app.router.lifespan_context(app):
+            emails = []
+            for i in range(args.users):
+                email = f"bench{i}@example.com"
+                r = await client.post("/auth/register", json={
+                    "nome": "Bench", "cognome": str(i), "email": email, "password": PASSWORD,
+                })
+                if r.status_code not in (200, 400):
+                    r.raise_for_status()
+                emails.append(email)
+
+            stats = {"latency": []}
+            probe = []
+            deadline = time.perf_counter() + args.duration
+            await asyncio.gather(
+                probe_worker(client, deadline, probe),
+                *(login_worker(client, emails, deadline, stats, i) for i in range(args.concurrency)),
+            )
+
+    ok = stats.get(200, 0)
+    print(f"login ok/s:       {ok / args.duration:.1f}")
+    print(f"risposte 503:     {stats.get(503, 0)}")
+    if stats["latency"]:
+        print(f"login p50:        {statistics.median(stats['latency']) * 1000:.1f}ms")
+    if len(probe) > 1:
+        q = statistics.quantiles(probe, n=100)
+        print(f"GET / p50 / p99:  {q[49] * 1000:.1f}ms / {q[98] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
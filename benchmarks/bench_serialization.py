@@ -0,0 +1,103 @@
+# benchmarks/bench_serialization.py
+"""
+Righe al secondo per una lista di trasferte: percorso FastAPI/Pydantic
+(oggetti ORM -> TrasfertaRead -> jsonable_encoder -> json.dumps) contro
+app/serialization.py (tuple di colonne -> RowSerializer, orjson o json).
+
+Misura sia solo la serializzazione sia lettura + serializzazione, su un
+SQLite in memoria.
+
+Uso:
+    python benchmarks/bench_serialization.py --rows 20000 --repeat 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import serialization
+from app.database import models, schemas
+from app.database.base import Base
+
+SERIALIZER = serialization.RowSerializer(schemas.TrasfertaRead, models.Trasferta)
+
+
+def prepare(rows: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    base = datetime(2024, 1, 1)
+    with Session() as db:
+        db.add(models.Dipendente(id=1, nome="Bench", cognome="JSON", email="bench-json@example.com", password="x"))
+        db.bulk_insert_mappings(models.Trasferta, [
+            {"id_dipendente": 1, "data_partenza": date(2024, 1, 1) + timedelta(days=i % 365),
+             "data_rientro": date(2024, 1, 3) + timedelta(days=i % 365), "luogo_destinazione": f"Città {i % 50}",
+             "tipo_commessa": "interna", "note_dipendente": "nota àèì", "created_at": base + timedelta(seconds=i),
+             "updated_at": base + timedelta(seconds=i)}
+            for i in range(rows)
+        ])
+        db.commit()
+    return Session
+
+
+def pydantic_body(objs) -> bytes:
+    # quello che fa FastAPI con response_model=List[TrasfertaRead]
+    content = jsonable_encoder(parse_obj_as(List[schemas.TrasfertaRead], objs))
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def best(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serializzazione liste (Pydantic vs RowSerializer)")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    Session = prepare(args.rows)
+    with Session() as db:
+        objs = db.query(models.Trasferta).all()
+        tuples = db.query(*SERIALIZER.columns).all()
+        if json.loads(pydantic_body(objs)) != json.loads(SERIALIZER.dumps(tuples)):
+            sys.exit("i due percorsi producono JSON diversi")
+
+        orjson = serialization.orjson
+        read_objs = lambda: db.query(models.Trasferta).all()
+        read_tuples = lambda: db.query(*SERIALIZER.columns).all()
+        cases = [("pydantic + json.dumps", None, lambda: pydantic_body(objs), lambda: pydantic_body(read_objs()))]
+        if orjson is not None:
+            cases.append(("RowSerializer (orjson)", orjson, lambda: SERIALIZER.dumps(tuples),
+                          lambda: SERIALIZER.dumps(read_tuples())))
+        cases.append(("RowSerializer (json)", None, lambda: SERIALIZER.dumps(tuples),
+                      lambda: SERIALIZER.dumps(read_tuples())))
+
+        print(f"{'percorso':<24} {'serializza righe/s':>19} {'query+serializza righe/s':>25}")
+        try:
+            for name, encoder, encode_only, end_to_end in cases:
+                serialization.orjson = encoder
+                t_encode = best(encode_only, args.repeat)
+                t_total = best(lambda: (db.expunge_all(), end_to_end()), args.repeat)
+                print(f"{name:<24} {args.rows / t_encode:>19,.0f} {args.rows / t_total:>25,.0f}")
+        finally:
+            serialization.orjson = orjson
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# tests/conftest.py
+"""
+Fixture comuni: database SQLite e archivio allegati in una cartella
+temporanea, schema creato dalle migrazioni all'avvio dell'app.
+
+La configurazione va impostata prima di importare app.* (i moduli la
+leggono da os.environ all'import).
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import date
+
+_TMP = tempfile.mkdtemp(prefix="trasferte-test-")
+os.environ.update(
+    DB_TYPE="sqlite",
+    SQLITE_PATH=os.path.join(_TMP, "test.sqlite3"),
+    ATTACHMENTS_DIR=os.path.join(_TMP, "uploads"),
+    PASSWORD_POOL_SIZE="0",
+    AUTH_ALLOW_MOCK="1",
+    PROFILING_ENABLED="0",
+)
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.engine import Engine  # noqa: E402
+
+from app import response_cache  # noqa: E402
+from app.database import models, session  # noqa: E402
+from app.database.base import Base  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_TMP, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as c:
+        yield c
+    session.engine.dispose()
+
+
+@pytest.fixture
+def db(client):
+    """Sessione su un database svuotato (lo schema resta)."""
+    with session.engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    response_cache.clear()
+    db = session.SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@contextmanager
+def count_queries():
+    """SQL eseguito nel blocco, su tutti gli Engine (anche quello asincrono)."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", before_cursor_execute)
+
+
+def headers(user: models.Dipendente) -> dict:
+    # utente simulato (AUTH_ALLOW_MOCK=1), vedi app/dependencies.py
+    return {"x-user-id": str(user.id)}
+
+
+def add_dipendente(db, ruolo=models.RuoloEnum.dipendente, area_lavoro=None) -> models.Dipendente:
+    n = db.query(models.Dipendente).count() + 1
+    user = models.Dipendente(nome="Test", cognome=str(n), email=f"test{n}@example.com", password="x",
+                             ruolo=ruolo, area_lavoro=area_lavoro)
+    db.add(user)
+    db.commit()
+    return user
+
+
+def add_trasferta(db, dipendente: models.Dipendente, partenza: date, rientro: date,
+                  stato=models.StatoTrasfertaEnum.inviata, luogo="Milano") -> models.Trasferta:
+    trasferta = models.Trasferta(id_dipendente=dipendente.id, data_partenza=partenza, data_rientro=rientro,
+                                 luogo_destinazione=luogo, stato=stato)
+    db.add(trasferta)
+    db.commit()
+    return trasferta
@@ -0,0 +1,31 @@
+# tests/test_auth.py
+from app.hashing import hash_password
+from jose import jwt
+
+from app.tokens import ALGORITHM, SECRET_KEY
+from tests.conftest import add_dipendente, count_queries
+
+
+def test_login_una_sola_query(client, db):
+    user = add_dipendente(db)
+    user.password = hash_password("segreta")
+    db.commit()
+    email, user_id = user.email, user.id
+
+    with count_queries() as statements:
+        r = client.post("/auth/login", json={"email": email, "password": "segreta"})
+
+    assert r.status_code == 200, r.text
+    assert [s.split()[0] for s in statements] == ["SELECT"]
+    claims = jwt.decode(r.json()["access_token"], SECRET_KEY, algorithms=[ALGORITHM])
+    assert (claims["sub"], claims["role"], claims["ver"]) == (str(user_id), "dipendente", 0)
+
+
+def test_login_password_errata(client, db):
+    user = add_dipendente(db)
+    user.password = hash_password("segreta")
+    db.commit()
+
+    r = client.post("/auth/login", json={"email": user.email, "password": "sbagliata"})
+
+    assert r.status_code == 401
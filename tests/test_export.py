@@ -0,0 +1,17 @@
+# tests/test_export.py
+import pytest
+
+from app.database import models
+from tests.conftest import add_dipendente, headers
+
+
+@pytest.mark.parametrize("path", ["/spese/export", "/trasferte/export", "/prenotazioni/export"])
+def test_export_solo_manager_e_admin(client, db, path):
+    dipendente = add_dipendente(db)
+    manager = add_dipendente(db, models.RuoloEnum.manager)
+
+    assert client.get(path).status_code in (401, 403)  # senza credenziali
+    assert client.get(path, headers=headers(dipendente)).status_code == 403
+    r = client.get(path, headers=headers(manager))
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
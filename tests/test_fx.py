@@ -0,0 +1,33 @@
+# tests/test_fx.py
+import pytest
+
+from app import fx
+from app.database import models
+from tests.conftest import add_dipendente, headers
+
+ECB_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<gesmes:Envelope xmlns:gesmes="http://www.gesmes.org/xml/2002-08-01" xmlns="http://www.ecb.int/vocabulary/2002-08-01/eurofxref">
+  <Cube><Cube time="2024-03-01">%s</Cube></Cube>
+</gesmes:Envelope>"""
+
+
+def test_parse_ecb_xml():
+    rows = fx.parse_file(ECB_XML % b'<Cube currency="USD" rate="1.08"/><Cube currency="gbp" rate="0.85"/>', "eurofxref.xml")
+    assert [(v, g.isoformat(), t) for v, g, t in rows] == [("USD", "2024-03-01", 1.08), ("GBP", "2024-03-01", 0.85)]
+
+
+def test_parse_ecb_xml_senza_rate():
+    with pytest.raises(ValueError, match="rate"):
+        fx.parse_file(ECB_XML % b'<Cube currency="USD"/>', "eurofxref.xml")
+
+
+@pytest.mark.parametrize("content", [
+    ECB_XML % b'<Cube currency="USD"/>',
+    ECB_XML % b'<Cube currency="USD" rate="abc"/>',
+    b"<Cube><Cube time=",
+])
+def test_import_file_malformato_400(client, db, content):
+    admin = add_dipendente(db, models.RuoloEnum.admin)
+    r = client.post("/admin/tassi-cambio", files={"file": ("eurofxref.xml", content, "text/xml")}, headers=headers(admin))
+    assert r.status_code == 400, r.text
+    assert r.json()["detail"].startswith("File tassi non valido")
@@ -0,0 +1,107 @@
+# tests/test_indexes.py
+"""
+EXPLAIN QUERY PLAN delle query principali: devono usare gli indici delle
+migrazioni (0002, 0004, 0008, 0009) invece di una scansione completa.
+Database SQLite a parte, creato con le migrazioni e non con create_all.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, select, text, tuple_
+
+from app.database import models
+from app.database.migrations import upgrade_database
+
+ROWS = 2000
+
+
+def seed(engine, rows):
+    rnd = random.Random(0)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(models.Dipendente.__table__.insert(), [
+            {"id": i, "nome": "N", "cognome": str(i), "email": f"u{i}@example.com", "password": "x",
+             "token_version": 0} for i in range(1, 51)
+        ])
+        conn.execute(models.Trasferta.__table__.insert(), [
+            {"id": i, "id_dipendente": rnd.randint(1, 50), "data_partenza": date(2024, 1, 1) + timedelta(days=i % 300),
+             "data_rientro": date(2024, 1, 3) + timedelta(days=i % 300), "luogo_destinazione": "Milano",
+             "stato": rnd.choice(list(models.StatoTrasfertaEnum)).name, "created_at": start + timedelta(minutes=i)}
+            for i in range(1, rows + 1)
+        ])
+        conn.execute(models.Spesa.__table__.insert(), [
+            {"id": i, "id_trasferta": rnd.randint(1, rows), "categoria": "vitto", "importo": 10.0,
+             "tipo_scontrino": "altro", "data_spesa": date(2024, 1, 2), "created_at": start + timedelta(minutes=i)}
+            for i in range(1, rows * 2 + 1)
+        ])
+        conn.execute(text("ANALYZE"))
+
+
+def page(stmt, model, limit=50):
+    # stessa forma di app.pagination._keyset (ordine desc, con cursore)
+    key = tuple_(model.created_at, model.id)
+    return (stmt.where(key < tuple_(datetime(2030, 1, 1), 10 ** 9))
+            .order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1))
+
+
+T, S, F = models.Trasferta, models.Spesa, models.SpesaFile
+R, B = models.SpesaRollup.__table__, models.SpesaRollupBucket.__table__
+QUERIES = [
+    ("trasferte del dipendente", "ix_trasferte_dipendente_periodo",
+     page(select(T).where(T.id_dipendente == 7), T)),
+    ("trasferte del dipendente per periodo", "ix_trasferte_dipendente_periodo",
+     select(T).where(T.id_dipendente == 7, T.data_partenza >= date(2024, 3, 1), T.data_partenza <= date(2024, 4, 1))),
+    ("sovrapposizione (periodi.sovrapposta)", "ix_trasferte_dipendente_periodo",
+     select(T.id, T.data_partenza, T.data_rientro)
+     .where(T.id_dipendente == 7, T.data_partenza <= date(2024, 5, 1), T.stato != models.StatoTrasfertaEnum.rifiutata)
+     .order_by(T.data_partenza.desc()).limit(1)),
+    ("occupazione per intervallo", "ix_trasferte_stato_rientro",
+     select(T.id).where(T.stato.in_([models.StatoTrasfertaEnum.approvata, models.StatoTrasfertaEnum.completata]),
+                        T.data_rientro >= date(2024, 9, 1), T.data_partenza <= date(2024, 9, 7))),
+    ("coda approvazioni", "ix_trasferte_stato_created",
+     select(T).where(T.stato == models.StatoTrasfertaEnum.inviata).order_by(T.created_at).limit(50)),
+    ("tutte le trasferte (pagina)", "ix_trasferte_created",
+     page(select(T), T)),
+    ("spese di una trasferta", "ix_spese_trasferta_data",
+     select(S).where(S.id_trasferta == 42).order_by(S.data_spesa)),
+    ("spese del dipendente", "ix_trasferte_dipendente_periodo",
+     page(select(S).join(T).where(T.id_dipendente == 7), S)),
+    ("tutte le spese (pagina)", "ix_spese_created",
+     page(select(S), S)),
+    ("allegati delle spese", "ix_spesa_files_id_spesa",
+     select(F).where(F.id_spesa.in_([1, 2, 3]))),
+    ("blob ancora usato (delete_spesa_file)", "ix_spesa_files_sha256",
+     select(F.id).where(F.sha256 == "0" * 64).limit(1)),
+    ("prenotazioni di una trasferta", "ix_prenotazioni_id_trasferta",
+     select(models.Prenotazione).where(models.Prenotazione.id_trasferta == 42)),
+    # rollup.apply_changes: righe azzerate cercate per chiave primaria, non con una scansione
+    ("rollup azzerato", "sqlite_autoindex_spese_rollup_1",
+     R.delete().where(R.c.mese == date(2024, 1, 1), R.c.id_dipendente == 7, R.c.categoria == "vitto",
+                      R.c.luogo_destinazione == "Milano", R.c.valuta == "EUR", R.c.n_voci <= 0)),
+    ("bucket azzerato", "sqlite_autoindex_spese_rollup_bucket_1",
+     B.delete().where(B.c.mese == date(2024, 1, 1), B.c.id_dipendente == 7, B.c.categoria == "vitto",
+                      B.c.luogo_destinazione == "Milano", B.c.valuta == "EUR", B.c.bucket == 30, B.c.n_voci <= 0)),
+]
+
+
+def query_plan(conn, stmt):
+    compiled = stmt.compile(conn, compile_kwargs={"literal_binds": True})
+    return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))]
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('indexes') / 'explain.sqlite3'}")
+    upgrade_database(engine)
+    seed(engine, ROWS)
+    with engine.connect() as conn:
+        yield conn
+    engine.dispose()
+
+
+@pytest.mark.parametrize("index, stmt", [(index, stmt) for _, index, stmt in QUERIES],
+                         ids=[name for name, _, _ in QUERIES])
+def test_query_usa_indice(conn, index, stmt):
+    plan = query_plan(conn, stmt)
+    assert any(index in step for step in plan), "\n".join(plan)
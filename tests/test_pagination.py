@@ -0,0 +1,43 @@
+# tests/test_pagination.py
+"""Paginazione keyset su (created_at, id): nessuna riga persa o ripetuta tra le pagine."""
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.database import models
+from app.pagination import NEXT_CURSOR_HEADER
+from tests.conftest import add_dipendente, add_trasferta, headers
+
+
+@pytest.mark.parametrize("order", ["desc", "asc"])
+def test_tutte_le_righe_una_volta(client, db, order):
+    user = add_dipendente(db)
+    ids = []
+    for i in range(7):
+        trasferta = add_trasferta(db, user, date(2024, 1, 1), date(2024, 1, 2))
+        # stesso created_at a coppie: decide l'id
+        trasferta.created_at = datetime(2024, 1, 1 + i // 2)
+        ids.append(trasferta.id)
+    db.commit()
+
+    visti, params = [], {"limit": 2, "order": order}
+    while True:
+        r = client.get("/trasferte/miei", params=params, headers=headers(user))
+        assert r.status_code == 200
+        visti += [t["id"] for t in r.json()]
+        if NEXT_CURSOR_HEADER not in r.headers:
+            break
+        params["cursor"] = r.headers[NEXT_CURSOR_HEADER]
+    assert visti == (ids if order == "asc" else ids[::-1])
+
+
+def test_created_at_obbligatorio(client, db):
+    # un NULL non avrebbe cursore e uscirebbe dal confronto (created_at, id)
+    user = add_dipendente(db)
+    trasferta = add_trasferta(db, user, date(2024, 1, 1), date(2024, 1, 2))
+    trasferta.created_at = None
+    with pytest.raises(IntegrityError):
+        db.commit()
+    db.rollback()
+    assert db.get(models.Trasferta, trasferta.id).created_at is not None
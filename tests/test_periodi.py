@@ -0,0 +1,148 @@
+# tests/test_periodi.py
+"""Trasferte sovrapposte: 409 in creazione/riattivazione, serializzazione per dipendente, audit."""
+import threading
+import time
+from datetime import date
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import response_cache
+from app.database import models, periodi, session
+from app.routers import users
+from tests.conftest import add_dipendente, add_trasferta, headers
+
+S = models.StatoTrasfertaEnum
+
+
+def nuova(user: models.Dipendente, partenza: date, rientro: date, **extra) -> dict:
+    return {"id_dipendente": user.id, "data_partenza": partenza.isoformat(), "data_rientro": rientro.isoformat(),
+            "luogo_destinazione": "Roma", **extra}
+
+
+@pytest.mark.parametrize("partenza, rientro", [
+    (date(2024, 5, 3), date(2024, 5, 4)),    # dentro
+    (date(2024, 4, 28), date(2024, 5, 1)),   # tocca la partenza (estremi inclusi)
+    (date(2024, 5, 5), date(2024, 5, 9)),    # tocca il rientro
+    (date(2024, 4, 1), date(2024, 6, 1)),    # la contiene
+])
+def test_creazione_sovrapposta_409(client, db, partenza, rientro):
+    user = add_dipendente(db)
+    esistente = add_trasferta(db, user, date(2024, 5, 1), date(2024, 5, 5))
+
+    r = client.post("/trasferte/", json=nuova(user, partenza, rientro), headers=headers(user))
+
+    assert r.status_code == 409
+    assert f"trasferta {esistente.id}" in r.json()["detail"]
+
+
+def test_lock_non_invalida_la_cache_dipendenti(client, db):
+    user = add_dipendente(db)
+    prima = response_cache.generations(["dipendenti", "trasferte"])
+
+    r = client.post("/trasferte/", json=nuova(user, date(2024, 5, 1), date(2024, 5, 5)), headers=headers(user))
+
+    assert r.status_code == 200, r.text
+    dipendenti, trasferte = response_cache.generations(["dipendenti", "trasferte"])
+    assert dipendenti == prima[0]
+    assert trasferte > prima[1]
+
+
+def test_creazione_libera(client, db):
+    user, altro = add_dipendente(db), add_dipendente(db)
+    add_trasferta(db, user, date(2024, 5, 1), date(2024, 5, 5))
+    add_trasferta(db, user, date(2024, 5, 10), date(2024, 5, 12), S.rifiutata)
+    add_trasferta(db, altro, date(2024, 5, 6), date(2024, 5, 9))
+
+    # dopo il rientro, sopra una rifiutata, sopra la trasferta di un altro
+    r = client.post("/trasferte/", json=nuova(user, date(2024, 5, 6), date(2024, 5, 11)), headers=headers(user))
+    assert r.status_code == 200, r.text
+    # una trasferta creata già rifiutata non occupa il periodo
+    r = client.post("/trasferte/", json=nuova(user, date(2024, 5, 1), date(2024, 5, 2), stato="rifiutata"),
+                    headers=headers(user))
+    assert r.status_code == 200, r.text
+
+
+def test_riattivazione_sovrapposta_409(client, db):
+    manager = add_dipendente(db, models.RuoloEnum.manager)
+    user = add_dipendente(db)
+    add_trasferta(db, user, date(2024, 5, 1), date(2024, 5, 5))
+    rifiutata = add_trasferta(db, user, date(2024, 5, 4), date(2024, 5, 8), S.rifiutata)
+
+    r = client.patch(f"/trasferte/{rifiutata.id}/stato", json={"stato": "approvata"}, headers=headers(manager))
+
+    assert r.status_code == 409
+    db.expire_all()
+    assert db.get(models.Trasferta, rifiutata.id).stato == S.rifiutata
+
+
+def test_router_users_409(client, db):
+    legacy = FastAPI()
+    legacy.include_router(users.router)
+    legacy_client = TestClient(legacy)
+    admin = add_dipendente(db, models.RuoloEnum.admin)
+    add_trasferta(db, admin, date(2024, 5, 1), date(2024, 5, 5))
+    rifiutata = add_trasferta(db, admin, date(2024, 5, 5), date(2024, 5, 6), S.rifiutata)
+
+    r = legacy_client.post("/users/trasferte/", json=nuova(admin, date(2024, 5, 5), date(2024, 5, 7)), headers=headers(admin))
+    assert r.status_code == 409
+    r = legacy_client.patch(f"/users/trasferte/{rifiutata.id}/approva", headers=headers(admin))
+    assert r.status_code == 409
+
+
+def test_creazioni_concorrenti_serializzate(client, db, monkeypatch):
+    user = add_dipendente(db)
+    originale = periodi.sovrapposta
+
+    def sovrapposta_lenta(*args, **kwargs):
+        # allarga la finestra tra controllo e INSERT: senza lock passerebbero entrambe
+        conflitto = originale(*args, **kwargs)
+        time.sleep(0.2)
+        return conflitto
+
+    monkeypatch.setattr(periodi, "sovrapposta", sovrapposta_lenta)
+    via = threading.Barrier(2)
+    status = []
+
+    def crea():
+        via.wait()
+        r = client.post("/trasferte/", json=nuova(user, date(2024, 5, 1), date(2024, 5, 5)), headers=headers(user))
+        status.append(r.status_code)
+
+    threads = [threading.Thread(target=crea) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(status) == [200, 409]
+    assert db.query(models.Trasferta).filter(models.Trasferta.id_dipendente == user.id).count() == 1
+
+
+def test_trova_sovrapposizioni(client, db):
+    manager = add_dipendente(db, models.RuoloEnum.manager)
+    a, b = add_dipendente(db), add_dipendente(db)
+    # dati storici: inseriti senza passare dal controllo
+    a1 = add_trasferta(db, a, date(2024, 1, 1), date(2024, 1, 10))
+    a2 = add_trasferta(db, a, date(2024, 1, 5), date(2024, 1, 7))
+    a3 = add_trasferta(db, a, date(2024, 1, 10), date(2024, 1, 12))
+    add_trasferta(db, a, date(2024, 1, 2), date(2024, 1, 3), S.rifiutata)
+    add_trasferta(db, a, date(2024, 2, 1), date(2024, 2, 2))
+    b1 = add_trasferta(db, b, date(2024, 3, 1), date(2024, 3, 5))
+    b2 = add_trasferta(db, b, date(2024, 3, 5), date(2024, 3, 6))
+
+    with session.engine.connect() as conn:
+        trovate = set(periodi.trova_sovrapposizioni(conn))
+        solo_b = list(periodi.trova_sovrapposizioni(conn, b.id))
+
+    assert trovate == {
+        periodi.Sovrapposizione(a.id, a1.id, a2.id, date(2024, 1, 5), date(2024, 1, 7)),
+        periodi.Sovrapposizione(a.id, a1.id, a3.id, date(2024, 1, 10), date(2024, 1, 10)),
+        periodi.Sovrapposizione(b.id, b1.id, b2.id, date(2024, 3, 5), date(2024, 3, 5)),
+    }
+    assert solo_b == [periodi.Sovrapposizione(b.id, b1.id, b2.id, date(2024, 3, 5), date(2024, 3, 5))]
+
+    r = client.get("/trasferte/sovrapposizioni", params={"id_dipendente": a.id}, headers=headers(manager))
+    assert r.status_code == 200
+    assert len(r.json()) == 2
@@ -0,0 +1,79 @@
+# tests/test_query_counts.py
+"""
+Regressione N+1: le liste e il rimborso devono fare lo stesso numero di
+query con poche o tante trasferte/spese/allegati.
+"""
+from datetime import date, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.database import models
+from app.routers import users
+from tests.conftest import add_dipendente, count_queries, headers
+
+DIGEST = "0" * 64
+
+
+def add_dati(db, dipendente, n: int, start: int) -> models.Trasferta:
+    """n trasferte, ognuna con n spese (2 allegati l'una) e una prenotazione."""
+    trasferta = None
+    for i in range(start, start + n):
+        partenza = date(2024, 1, 1) + timedelta(days=3 * i)
+        trasferta = models.Trasferta(id_dipendente=dipendente.id, data_partenza=partenza,
+                                     data_rientro=partenza + timedelta(days=1), luogo_destinazione="Milano")
+        trasferta.spese = [
+            models.Spesa(categoria="vitto", importo=10.0 + j, valuta="EUR" if j % 2 else "USD",
+                         tipo_scontrino="scontrino", data_spesa=partenza,
+                         files=[models.SpesaFile(filename=f"s{j}-{k}.pdf", mimetype="application/pdf",
+                                                 sha256=DIGEST, size=10) for k in range(2)])
+            for j in range(n)
+        ]
+        trasferta.prenotazioni = [models.Prenotazione(tipo_mezzo=models.TipoMezzoEnum.treno, costo=50.0)]
+        db.add(trasferta)
+    db.commit()
+    return trasferta
+
+
+@pytest.fixture
+def users_client(client):
+    # routers/users.py non è montato in app/main.py: app minima solo per calcola_rimborso
+    legacy = FastAPI()
+    legacy.include_router(users.router)
+    return TestClient(legacy)
+
+
+def misura(client, users_client, admin, trasferta) -> dict:
+    h = headers(admin)
+    chiamate = {
+        "/spese/": lambda: client.get("/spese/", params={"limit": 500}, headers=h),
+        "/spese/mine": lambda: client.get("/spese/mine", params={"limit": 500}, headers=h),
+        "/trasferte/": lambda: client.get("/trasferte/", params={"limit": 500}, headers=h),
+        "/prenotazioni/": lambda: client.get("/prenotazioni/", params={"limit": 500}, headers=h),
+        "/trasferte/{id}/rimborso": lambda: client.get(f"/trasferte/{trasferta.id}/rimborso", headers=h),
+        "calcola_rimborso": lambda: users_client.get(f"/users/trasferte/{trasferta.id}/rimborsi", headers=h),
+    }
+    conteggi = {}
+    for nome, chiama in chiamate.items():
+        chiama()  # riscalda le cache (tassi di cambio, versioni token)
+        with count_queries() as statements:
+            r = chiama()
+        assert r.status_code == 200, (nome, r.text)
+        conteggi[nome] = len(statements)
+    return conteggi
+
+
+def test_query_costanti_al_crescere_dei_dati(client, users_client, db):
+    admin = add_dipendente(db, models.RuoloEnum.admin)
+
+    trasferta = add_dati(db, admin, 2, start=0)
+    pochi = misura(client, users_client, admin, trasferta)
+    assert len(client.get("/spese/", params={"limit": 500}, headers=headers(admin)).json()) == 4
+
+    trasferta = add_dati(db, admin, 12, start=2)
+    tanti = misura(client, users_client, admin, trasferta)
+    assert len(client.get("/spese/", params={"limit": 500}, headers=headers(admin)).json()) == 4 + 144
+
+    assert tanti == pochi
+    assert all(pochi.values())
@@ -0,0 +1,46 @@
+# tests/test_rollup.py
+"""Rollup incrementale: stesse righe del ricalcolo completo, anche quando le spese spariscono."""
+from datetime import date
+
+from app.database import models, rollup, session
+from tests.conftest import add_dipendente, add_trasferta
+
+R, B = models.SpesaRollup.__table__, models.SpesaRollupBucket.__table__
+
+
+def righe(conn):
+    return (sorted(tuple(round(x, 6) if isinstance(x, float) else x for x in r) for r in conn.execute(R.select())),
+            sorted(map(tuple, conn.execute(B.select()))))
+
+
+def spesa(trasferta, importo, categoria="vitto", giorno=date(2024, 1, 2)):
+    return models.Spesa(id_trasferta=trasferta.id, categoria=categoria, importo=importo, valuta="EUR",
+                        tipo_scontrino="altro", data_spesa=giorno)
+
+
+def test_incrementale_come_rebuild(client, db):
+    user = add_dipendente(db)
+    trasferta = add_trasferta(db, user, date(2024, 1, 1), date(2024, 1, 31))
+    a, b, c = spesa(trasferta, 10.0), spesa(trasferta, 250.0), spesa(trasferta, 40.0, "alloggio")
+    db.add_all([a, b, c])
+    db.commit()
+
+    b.importo = 12.0                  # cambia bucket, stessa chiave
+    c.data_spesa = date(2024, 2, 3)   # cambia mese: la riga di gennaio/alloggio sparisce
+    db.commit()
+    db.delete(a)
+    db.commit()
+
+    with session.engine.begin() as conn:
+        incrementale = righe(conn)
+        rollup.rebuild(conn)
+        assert righe(conn) == incrementale
+    totali, buckets = incrementale
+    assert [(r[0], r[2], r[6]) for r in totali] == [(date(2024, 1, 1), "vitto", 1), (date(2024, 2, 1), "alloggio", 1)]
+    assert all(r[-1] > 0 for r in buckets)
+
+    db.delete(b)
+    db.delete(c)
+    db.commit()
+    with session.engine.connect() as conn:
+        assert righe(conn) == ([], [])
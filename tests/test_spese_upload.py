@@ -0,0 +1,34 @@
+# tests/test_spese_upload.py
+"""POST /spese/: spesa e allegati in una transazione, allegati con un solo INSERT."""
+from datetime import date
+
+import pytest
+
+from app.database import models, session
+from tests.conftest import add_dipendente, add_trasferta, count_queries, headers
+
+
+@pytest.fixture(params=[True, False], ids=["returning", "senza_returning"])
+def insert_returning(request, monkeypatch):
+    # senza RETURNING in executemany è il percorso di MySQL
+    monkeypatch.setattr(session.engine.dialect, "insert_executemany_returning", request.param)
+    return request.param
+
+
+def test_allegati_in_blocco(client, db, insert_returning):
+    user = add_dipendente(db)
+    trasferta = add_trasferta(db, user, date(2024, 1, 1), date(2024, 1, 3))
+    form = {"id_trasferta": str(trasferta.id), "categoria": "vitto", "importo": "12.5", "data_spesa": "2024-01-02"}
+    files = [("files", (f"s{i}.pdf", f"contenuto {i}".encode(), "application/pdf")) for i in range(3)]
+
+    with count_queries() as statements:
+        r = client.post("/spese/", data=form, files=files, headers=headers(user))
+
+    assert r.status_code == 201, r.text
+    allegati = r.json()["files"]
+    assert [f["filename"] for f in allegati] == ["s0.pdf", "s1.pdf", "s2.pdf"]
+    assert all(f["id"] for f in allegati)
+    assert sum(s.startswith("INSERT INTO spesa_files") for s in statements) == 1
+
+    righe = db.query(models.SpesaFile).order_by(models.SpesaFile.id).all()
+    assert [(f.id, f.id_spesa, f.size) for f in righe] == [(f["id"], r.json()["id"], 11) for f in allegati]
@@ -0,0 +1,65 @@
+# tests/test_transizioni.py
+"""PATCH /trasferte/stato: esito per id e un solo UPDATE, con e senza RETURNING."""
+from datetime import date
+
+import pytest
+
+from app.database import models, session
+from tests.conftest import add_dipendente, add_trasferta, headers
+
+S = models.StatoTrasfertaEnum
+
+
+@pytest.fixture(params=[True, False], ids=["returning", "senza_returning"])
+def update_returning(request, monkeypatch):
+    # senza RETURNING è il percorso di MySQL/MariaDB
+    monkeypatch.setattr(session.engine.dialect, "update_returning", request.param)
+    return request.param
+
+
+def test_esiti_per_id(client, db, update_returning):
+    manager = add_dipendente(db, models.RuoloEnum.manager)
+    inviata = add_trasferta(db, manager, date(2024, 1, 1), date(2024, 1, 2))
+    approvata = add_trasferta(db, manager, date(2024, 2, 1), date(2024, 2, 2), S.approvata)
+    completata = add_trasferta(db, manager, date(2024, 3, 1), date(2024, 3, 2), S.completata)
+    ids = [inviata.id, approvata.id, 999_999, completata.id, inviata.id]
+
+    r = client.patch("/trasferte/stato", headers=headers(manager),
+                     json={"ids": ids, "stato": "approvata", "note_segreteria": "ok"})
+
+    assert r.status_code == 200
+    assert r.json() == {
+        "aggiornate": 1,
+        "risultati": [  # duplicati rimossi, ordine della richiesta
+            {"id": inviata.id, "esito": "aggiornata", "stato": "approvata"},
+            {"id": approvata.id, "esito": "invariata", "stato": "approvata"},
+            {"id": 999_999, "esito": "non_trovata", "stato": None},
+            {"id": completata.id, "esito": "non_consentita", "stato": "completata"},
+        ],
+    }
+    db.expire_all()
+    assert db.get(models.Trasferta, inviata.id).note_segreteria == "ok"
+    assert db.get(models.Trasferta, approvata.id).note_segreteria is None
+    assert db.get(models.Trasferta, completata.id).stato == S.completata
+
+
+def test_nessuna_transizione_verso_lo_stato(client, db, update_returning):
+    manager = add_dipendente(db, models.RuoloEnum.manager)
+    t = add_trasferta(db, manager, date(2024, 1, 1), date(2024, 1, 2))
+
+    r = client.patch("/trasferte/stato", headers=headers(manager), json={"ids": [t.id], "stato": "inviata"})
+
+    assert r.json() == {"aggiornate": 0, "risultati": [{"id": t.id, "esito": "invariata", "stato": "inviata"}]}
+
+
+@pytest.mark.parametrize("ids", [[], list(range(1001))])
+def test_ids_non_validi(client, db, ids):
+    manager = add_dipendente(db, models.RuoloEnum.manager)
+    r = client.patch("/trasferte/stato", headers=headers(manager), json={"ids": ids, "stato": "approvata"})
+    assert r.status_code == 422
+
+
+def test_solo_manager_e_admin(client, db):
+    dipendente = add_dipendente(db)
+    r = client.patch("/trasferte/stato", headers=headers(dipendente), json={"ids": [1], "stato": "approvata"})
+    assert r.status_code == 403